@@ -0,0 +1,86 @@
+"""
+Фейковый отправитель событий webhook hh.ru для локальной проверки приемника воркера.
+
+Воркер запускается с включенным приемом событий:
+    HH_WEBHOOK_TOKEN=test python run_hh_worker.py
+Затем:
+    python bench_hh_webhook.py --token test --user-id 12345 --negotiation-id 4567890123
+    python bench_hh_webhook.py --token test --user-id 12345 --count 500 --duplicates 3 --concurrency 20
+
+--user-id — ID менеджера hh.ru (tracked_recruiters.recruiter_id). С настоящими ID откликов воркер
+заберет их из hh.ru сразу; со сгенерированными ID проверяются прием, отсев повторов и пропускная способность.
+Задержку от события до обработки показывает метрика hh_webhook_event_lag_seconds на /metrics воркера.
+"""
+import os
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+DEFAULT_URL = f"http://127.0.0.1:{os.getenv('HH_WEBHOOK_PORT', '9109')}{os.getenv('HH_WEBHOOK_PATH', '/hh/webhook')}"
+
+
+def fake_event(user_id: str, negotiation_id: str, action: str) -> dict:
+    return {
+        'id': str(uuid.uuid4()),
+        'subscription_id': 'local-bench',
+        'action_type': action,
+        'user_id': user_id,
+        'payload': {'topic_id': negotiation_id},
+    }
+
+
+async def run(url: str, token: str, events: list, concurrency: int):
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for event in events:
+        queue.put_nowait(event)
+
+    async def sender(client: httpx.AsyncClient):
+        while not queue.empty():
+            event = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, params={'token': token}, json=event)
+                status = f"{response.status_code} {response.text}"
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=30) as client:
+        await asyncio.gather(*(sender(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"Событий: {len(events)}, параллельно: {concurrency}, за {elapsed:.2f} с -> {len(events) / elapsed:.1f} событий/с")
+    for status, count in sorted(statuses.items()):
+        print(f"  {status}: {count}")
+    print(
+        f"Задержка ответа, мс: p50 {statistics.median(latencies):.1f}, "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f}, max {latencies[-1]:.1f}"
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Фейковые события webhook hh.ru для приемника воркера.")
+    parser.add_argument('--url', default=DEFAULT_URL, help="Адрес приемника")
+    parser.add_argument('--token', default=os.getenv('HH_WEBHOOK_TOKEN', ''), help="Значение HH_WEBHOOK_TOKEN воркера")
+    parser.add_argument('--user-id', required=True, help="ID менеджера hh.ru (tracked_recruiters.recruiter_id)")
+    parser.add_argument('--negotiation-id', action='append', help="ID отклика (можно несколько раз)")
+    parser.add_argument('--count', type=int, default=1, help="Сколько откликов сгенерировать, если --negotiation-id не задан")
+    parser.add_argument('--action', default='NEW_NEGOTIATION_VACANCY', help="Тип события")
+    parser.add_argument('--duplicates', type=int, default=1, help="Сколько раз доставить каждое событие (проверка отсева повторов)")
+    parser.add_argument('--concurrency', type=int, default=10, help="Сколько запросов держать одновременно")
+    args = parser.parse_args()
+
+    negotiation_ids = args.negotiation_id or [str(9_000_000_000 + i) for i in range(args.count)]
+    events = [fake_event(args.user_id, negotiation_id, args.action) for negotiation_id in negotiation_ids]
+    events = [event for event in events for _ in range(args.duplicates)]
+    random.shuffle(events)
+    asyncio.run(run(args.url, args.token, events, args.concurrency))
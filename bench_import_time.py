@@ -0,0 +1,81 @@
+"""
+Время импорта точек входа (python -X importtime): сколько стоит запуск процесса до main().
+
+Каждый модуль импортируется в отдельном свежем интерпретаторе несколько раз,
+в отчет попадает медиана и самые тяжелые модули по собственному времени импорта.
+
+Пример:
+    python bench_import_time.py
+    python bench_import_time.py --module run_hh_worker --runs 5 --top 15
+    python bench_import_time.py --max-ms 800   # ненулевой код выхода, если медиана выше порога
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+DEFAULT_MODULES = ('run_hh_worker', 'run_telegram_bot')
+
+
+def measure(module: str) -> tuple:
+    """
+    Один замер: (общее время импорта в мс, {модуль: (собственное мс, накопленное мс)}).
+    Строки -X importtime: 'import time: self [us] | cumulative | imported package'.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        last_line = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ''
+        raise RuntimeError(f"импорт {module} завершился ошибкой: {last_line}")
+
+    modules, total_us = {}, 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        package = name.strip()
+        modules[package] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+        # Модули верхнего уровня выводятся без отступа, их накопленное время складывается в общее
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative_us)
+    return total_us / 1000, modules
+
+
+def report(module: str, runs: int, top: int) -> float:
+    totals, last_modules = [], {}
+    for _ in range(runs):
+        total_ms, last_modules = measure(module)
+        totals.append(total_ms)
+    median = statistics.median(totals)
+    print(f"=== {module}: медиана {median:.1f} мс (min {min(totals):.1f}, max {max(totals):.1f}, замеров {runs})")
+    heaviest = sorted(last_modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    print(f"{'собств., мс':>12} {'накопл., мс':>12}  модуль")
+    for name, (self_ms, cumulative_ms) in heaviest:
+        print(f"{self_ms:12.1f} {cumulative_ms:12.1f}  {name}")
+    print()
+    return median
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Время импорта точек входа бота и воркера.")
+    parser.add_argument('--module', action='append', help="Модуль для замера (можно несколько раз)")
+    parser.add_argument('--runs', type=int, default=3, help="Число замеров на модуль")
+    parser.add_argument('--top', type=int, default=20, help="Сколько самых тяжелых модулей показать")
+    parser.add_argument('--max-ms', type=float, help="Порог медианы в мс; при превышении код выхода 1")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module or DEFAULT_MODULES:
+        try:
+            median = report(module, args.runs, args.top)
+        except RuntimeError as e:
+            print(f"=== {module}: {e}\n")
+            failed = True
+            continue
+        if args.max_ms is not None and median > args.max_ms:
+            print(f"!!! {module}: {median:.1f} мс больше порога {args.max_ms:.0f} мс\n")
+            failed = True
+    sys.exit(1 if failed else 0)
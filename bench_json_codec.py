@@ -0,0 +1,114 @@
+"""
+Микробенчмарк JSON-кодеков на типичных данных бота: страница откликов hh.ru с вложенными резюме,
+история диалога (JSONB history) и pending_messages.
+
+Пример:
+    python bench_json_codec.py
+    python bench_json_codec.py --number 2000
+"""
+import json
+import timeit
+import argparse
+
+from hr_bot.utils import json_codec
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def negotiations_page(items: int = 50) -> dict:
+    """Страница GET /negotiations/{folder} в форме ответа hh.ru (резюме вложено в каждый отклик)."""
+    def resume(i):
+        return {
+            'id': f'a1b2c3d4e5f6{i:08d}', 'title': 'Курьер, водитель-экспедитор', 'first_name': 'Иван',
+            'last_name': 'Петров', 'middle_name': 'Сергеевич', 'age': 20 + i % 30,
+            'area': {'id': '1', 'name': 'Москва', 'url': 'https://api.hh.ru/areas/1'},
+            'salary': {'amount': 80000, 'currency': 'RUR'},
+            'photo': {'small': f'https://img.hhcdn.ru/photo/{i}.jpeg', 'medium': f'https://img.hhcdn.ru/photo/{i}m.jpeg'},
+            'total_experience': {'months': 40 + i},
+            'certificate': [], 'owner': {'id': str(1000 + i), 'comments': {'counters': {'total': 0}}},
+            'can_view_full_info': True, 'url': f'https://api.hh.ru/resumes/a1b2c3d4e5f6{i:08d}',
+            'alternate_url': f'https://hh.ru/resume/a1b2c3d4e5f6{i:08d}',
+            'experience': [
+                {'start': '2019-01-01', 'end': None, 'company': 'ООО Ромашка', 'position': 'Курьер',
+                 'area': {'id': '1', 'name': 'Москва'}, 'industries': [{'id': '7.540', 'name': 'Доставка'}]}
+                for _ in range(3)
+            ],
+        }
+
+    return {
+        'found': items * 4, 'pages': 4, 'per_page': items, 'page': 0,
+        'items': [
+            {
+                'id': str(4_000_000_000 + i), 'state': {'id': 'response', 'name': 'Отклик'},
+                'created_at': '2026-10-19T10:15:00+0300', 'updated_at': '2026-10-19T10:16:00+0300',
+                'has_updates': i % 3 == 0, 'messages_url': f'https://api.hh.ru/negotiations/{4_000_000_000 + i}/messages',
+                'counters': {'messages': 2, 'unread_messages': 1}, 'source': 'NEGOTIATION',
+                'vacancy': {'id': '98765432', 'name': 'Курьер', 'area': {'id': '1', 'name': 'Москва'}},
+                'resume': resume(i),
+            }
+            for i in range(items)
+        ],
+    }
+
+
+def dialogue_history(turns: int = 30) -> list:
+    history = []
+    for i in range(turns):
+        history.append({'role': 'user', 'message_id': str(9_000_000 + i),
+                        'content': 'Здравствуйте! Да, мне интересна вакансия, готов выйти на работу с понедельника.'})
+        history.append({'role': 'assistant', 'content': 'Отлично! Подскажите, пожалуйста, ваш возраст и гражданство.',
+                        'extracted_data': {'age': None, 'citizenship': 'РФ', 'city': 'Москва'}})
+    return history
+
+
+def pending_messages(count: int = 5) -> list:
+    return [
+        {'message_id': str(9_100_000 + i), 'role': 'user', 'content': 'Добрый день, есть вопрос по графику работы',
+         'created_at': '2026-10-19T10:15:00+03:00', 'received_at': '2026-10-19T07:15:03.123456+00:00'}
+        for i in range(count)
+    ]
+
+
+def codecs() -> dict:
+    result = {
+        'json (stdlib)': (
+            lambda obj: json.dumps(obj, ensure_ascii=False).encode('utf-8'),
+            json.loads,
+        ),
+    }
+    if orjson is not None:
+        result['orjson'] = (orjson.dumps, orjson.loads)
+    return result
+
+
+def run(number: int):
+    payloads = {
+        'страница откликов (50 шт.)': negotiations_page(),
+        'история диалога (60 реплик)': dialogue_history(),
+        'pending_messages (5 шт.)': pending_messages(),
+    }
+    print(f"Кодек приложения: {json_codec.BACKEND}" + ("" if orjson else " (orjson не установлен)"))
+    for name, payload in payloads.items():
+        encoded = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        print(f"\n=== {name}: {len(encoded) / 1024:.1f} КБ")
+        baseline = None
+        for codec_name, (dumps, loads) in codecs().items():
+            dumps_us = timeit.timeit(lambda: dumps(payload), number=number) / number * 1e6
+            loads_us = timeit.timeit(lambda: loads(encoded), number=number) / number * 1e6
+            line = f"  {codec_name:<14} dumps {dumps_us:9.1f} мкс   loads {loads_us:9.1f} мкс"
+            if baseline is None:
+                baseline = (dumps_us, loads_us)
+            else:
+                line += f"   ускорение x{baseline[0] / dumps_us:.1f} / x{baseline[1] / loads_us:.1f}"
+            print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сравнение JSON-кодеков на данных бота.")
+    parser.add_argument('--number', type=int, default=500, help="Повторов на каждый замер")
+    args = parser.parse_args()
+
+    run(args.number)
@@ -0,0 +1,87 @@
+"""
+Нагрузочная проверка webhook-режима Telegram-бота: шлет фейковые обновления на локальный сервер
+и считает задержку ответа и пропускную способность.
+
+Бот запускается локально без регистрации webhook в Telegram:
+    TG_BOT_MODE=webhook TG_WEBHOOK_SECRET=test python run_telegram_bot.py
+Затем:
+    python bench_tg_webhook.py --secret test --count 500 --concurrency 20
+    python bench_tg_webhook.py --secret test --text "📊 Статистика" --user-id 123456
+
+При TG_WEBHOOK_BACKGROUND=1 (по умолчанию) ответ приходит сразу после приема обновления,
+и замер показывает стоимость приема; с TG_WEBHOOK_BACKGROUND=0 — полное время обработчика.
+Ответы бота уходят в настоящий Bot API, поэтому для --user-id лучше брать тестовый аккаунт.
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+DEFAULT_URL = f"http://127.0.0.1:{os.getenv('TG_WEBHOOK_PORT', '8081')}{os.getenv('TG_WEBHOOK_PATH', '/tg/webhook')}"
+
+
+def fake_update(update_id: int, user_id: int, text: str) -> dict:
+    """Минимальное обновление с текстовым сообщением в личном чате."""
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'Bench'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': 'Bench'},
+            'from': user,
+            'text': text,
+        },
+    }
+
+
+async def run(url: str, secret: str, count: int, concurrency: int, user_id: int, text: str):
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for update_id in range(1, count + 1):
+        queue.put_nowait(update_id)
+
+    async def sender(client: httpx.AsyncClient):
+        while not queue.empty():
+            update_id = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    url, json=fake_update(update_id, user_id, text),
+                    headers={'X-Telegram-Bot-Api-Secret-Token': secret},
+                )
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=30) as client:
+        await asyncio.gather(*(sender(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"Обновлений: {count}, параллельно: {concurrency}, за {elapsed:.2f} с -> {count / elapsed:.1f} обновл./с")
+    print(f"Ответы: {statuses}")
+    print(
+        f"Задержка, мс: p50 {statistics.median(latencies):.1f}, "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f}, "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f}, max {latencies[-1]:.1f}"
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Фейковые обновления на webhook Telegram-бота.")
+    parser.add_argument('--url', default=DEFAULT_URL, help="Адрес webhook")
+    parser.add_argument('--secret', default=os.getenv('TG_WEBHOOK_SECRET', ''), help="Значение TG_WEBHOOK_SECRET бота")
+    parser.add_argument('--count', type=int, default=200, help="Сколько обновлений отправить")
+    parser.add_argument('--concurrency', type=int, default=10, help="Сколько запросов держать одновременно")
+    parser.add_argument('--user-id', type=int, default=1, help="Telegram ID отправителя")
+    parser.add_argument('--text', default='/start', help="Текст сообщения")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.secret, args.count, args.concurrency, args.user_id, args.text))
@@ -0,0 +1,127 @@
+# hr_bot/db/dialogue_archive.py
+
+import os
+import zlib
+import asyncio
+import logging
+import datetime
+from sqlalchemy import select, insert, delete, exists, union_all
+from sqlalchemy.orm import Session
+
+from .models import SessionLocal, Dialogue, DialogueArchive, NotificationQueue
+from hr_bot.utils import metrics
+from hr_bot.utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Завершенные диалоги старше стольких дней (по last_updated) переносятся в dialogues_archive
+ARCHIVE_AFTER_DAYS = int(os.getenv('DIALOGUE_ARCHIVE_AFTER_DAYS', '30'))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv('DIALOGUE_ARCHIVE_INTERVAL_SECONDS', '3600'))
+# Строк за одну транзакцию: короткие транзакции не мешают воркеру и не раздувают WAL одним куском
+ARCHIVE_BATCH_SIZE = 500
+FINISHED_STATUSES = ('qualified', 'rejected', 'timed_out')
+
+# Общие колонки dialogues и dialogues_archive для статистики и выгрузки
+COMMON_COLUMNS = (
+    'id', 'hh_response_id', 'recruiter_id', 'candidate_id', 'vacancy_id',
+    'status', 'dialogue_state', 'created_at', 'last_updated',
+)
+
+DIALOGUES_ARCHIVED = metrics.Counter('dialogues_archived_total', 'Диалоги, перенесенные в архив')
+ARCHIVED_DIALOGUE_UPDATES = metrics.Counter(
+    'archived_dialogue_updates_total', 'Обновления откликов, диалог которых уже в архиве (бот на них не отвечает)')
+
+
+def compress_history(history) -> bytes:
+    return zlib.compress(json_codec.dumps_bytes(history or []))
+
+
+def load_history(archived: DialogueArchive) -> list:
+    """История архивного диалога в том же виде, что Dialogue.history."""
+    if not archived.history_z:
+        return []
+    return json_codec.loads(zlib.decompress(archived.history_z))
+
+
+def is_archived(db: Session, hh_response_id: str) -> bool:
+    return db.query(DialogueArchive.id).filter_by(hh_response_id=hh_response_id).first() is not None
+
+
+def dialogues_with_archive():
+    """Живые и архивные диалоги одним подзапросом (колонки COMMON_COLUMNS) — для отчетов за любой период."""
+    live = select(*(getattr(Dialogue, column) for column in COMMON_COLUMNS))
+    archived = select(*(getattr(DialogueArchive, column) for column in COMMON_COLUMNS))
+    return union_all(live, archived).subquery('all_dialogues')
+
+
+def archive_finished_dialogues(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                               batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Переносит завершенные диалоги старше older_than_days в dialogues_archive пачками по batch_size.
+    Строки берутся FOR UPDATE SKIP LOCKED: диалог, который сейчас сохраняет воркер, просто подождет следующего прохода.
+    Диалоги кандидатов с неотправленным уведомлением остаются: бот читает их при рассылке.
+    Возвращает число перенесенных диалогов.
+    """
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=older_than_days)
+    columns = [getattr(Dialogue, column) for column in COMMON_COLUMNS] + [Dialogue.reminder_level, Dialogue.history]
+    pending_notification = exists().where(
+        NotificationQueue.candidate_id == Dialogue.candidate_id, NotificationQueue.status == 'pending'
+    )
+    statement = select(*columns).where(
+        Dialogue.status.in_(FINISHED_STATUSES),
+        Dialogue.last_updated < cutoff,
+        ~pending_notification,
+    ).order_by(Dialogue.id).limit(batch_size).with_for_update(of=Dialogue, skip_locked=True)
+
+    total = 0
+    while True:
+        rows = db.execute(statement).mappings().all()
+        if not rows:
+            break
+        db.execute(insert(DialogueArchive), [
+            {
+                **{column: row[column] for column in COMMON_COLUMNS},
+                'reminder_level': row['reminder_level'],
+                'history_z': compress_history(row['history']),
+                'history_messages': len(row['history'] or []),
+            }
+            for row in rows
+        ])
+        db.execute(delete(Dialogue).where(Dialogue.id.in_([row['id'] for row in rows])))
+        db.commit()
+        total += len(rows)
+        DIALOGUES_ARCHIVED.inc(len(rows))
+        if len(rows) < batch_size:
+            break
+    return total
+
+
+def _archive_pass() -> int:
+    db = SessionLocal()
+    try:
+        return archive_finished_dialogues(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def archive_loop():
+    """Фоновая задача воркера: раз в ARCHIVE_INTERVAL_SECONDS переносит завершенные диалоги в архив."""
+    while True:
+        try:
+            archived = await asyncio.to_thread(_archive_pass)
+            if archived:
+                logger.info(f"В архив перенесено {archived} завершенных диалогов старше {ARCHIVE_AFTER_DAYS} дн.")
+        except Exception as e:
+            logger.error(f"Ошибка архивации диалогов: {e}", exc_info=True)
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+
+if __name__ == '__main__':
+    # python -m hr_bot.db.dialogue_archive — один проход архивации
+    from .models import init_engine
+
+    init_engine()
+    print(f"Перенесено в архив: {_archive_pass()}")
@@ -0,0 +1,212 @@
+# hr_bot/db/query_stats.py
+
+import re
+import time
+import asyncio
+import logging
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from hr_bot.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз один и тот же запрос (с точностью до параметров) должен выполниться в одной области,
+# чтобы считаться подозрением на N+1
+N_PLUS_ONE_THRESHOLD = 5
+# Сколько символов SQL выводить в предупреждении
+STATEMENT_LOG_CHARS = 300
+
+DB_QUERIES = metrics.Counter(
+    'db_queries_total', 'SQL-запросы по области (этап воркера, ход диалога, обработчик бота)', ('kind', 'scope'))
+DB_QUERY_SECONDS = metrics.Counter(
+    'db_query_seconds_total', 'Суммарное время SQL-запросов по области', ('kind', 'scope'))
+DB_SCOPE_QUERIES = metrics.Histogram(
+    'db_queries_per_scope', 'Число SQL-запросов за один проход области', ('kind', 'scope'),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+DB_N_PLUS_ONE = metrics.Counter(
+    'db_n_plus_one_suspects_total', 'Проходы области, в которых найден повторяющийся запрос (подозрение на N+1)', ('kind', 'scope'))
+
+DB_POOL_HOLD_SECONDS = metrics.Histogram(
+    'db_pool_connection_hold_seconds', 'Сколько соединение из пула было занято между checkout и checkin')
+
+_current_scope = contextvars.ContextVar('query_scope', default=None)
+
+# Соединения, выданные из пула сейчас: id(connection_record) -> (time.monotonic() выдачи, кто взял)
+_pool_checked_out = {}
+_pool_totals = {'checkouts': 0, 'hold_seconds': 0.0, 'max_hold_seconds': 0.0}
+
+_PARAM = re.compile(r'%\(\w+\)s|\?|(?<![:\w]):\w+|\$\d+')
+_PARAM_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_SPACES = re.compile(r'\s+')
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: параметры и списки IN (...) заменены на '?', пробелы схлопнуты."""
+    shape = _PARAM.sub('?', statement)
+    shape = _PARAM_LIST.sub('?', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+class QueryScope:
+    """
+    Счетчики SQL-запросов одной области. Вложенные области учитываются и в родительских.
+    Имя области можно уточнить, пока она открыта (обработчик бота становится известен после фильтров):
+    метрики с меткой scope пишутся при закрытии области, уже под итоговым именем.
+    """
+    __slots__ = ('kind', 'name', 'parent', 'count', 'seconds', 'shapes', 'own_count', 'own_seconds')
+
+    def __init__(self, kind: str, name: str, parent: 'QueryScope | None'):
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        # Запросы, выполненные в самой области, без вложенных — для db_queries_total без двойного счета
+        self.own_count = 0
+        self.own_seconds = 0.0
+
+    def record(self, statement: str, elapsed: float):
+        shape = statement_shape(statement)
+        self.own_count += 1
+        self.own_seconds += elapsed
+        scope = self
+        while scope is not None:
+            scope.count += 1
+            scope.seconds += elapsed
+            scope.shapes[shape] += 1
+            scope = scope.parent
+
+    def n_plus_one_suspects(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> list:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+@contextmanager
+def query_scope(kind: str, name: str):
+    """
+    Область учета запросов: этап воркера ('stage'), ход диалога ('dialogue_turn'), обработчик бота ('tg_handler').
+    Области наследуются задачами asyncio и asyncio.to_thread через contextvars.
+    """
+    scope = QueryScope(kind, name, _current_scope.get())
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        name = scope.name
+        if scope.own_count:
+            DB_QUERIES.inc(scope.own_count, kind=kind, scope=name)
+            DB_QUERY_SECONDS.inc(scope.own_seconds, kind=kind, scope=name)
+        DB_SCOPE_QUERIES.observe(scope.count, kind=kind, scope=name)
+        suspects = scope.n_plus_one_suspects()
+        if suspects:
+            DB_N_PLUS_ONE.inc(kind=kind, scope=name)
+            shape, count = suspects[0]
+            logger.warning(
+                f"Возможный N+1 в {kind} '{name}': запрос выполнен {count} раз "
+                f"(всего запросов {scope.count}): {shape[:STATEMENT_LOG_CHARS]}"
+            )
+
+
+def current_scope() -> QueryScope | None:
+    """Открытая сейчас область учета (в текущем контексте asyncio), если есть."""
+    return _current_scope.get()
+
+
+@contextmanager
+def assert_max_queries(limit: int):
+    """
+    Проверка для тестов и ручных проверок: код внутри блока должен выполнить не больше limit запросов.
+        with assert_max_queries(3):
+            _load_dialogue_snapshot(dialogue_id, recruiter_id)
+    """
+    with query_scope('assert', 'assert_max_queries') as scope:
+        yield scope
+    if scope.count > limit:
+        details = '\n'.join(f"  {count} x {shape[:STATEMENT_LOG_CHARS]}" for shape, count in scope.shapes.most_common())
+        raise AssertionError(f"Ожидалось не больше {limit} SQL-запросов, выполнено {scope.count}:\n{details}")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started_at')
+    elapsed = time.perf_counter() - started.pop() if started else 0.0
+    scope = _current_scope.get()
+    if scope is not None:
+        # В метрики область запишет запросы при закрытии, под итоговым именем
+        scope.record(statement, elapsed)
+    else:
+        DB_QUERIES.inc(kind='none', scope='')
+        DB_QUERY_SECONDS.inc(elapsed, kind='none', scope='')
+
+
+def _handle_error(exception_context):
+    # Запрос упал: after_cursor_execute не будет вызван, убираем его время начала
+    conn = exception_context.connection
+    started = conn.info.get('query_started_at') if conn is not None else None
+    if started:
+        started.pop()
+
+
+def _current_holder() -> str:
+    """Кто берет соединение: имя задачи asyncio и области учета запросов."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    scope = _current_scope.get()
+    holder = task.get_name() if task else 'thread'
+    return f"{holder} [{scope.kind}:{scope.name}]" if scope else holder
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    _pool_checked_out[id(connection_record)] = (time.monotonic(), _current_holder())
+    _pool_totals['checkouts'] += 1
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    checked_out = _pool_checked_out.pop(id(connection_record), None)
+    if checked_out:
+        held = time.monotonic() - checked_out[0]
+        _pool_totals['hold_seconds'] += held
+        _pool_totals['max_hold_seconds'] = max(_pool_totals['max_hold_seconds'], held)
+        DB_POOL_HOLD_SECONDS.observe(held)
+
+
+def pool_snapshot(engine: Engine) -> dict:
+    """Состояние пула соединений и самые долгие текущие владельцы соединений."""
+    pool = engine.pool
+    now = time.monotonic()
+    holders = sorted(
+        ({'holder': holder, 'held_seconds': round(now - started, 3)} for started, holder in list(_pool_checked_out.values())),
+        key=lambda item: item['held_seconds'], reverse=True,
+    )
+    checkouts = _pool_totals['checkouts']
+    return {
+        'status': pool.status(),
+        'size': getattr(pool, 'size', lambda: None)(),
+        'checked_out': getattr(pool, 'checkedout', lambda: len(holders))(),
+        'overflow': getattr(pool, 'overflow', lambda: None)(),
+        'checkouts_total': checkouts,
+        'avg_hold_seconds': round(_pool_totals['hold_seconds'] / checkouts, 4) if checkouts else 0,
+        'max_hold_seconds': round(_pool_totals['max_hold_seconds'], 3),
+        'holders': holders,
+    }
+
+
+def install(engine: Engine):
+    """Подключает учет запросов и выдачи соединений из пула к движку (повторный вызов ничего не делает)."""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+        event.listen(engine, 'checkout', _on_checkout)
+        event.listen(engine, 'checkin', _on_checkin)
@@ -1,11 +1,45 @@
+import time
 from datetime import date
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
-from .models import Statistic
+from sqlalchemy.dialects.postgresql import insert
+from .models import Statistic, StatisticMonthly, StatisticTotal, Vacancy
+
+# Страховочный срок жизни кэша дашборда: ревизия по updated_at может не заметить транзакцию,
+# которая началась раньше уже учтенной, но закоммитилась позже
+DASHBOARD_CACHE_TTL_SECONDS = 60
+
+# период -> (ключ периода, ревизия, время записи по time.monotonic(), строки)
+_dashboard_cache = {}
+
+
+def _upsert_rollup(db: Session, model, key_values: dict, responses: int, started_dialogs: int, qualified: int, **extra):
+    """Атомарно прибавляет счетчики к строке свертки (INSERT ... ON CONFLICT DO UPDATE)."""
+    table = model.__table__
+    statement = insert(table).values(
+        **key_values,
+        responses_count=responses,
+        started_dialogs_count=started_dialogs,
+        qualified_count=qualified,
+        **extra,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=list(key_values),
+        set_={
+            'responses_count': table.c.responses_count + responses,
+            'started_dialogs_count': table.c.started_dialogs_count + started_dialogs,
+            'qualified_count': table.c.qualified_count + qualified,
+            **extra,
+        },
+    )
+    db.execute(statement)
+
 
 def update_stats(db: Session, vacancy_id: int, responses: int = 0, started_dialogs: int = 0, qualified: int = 0):
     """
     Находит или создает запись о статистике за сегодняшний день для вакансии
-    и инкрементирует нужные счетчики.
+    и инкрементирует нужные счетчики. В той же транзакции обновляются свертки
+    за месяц и за все время.
     """
     today = date.today()
 
@@ -23,12 +57,99 @@ def update_stats(db: Session, vacancy_id: int, responses: int = 0, started_dialo
         )
         db.add(stats_record)
         # Нужно сделать flush, чтобы получить ID, если это новая запись
-        db.flush() 
+        db.flush()
 
     # Инкрементируем счетчики
     stats_record.responses_count += responses
     stats_record.started_dialogs_count += started_dialogs
     stats_record.qualified_count += qualified
 
+    _upsert_rollup(db, StatisticMonthly, {'vacancy_id': vacancy_id, 'month': today.replace(day=1)},
+                   responses, started_dialogs, qualified)
+    _upsert_rollup(db, StatisticTotal, {'vacancy_id': vacancy_id},
+                   responses, started_dialogs, qualified, updated_at=func.clock_timestamp())
+
+    db.commit()
+    print(f"  > Статистика для вакансии {vacancy_id} обновлена: +{responses} откликов, +{started_dialogs} диалогов, +{qualified} квалифицировано.")
+
+
+def _dashboard_query(db: Session, period: str, period_key: date):
+    """Сводка по вакансиям (группировка по названию) из дневной таблицы или из сверток."""
+    if period == 'today':
+        model, period_filter = Statistic, Statistic.date == period_key
+    elif period == 'month':
+        model, period_filter = StatisticMonthly, StatisticMonthly.month == period_key
+    else:
+        model, period_filter = StatisticTotal, None
+
+    query = db.query(
+        Vacancy.title,
+        func.sum(model.responses_count).label('total_responses'),
+        func.sum(model.started_dialogs_count).label('total_dialogs'),
+        func.sum(model.qualified_count).label('total_qualified')
+    ).join(Vacancy, Vacancy.id == model.vacancy_id)
+    if period_filter is not None:
+        query = query.filter(period_filter)
+    return query.group_by(Vacancy.title).order_by(Vacancy.title)
+
+
+def get_dashboard_stats(db: Session, period: str) -> list:
+    """
+    Сводка для дашборда за 'today', 'month' или 'all_time'.
+    Результат кэшируется в памяти и пересчитывается, только когда меняется ревизия
+    (max(updated_at) сверток — один запрос по индексу), сменился день или истек страховочный TTL.
+    """
+    today = date.today()
+    period_key = today.replace(day=1) if period == 'month' else today
+    revision = db.query(func.max(StatisticTotal.updated_at)).scalar()
+
+    cached = _dashboard_cache.get(period)
+    if (
+        cached
+        and cached[0] == period_key
+        and cached[1] == revision
+        and time.monotonic() - cached[2] < DASHBOARD_CACHE_TTL_SECONDS
+    ):
+        return cached[3]
+
+    rows = _dashboard_query(db, period, period_key).all()
+    _dashboard_cache[period] = (period_key, revision, time.monotonic(), rows)
+    return rows
+
+
+def rebuild_rollups(db: Session):
+    """Пересобирает свертки за месяц и за все время из дневной таблицы (первичное заполнение или сверка)."""
+    db.execute(text("DELETE FROM statistics_monthly"))
+    db.execute(text("DELETE FROM statistics_totals"))
+    db.execute(text("""
+        INSERT INTO statistics_monthly (vacancy_id, month, responses_count, started_dialogs_count, qualified_count)
+        SELECT vacancy_id, date_trunc('month', date)::date,
+               COALESCE(SUM(responses_count), 0), COALESCE(SUM(started_dialogs_count), 0), COALESCE(SUM(qualified_count), 0)
+        FROM statistics
+        WHERE vacancy_id IS NOT NULL
+        GROUP BY vacancy_id, date_trunc('month', date)
+    """))
+    db.execute(text("""
+        INSERT INTO statistics_totals (vacancy_id, responses_count, started_dialogs_count, qualified_count, updated_at)
+        SELECT vacancy_id,
+               COALESCE(SUM(responses_count), 0), COALESCE(SUM(started_dialogs_count), 0), COALESCE(SUM(qualified_count), 0),
+               clock_timestamp()
+        FROM statistics
+        WHERE vacancy_id IS NOT NULL
+        GROUP BY vacancy_id
+    """))
     db.commit()
-    print(f"  > Статистика для вакансии {vacancy_id} обновлена: +{responses} откликов, +{started_dialogs} диалогов, +{qualified} квалифицировано.")
\ No newline at end of file
+    _dashboard_cache.clear()
+
+
+if __name__ == '__main__':
+    # python -m hr_bot.db.statistics_manager — пересобрать свертки статистики
+    from .models import SessionLocal, init_engine
+
+    init_engine()
+    session = SessionLocal()
+    try:
+        rebuild_rollups(session)
+        print("Свертки статистики пересобраны.")
+    finally:
+        session.close()
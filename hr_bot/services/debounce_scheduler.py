@@ -0,0 +1,98 @@
+# hr_bot/services/debounce_scheduler.py
+
+import time
+import heapq
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class DebounceScheduler:
+    """
+    Таймеры debounce для диалогов на event loop.
+
+    Дедлайны хранятся в куче (heapq) с ленивым удалением: при повторном arm()
+    старая запись остается в куче, но игнорируется, так как ее дедлайн не совпадает
+    с актуальным. Как только дедлайн наступает, диалог сразу отправляется в dispatch.
+    Пока диалог обрабатывается, новые arm() откладываются до завершения обработки.
+    """
+
+    def __init__(self, dispatch: Callable[[int, int], Awaitable[None]], delay_seconds: float):
+        self._dispatch = dispatch
+        self._delay = delay_seconds
+        self._deadlines = {}    # dialogue_id -> (дедлайн по time.monotonic(), recruiter_id)
+        self._heap = []         # (дедлайн, dialogue_id)
+        self._in_flight = set()
+        self._rearm_after = {}  # dialogue_id -> (recruiter_id, дедлайн) — пришло во время обработки
+        self._tasks = set()
+        self._wakeup = asyncio.Event()
+
+    def arm(self, dialogue_id: int, recruiter_id: int, delay_seconds: float | None = None):
+        """Ставит (или сбрасывает) таймер диалога: обработка начнется через delay_seconds."""
+        delay = self._delay if delay_seconds is None else max(0.0, delay_seconds)
+        deadline = time.monotonic() + delay
+
+        if dialogue_id in self._in_flight:
+            self._rearm_after[dialogue_id] = (recruiter_id, deadline)
+            return
+
+        self._deadlines[dialogue_id] = (deadline, recruiter_id)
+        heapq.heappush(self._heap, (deadline, dialogue_id))
+        if self._heap[0][1] == dialogue_id:
+            self._wakeup.set()
+
+    def is_tracked(self, dialogue_id: int) -> bool:
+        """True, если для диалога уже взведен таймер или он обрабатывается прямо сейчас."""
+        return dialogue_id in self._deadlines or dialogue_id in self._in_flight
+
+    @property
+    def armed_count(self) -> int:
+        return len(self._deadlines)
+
+    @property
+    def in_flight_count(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self):
+        """Основной цикл: спит до ближайшего дедлайна и запускает обработку наступивших."""
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, dialogue_id = heapq.heappop(self._heap)
+                entry = self._deadlines.get(dialogue_id)
+                if not entry or entry[0] != deadline:
+                    continue  # Таймер был сброшен, запись устарела
+                del self._deadlines[dialogue_id]
+                self._start(dialogue_id, entry[1])
+
+            timeout = (self._heap[0][0] - now) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, dialogue_id: int, recruiter_id: int):
+        self._in_flight.add(dialogue_id)
+        task = asyncio.create_task(self._run_dispatch(dialogue_id, recruiter_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_dispatch(self, dialogue_id: int, recruiter_id: int):
+        try:
+            await self._dispatch(dialogue_id, recruiter_id)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке диалога {dialogue_id} по таймеру: {e}", exc_info=True)
+        finally:
+            self._in_flight.discard(dialogue_id)
+            rearm = self._rearm_after.pop(dialogue_id, None)
+            if rearm:
+                rearm_recruiter_id, deadline = rearm
+                self.arm(dialogue_id, rearm_recruiter_id, deadline - time.monotonic())
+
+    async def shutdown(self):
+        """Дожидается завершения уже начатых обработок."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
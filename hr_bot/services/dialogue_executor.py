@@ -0,0 +1,142 @@
+# hr_bot/services/dialogue_executor.py
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import Counter as CountMap
+from typing import Awaitable, Callable
+
+from hr_bot.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько ходов диалогов (снимок в БД + LLM + отправка в hh.ru) выполняется одновременно по всем рекрутерам
+DIALOGUE_CONCURRENCY = int(os.getenv('DIALOGUE_CONCURRENCY', '10'))
+# Веса рекрутеров в очереди: "recruiter_id:вес,..." — рекрутер с весом 2 получает вдвое больше слотов,
+# когда очереди есть у нескольких рекрутеров. Не указанные рекрутеры имеют вес 1
+DIALOGUE_RECRUITER_WEIGHTS = os.getenv('DIALOGUE_RECRUITER_WEIGHTS', '')
+
+# Классы приоритета: меньше — раньше. Класс важнее справедливости между рекрутерами:
+# первый ответ на свежий отклик не ждет переписки с уже квалифицированными кандидатами
+PRIORITY_FIRST_REPLY = 0
+PRIORITY_DIALOGUE = 1
+PRIORITY_POST_QUALIFICATION = 2
+PRIORITY_NAMES = {
+    PRIORITY_FIRST_REPLY: 'first_reply',
+    PRIORITY_DIALOGUE: 'dialogue',
+    PRIORITY_POST_QUALIFICATION: 'post_qualification',
+}
+
+EXECUTOR_WAIT_SECONDS = metrics.Histogram(
+    'hh_worker_dialogue_queue_wait_seconds', 'Ожидание свободного слота обработки диалога',
+    ('recruiter_id', 'priority'))
+
+
+def parse_weights(value: str) -> dict:
+    """'12:2,15:0.5' -> {12: 2.0, 15: 0.5}; некорректные и неположительные записи пропускаются."""
+    weights = {}
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        recruiter_id, _, weight = part.partition(':')
+        try:
+            recruiter_id, weight = int(recruiter_id), float(weight)
+        except ValueError:
+            weight = 0
+        if weight > 0:
+            weights[recruiter_id] = weight
+        else:
+            logger.warning(f"Некорректный вес рекрутера в DIALOGUE_RECRUITER_WEIGHTS: '{part}'")
+    return weights
+
+
+class DialogueExecutor:
+    """
+    Общий для всех рекрутеров лимит одновременных ходов диалогов.
+
+    Ожидающие ходы лежат в одной куче (heapq) с ключом (класс приоритета, виртуальное время
+    окончания). Внутри класса это взвешенная справедливая очередь (WFQ): каждому ходу рекрутера
+    при постановке назначается тег max(последний тег рекрутера, текущее виртуальное время) + 1/вес,
+    поэтому рекрутер с сотней готовых диалогов получает слоты по очереди с остальными,
+    а не все сразу. Отмененные в очереди ходы удаляются лениво, при извлечении из кучи.
+    """
+
+    def __init__(self, concurrency: int = DIALOGUE_CONCURRENCY, weights: dict | None = None):
+        self._concurrency = max(1, concurrency)
+        self._weights = weights or {}
+        self._heap = []              # (приоритет, тег, seq, recruiter_id, future)
+        self._seq = itertools.count()
+        self._last_tag = {}          # recruiter_id -> тег последнего поставленного хода
+        self._virtual_time = 0.0
+        self._active = 0
+        self._queued = CountMap()    # (recruiter_id, priority) -> ходов в очереди
+        self._running = CountMap()   # recruiter_id -> выполняется сейчас
+
+    @property
+    def active_count(self) -> int:
+        return self._active
+
+    @property
+    def queued_count(self) -> int:
+        return sum(self._queued.values())
+
+    def queue_depths(self) -> dict:
+        """{(recruiter_id, имя приоритета): ходов в очереди} — для метрик."""
+        return {
+            (str(recruiter_id), PRIORITY_NAMES.get(priority, str(priority))): count
+            for (recruiter_id, priority), count in self._queued.items()
+        }
+
+    def running_counts(self) -> dict:
+        return {(str(recruiter_id),): count for recruiter_id, count in self._running.items()}
+
+    async def run(self, recruiter_id: int, priority: int, job: Callable[[], Awaitable]):
+        """Дожидается слота в очереди рекрутера с приоритетом priority, выполняет job() и возвращает ее результат."""
+        enqueued_at = time.monotonic()
+        if self._active < self._concurrency and not self._heap:
+            self._active += 1
+        else:
+            await self._wait_turn(recruiter_id, priority)
+        EXECUTOR_WAIT_SECONDS.observe(
+            time.monotonic() - enqueued_at, recruiter_id=recruiter_id, priority=PRIORITY_NAMES.get(priority, priority))
+
+        self._running[recruiter_id] += 1
+        try:
+            return await job()
+        finally:
+            self._running[recruiter_id] -= 1
+            self._release()
+
+    async def _wait_turn(self, recruiter_id: int, priority: int):
+        weight = self._weights.get(recruiter_id, 1.0)
+        tag = max(self._last_tag.get(recruiter_id, 0.0), self._virtual_time) + 1.0 / weight
+        self._last_tag[recruiter_id] = tag
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, tag, next(self._seq), recruiter_id, granted))
+        self._queued[(recruiter_id, priority)] += 1
+        self._dispatch()
+        try:
+            await granted
+        except asyncio.CancelledError:
+            if granted.done() and not granted.cancelled():
+                # Слот уже был выдан, но задачу отменили до начала работы — возвращаем его
+                self._release()
+            else:
+                self._queued[(recruiter_id, priority)] -= 1
+            raise
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Выдает свободные слоты ходам с наименьшим ключом (приоритет, тег)."""
+        while self._heap and self._active < self._concurrency:
+            priority, tag, _, recruiter_id, granted = heapq.heappop(self._heap)
+            if granted.done():
+                continue  # Ожидание отменено, счетчик очереди уже уменьшен
+            self._queued[(recruiter_id, priority)] -= 1
+            self._virtual_time = max(self._virtual_time, tag - 1.0 / self._weights.get(recruiter_id, 1.0))
+            self._active += 1
+            granted.set_result(None)
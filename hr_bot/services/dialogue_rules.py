@@ -0,0 +1,98 @@
+# hr_bot/services/dialogue_rules.py
+
+import re
+import logging
+from typing import Optional
+
+from hr_bot.utils.pii_masker import FIO_MASK_TOKEN, PHONE_MASK_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# --- КОНФИГУРАЦИЯ БЫСТРОГО ПУТИ ---
+# Ответы, которые бот отправляет без обращения к LLM.
+# Тексты совпадают с тем, что LLM отвечает по правилам из JSON_FORMAT_INSTRUCTION.
+FAST_PATH_REPLIES = {
+    'ask_phone': "Спасибо! Подскажите, пожалуйста, ваш номер телефона для связи.",
+    'ask_city': "Спасибо! Подскажите, пожалуйста, в каком городе вам удобно пройти собеседование?",
+}
+
+# Таблица переходов: (текущее состояние, есть ФИО, есть телефон) -> (ключ ответа, новое состояние)
+TRANSITIONS = {
+    ('awaiting_fio', True, False): ('ask_phone', 'awaiting_phone'),
+    ('awaiting_fio', True, True): ('ask_city', 'awaiting_city'),
+    ('awaiting_phone', False, True): ('ask_city', 'awaiting_city'),
+    ('awaiting_phone', True, True): ('ask_city', 'awaiting_city'),
+}
+
+# Слова, которые кандидаты обычно пишут вместе с ФИО или телефоном.
+# Если после их удаления в сообщении что-то остается, ответ отдаем LLM.
+FILLER_WORDS = {
+    'я', 'мое', 'моё', 'мой', 'мои', 'меня', 'зовут', 'это', 'вот', 'фио', 'имя',
+    'номер', 'телефон', 'телефона', 'тел', 'мобильный', 'контактный', 'для', 'связи',
+    'пожалуйста', 'да', 'конечно', 'хорошо', 'спасибо', 'здравствуйте', 'добрый',
+    'день', 'вечер', 'утро', 'пишите', 'звоните', 'и',
+}
+
+_WORD_PATTERN = re.compile(r'[а-яёa-z0-9]+', re.IGNORECASE)
+
+# Средняя задержка LLM для оценки сэкономленного времени (экспоненциальное скользящее среднее)
+_LLM_LATENCY_EMA_ALPHA = 0.1
+_DEFAULT_LLM_LATENCY_SECONDS = 5.0
+
+_stats = {
+    'attempts': 0,
+    'hits': 0,
+    'llm_latency_ema': None,
+    'saved_seconds': 0.0,
+}
+
+
+def _has_only_filler(masked_text: str) -> bool:
+    """Проверяет, что кроме токенов маскирования в тексте нет содержательных слов."""
+    residual = masked_text.replace(FIO_MASK_TOKEN, ' ').replace(PHONE_MASK_TOKEN, ' ')
+    words = _WORD_PATTERN.findall(residual.lower())
+    return all(word in FILLER_WORDS for word in words)
+
+
+def try_fast_path(dialogue_state: Optional[str], masked_text: str, has_fio: bool, has_phone: bool) -> Optional[dict]:
+    """
+    Пытается определить следующий шаг диалога без LLM.
+    Возвращает ответ в том же формате, что и llm_handler.get_bot_response,
+    или None, если ситуация неоднозначна и нужен LLM.
+    """
+    _stats['attempts'] += 1
+
+    transition = TRANSITIONS.get((dialogue_state, has_fio, has_phone))
+    if not transition or not _has_only_filler(masked_text):
+        return None
+
+    reply_key, new_state = transition
+    _stats['hits'] += 1
+    _stats['saved_seconds'] += _stats['llm_latency_ema'] or _DEFAULT_LLM_LATENCY_SECONDS
+    logger.info(
+        f"Быстрый путь: '{dialogue_state}' -> '{new_state}' без LLM "
+        f"(попаданий {_stats['hits']}/{_stats['attempts']}, сэкономлено ~{_stats['saved_seconds']:.1f} c)."
+    )
+    return {
+        "response_text": FAST_PATH_REPLIES[reply_key],
+        "new_state": new_state,
+        "extracted_data": None,
+    }
+
+
+def record_llm_latency(seconds: float):
+    """Учитывает фактическую задержку LLM, чтобы оценивать сэкономленное быстрым путем время."""
+    ema = _stats['llm_latency_ema']
+    _stats['llm_latency_ema'] = seconds if ema is None else ema + _LLM_LATENCY_EMA_ALPHA * (seconds - ema)
+
+
+def get_stats() -> dict:
+    """Возвращает счетчики быстрого пути: попытки, попадания, доля попаданий и сэкономленное время."""
+    attempts = _stats['attempts']
+    return {
+        'attempts': attempts,
+        'hits': _stats['hits'],
+        'hit_rate': (_stats['hits'] / attempts) if attempts else 0.0,
+        'saved_seconds': _stats['saved_seconds'],
+        'llm_latency_ema': _stats['llm_latency_ema'],
+    }
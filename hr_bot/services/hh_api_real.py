@@ -1,31 +1,91 @@
 import os
+import time
 import logging
 import datetime
 import asyncio
 import json # <--- ДОБАВЛЕН ИМПОРТ
+from collections import deque
+from typing import AsyncIterator
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from hr_bot.db.models import TrackedRecruiter
-from hr_bot.utils.api_logger import setup_api_logger
+from hr_bot.utils.api_logger import setup_api_logger, log_api_exchange
+from hr_bot.utils import metrics
+from hr_bot.utils import tracing
+from hr_bot.utils.metrics import normalize_endpoint
+from hr_bot.utils.json_codec import response_json
+from hr_bot.services.hh_records import NegotiationRecord
 import httpx
 
 load_dotenv()
 logger = logging.getLogger(__name__)
-api_raw_logger = setup_api_logger()
+# Логгер сырых запросов создается при первом запросе: импорт модуля не открывает файлы логов
+api_raw_logger = None
 
 CLIENT_ID = os.getenv('HH_CLIENT_ID')
 CLIENT_SECRET = os.getenv('HH_CLIENT_SECRET')
 
 # Устанавливаем лимит на количество одновременных запросов к API hh.ru.
 MAX_CONCURRENT_REQUESTS = 10
+# Таймаут одного запроса к hh.ru: зависшее соединение не должно съедать весь бюджет этапа воркера
+HH_REQUEST_TIMEOUT_SECONDS = float(os.getenv('HH_REQUEST_TIMEOUT_SECONDS', '10'))
 API_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+# Размер страницы списков hh.ru и сколько следующих страниц одного списка запрашивать наперед.
+# Общую одновременность все равно ограничивает API_SEMAPHORE, окно лишь не дает одному длинному
+# списку занять все слоты и не тратит запросы, если потребитель остановится раньше
+PAGE_SIZE = 50
+PAGE_PREFETCH = 4
+
+
+def _save_recruiter_tokens(recruiter: TrackedRecruiter, db: Session, values: dict,
+                           expected_refresh_token: str | None = None) -> bool:
+    """
+    Записывает в строку рекрутера только переданные колонки (UPDATE по первичному ключу)
+    и переносит их в объект. Объект может быть отсоединенным снимком, который держит ход диалога
+    или другой этап воркера: целиком он не сохраняется, иначе устаревшая пара токенов
+    затерла бы ту, что только что обновил параллельный запрос.
+    expected_refresh_token — запись только если refresh_token в БД не сменился с момента чтения.
+    Возвращает False, если строку уже изменил кто-то другой.
+    """
+    query = db.query(TrackedRecruiter).filter(TrackedRecruiter.id == recruiter.id)
+    if expected_refresh_token is not None:
+        query = query.filter(TrackedRecruiter.refresh_token == expected_refresh_token)
+    updated = query.update(values, synchronize_session=False)
+    db.commit()
+    if not updated:
+        return False
+    for column, value in values.items():
+        # Без пометки «изменено»: следующий commit сессии не запишет эти значения еще раз
+        set_committed_value(recruiter, column, value)
+    return True
+
+
+def _load_stored_tokens(recruiter: TrackedRecruiter, db: Session):
+    """Перечитывает токены рекрутера из БД в объект (их мог обновить параллельный запрос)."""
+    row = db.query(
+        TrackedRecruiter.refresh_token, TrackedRecruiter.access_token, TrackedRecruiter.token_expires_at
+    ).filter(TrackedRecruiter.id == recruiter.id).first()
+    db.commit()
+    if row:
+        for column in ('refresh_token', 'access_token', 'token_expires_at'):
+            set_committed_value(recruiter, column, getattr(row, column))
+
+
+def _token_valid(recruiter: TrackedRecruiter, now: datetime.datetime) -> bool:
+    return bool(recruiter.access_token and recruiter.token_expires_at and recruiter.token_expires_at > now)
 
 
 async def get_access_token(recruiter: TrackedRecruiter, db: Session) -> str | None:
     """Асинхронно получает или обновляет access_token для рекрутера."""
     now = datetime.datetime.now(datetime.timezone.utc)
 
-    if recruiter.access_token and recruiter.token_expires_at and recruiter.token_expires_at > now:
+    if _token_valid(recruiter, now):
+        return recruiter.access_token
+
+    # Снимок мог устареть: другой ход или этап, возможно, уже обновил токен
+    _load_stored_tokens(recruiter, db)
+    if _token_valid(recruiter, now):
         return recruiter.access_token
 
     logger.info(f"Токен для рекрутера {recruiter.name} истек или отсутствует. Обновляю...")
@@ -34,32 +94,37 @@ async def get_access_token(recruiter: TrackedRecruiter, db: Session) -> str | No
         logger.error(f"У рекрутера {recruiter.name} (ID: {recruiter.recruiter_id}) нет refresh_token!")
         return None
 
+    # refresh_token у hh.ru одноразовый: запоминаем, каким мы воспользовались
+    used_refresh_token = recruiter.refresh_token
     url = "https://api.hh.ru/token"
     data = {
         "grant_type": "refresh_token",
-        "refresh_token": recruiter.refresh_token,
+        "refresh_token": used_refresh_token,
         "client_id": CLIENT_ID,
         "client_secret": CLIENT_SECRET,
     }
 
     async with API_SEMAPHORE:
-        async with httpx.AsyncClient(timeout=30) as client:
+        async with httpx.AsyncClient(timeout=HH_REQUEST_TIMEOUT_SECONDS) as client:
             response = await client.post(url, data=data)
 
     if response.status_code == 200:
-        tokens = response.json()
-        recruiter.access_token = tokens["access_token"]
+        tokens = response_json(response)
+        values = {
+            'access_token': tokens["access_token"],
+            # Рассчитываем новое время с запасом в 5 минут, чтобы избежать проблем на границе времени
+            'token_expires_at': now + datetime.timedelta(seconds=tokens["expires_in"] - 300),
+        }
         if "refresh_token" in tokens:
-            recruiter.refresh_token = tokens["refresh_token"]
-        # Рассчитываем новое время с запасом в 5 минут, чтобы избежать проблем на границе времени
-        recruiter.token_expires_at = now + datetime.timedelta(seconds=tokens["expires_in"] - 300)
-        db.commit()
+            values['refresh_token'] = tokens["refresh_token"]
+        # hh.ru принял наш refresh_token, значит новая пара — актуальная: пишем без условия
+        _save_recruiter_tokens(recruiter, db, values)
         logger.info(f"Успешно получен новый access_token для рекрутера {recruiter.name}.")
         return recruiter.access_token
     else:
         # --- НОВАЯ, УМНАЯ ЛОГИКА ОБРАБОТКИ ОШИБОК ---
         try:
-            error_data = response.json()
+            error_data = response_json(response)
             error_description = error_data.get("error_description")
 
             if error_description == "token not expired":
@@ -70,22 +135,58 @@ async def get_access_token(recruiter: TrackedRecruiter, db: Session) -> str | No
                 # Сервер подтвердил, что старый токен жив. Возвращаем его.
                 # Чтобы разорвать цикл, если дата в БД неверна, искусственно продлеваем 
                 # жизнь токена в нашей БД на 5 минут. За это время он точно истечет.
-                recruiter.token_expires_at = now + datetime.timedelta(minutes=5)
-                db.commit()
+                _save_recruiter_tokens(recruiter, db, {'token_expires_at': now + datetime.timedelta(minutes=5)})
                 return recruiter.access_token
             else:
                 # Другая ошибка (refresh_token отозван, невалиден и т.д.)
                 logger.critical(f"Ошибка обновления токена для {recruiter.name}: {response.text}")
-                recruiter.access_token = None # Обнуляем только access_token
-                db.commit()
-                return None
+                return _reset_access_token(recruiter, db, used_refresh_token, now)
 
         except Exception:
             # На случай, если ответ от сервера был не в формате JSON
             logger.critical(f"Критическая ошибка при обработке неудачного обновления токена для {recruiter.name}: {response.text}")
-            recruiter.access_token = None
-            db.commit()
-            return None
+            return _reset_access_token(recruiter, db, used_refresh_token, now)
+
+
+def _reset_access_token(recruiter: TrackedRecruiter, db: Session, used_refresh_token: str,
+                        now: datetime.datetime) -> str | None:
+    """
+    Обнуляет только access_token после неудачного обновления, если в БД все еще тот refresh_token,
+    которым мы пытались воспользоваться. Иначе его уже сменил параллельный запрос (поэтому наш
+    и был отклонен) — берем из БД свежую пару.
+    """
+    if _save_recruiter_tokens(recruiter, db, {'access_token': None}, expected_refresh_token=used_refresh_token):
+        return None
+    _load_stored_tokens(recruiter, db)
+    logger.info(f"Токены рекрутера {recruiter.name} уже обновлены параллельным запросом.")
+    return recruiter.access_token if _token_valid(recruiter, now) else None
+
+
+def _get_api_logger() -> logging.Logger:
+    global api_raw_logger
+    if api_raw_logger is None:
+        api_raw_logger = setup_api_logger()
+    return api_raw_logger
+
+
+async def _send(method: str, url: str, headers: dict, kwargs: dict) -> httpx.Response:
+    """Выполняет один HTTP-запрос, пишет его в сырой лог и в метрики задержки по эндпоинту."""
+    endpoint = normalize_endpoint(url)
+    started_at = time.monotonic()
+    with tracing.span('hh.request', method=method, endpoint=endpoint) as request_span:
+        try:
+            async with httpx.AsyncClient(timeout=HH_REQUEST_TIMEOUT_SECONDS) as client:
+                response = await client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            metrics.HH_REQUEST_SECONDS.observe(time.monotonic() - started_at, method=method, endpoint=endpoint, status='error')
+            raise
+        if request_span is not None:
+            request_span.attrs['status'] = response.status_code
+    elapsed = time.monotonic() - started_at
+    metrics.HH_REQUEST_SECONDS.observe(elapsed, method=method, endpoint=endpoint, status=response.status_code)
+    # Одна запись на запрос: без токена, тела — только для выборки и ошибок
+    log_api_exchange(_get_api_logger(), method, url, {'headers': headers, **kwargs}, response, elapsed)
+    return response
 
 
 async def _make_request(
@@ -111,26 +212,15 @@ async def _make_request(
     headers["HH-User-Agent"] = "ZaBota-Bot/1.0 (hbfys@mail.com)"
     # -------------------------------------------------------------
 
-    request_log = (
-        f"REQUEST -->\n  Method: {method}\n  URL: {url}\n  Headers: {headers}\n"
-        f"  Params: {kwargs.get('params')}\n  Data: {kwargs.get('data')}\n  JSON: {kwargs.get('json')}"
-    )
-    api_raw_logger.debug(request_log)
-
     async with API_SEMAPHORE:
-        async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.request(method, url, headers=headers, **kwargs)
-
-        response_log = (
-            f"<-- RESPONSE\n  Status Code: {response.status_code}\n"
-            f"  Headers: {response.headers}\n  Body: {response.text}"
-        )
-        api_raw_logger.debug(response_log)
+        response = await _send(method, url, headers, kwargs)
 
         if response.status_code == 403:
             logger.warning(f"Токен для {recruiter.name} протух. Повторная попытка...")
-            recruiter.access_token = None
-            db.commit()
+            # Обнуляем только access_token и только если пару никто не успел обновить
+            if not _save_recruiter_tokens(recruiter, db, {'access_token': None},
+                                          expected_refresh_token=recruiter.refresh_token):
+                _load_stored_tokens(recruiter, db)
             token = await get_access_token(recruiter, db)
             if not token:
                 raise ConnectionError(f"Не удалось повторно получить токен для {recruiter.name}")
@@ -139,91 +229,198 @@ async def _make_request(
             # --- ИСПРАВЛЕНИЕ: Повторно добавляем заголовок и здесь ---
             headers["HH-User-Agent"] = "ZaBota-Bot/1.0 (hbfys@mail.com)"
             # ---------------------------------------------------------
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.request(method, url, headers=headers, **kwargs)
+            response = await _send(method, url, headers, kwargs)
 
     if response.status_code in [201, 204]:
         return None
         
     response.raise_for_status()
-    return response.json() if response.content else None
+    return response_json(response) if response.content else None
+
+
+async def check_reachable() -> int:
+    """Проверка готовности: api.hh.ru отвечает (без токена ожидается 403). Возвращает HTTP-код."""
+    async with httpx.AsyncClient(timeout=HH_REQUEST_TIMEOUT_SECONDS) as client:
+        response = await client.get("https://api.hh.ru/me", headers={"HH-User-Agent": "ZaBota-Bot/1.0 (hbfys@mail.com)"})
+    return response.status_code
 
 
 # hr_bot/services/hh_api_real.py
 
-async def get_responses_from_folder(
-    recruiter: TrackedRecruiter, db: Session, folder_id: str, vacancy_ids: list
-) -> list:
+async def iter_pages(
+    recruiter: TrackedRecruiter,
+    db: Session,
+    endpoint: str = "",
+    full_url: str = None,
+    params: dict = None,
+    reverse: bool = False,
+    max_pages: int | None = None,
+) -> AsyncIterator[dict]:
     """
-    Асинхронно получает список откликов из указанной папки,
-    делая ОТДЕЛЬНЫЙ запрос для КАЖДОЙ вакансии и "помечая" каждый отклик
-    ID его вакансии.
+    Элементы (items) постраничного списка hh.ru.
+    Первая страница запрашивается отдельно — из нее берется число страниц pages, остальные
+    запрашиваются параллельно окном PAGE_PREFETCH. Без reverse элементы отдаются по мере прихода
+    страниц, порядок между страницами не гарантирован. reverse=True — с последней страницы к первой
+    и с конца страницы, строго по порядку (для списков, где hh.ru отдает старые записи первыми,
+    это «сначала новые»). max_pages ограничивает число читаемых страниц (считая с первой).
+    Потребитель может прервать перебор: запросы оставшихся страниц не отправляются, уже запущенные
+    отменяются. Ошибка запроса страницы пробрасывается потребителю после элементов страниц,
+    которые успели прийти вместе с ней.
     """
-    logger.debug(
-        f"REAL_API: Запрос откликов из папки '{folder_id}' для {len(vacancy_ids)} вакансий..."
-    )
-    
-    tasks = []
-    
-    for vacancy_id in vacancy_ids:
-        if not vacancy_id:
-            continue
-            
-        async def fetch_for_vacancy(vid):
-            try:
-                params = {"vacancy_id": str(vid), "page": "0", "per_page": "50"}
-                response_data = await _make_request(
-                    recruiter, db, "GET", f"negotiations/{folder_id}", params=params
-                )
-                items = response_data.get("items", []) if response_data else []
-                
-                # --- ИЗМЕНЕНИЕ ЗДЕСЬ ---
-                # Возвращаем не просто список откликов, а список пар (отклик, ID вакансии)
-                return [(item, str(vid)) for item in items]
-                # -------------------------
-
-            except Exception as e:
-                logger.error(f"Ошибка при запросе откликов для вакансии {vid} в папке '{folder_id}': {e}")
-                return []
-
-        tasks.append(fetch_for_vacancy(vacancy_id))
-
-    results_from_all_vacancies = await asyncio.gather(*tasks)
-    
-    all_responses_with_vacancy_id = []
-    for single_vacancy_responses in results_from_all_vacancies:
-        all_responses_with_vacancy_id.extend(single_vacancy_responses)
-        
-    # Теперь лог более точный
-    logger.debug(f"Суммарно найдено {len(all_responses_with_vacancy_id)} откликов в папке '{folder_id}'.")
-    return all_responses_with_vacancy_id
+    params = dict(params or {})
+    params['per_page'] = PAGE_SIZE
+
+    async def fetch(page: int) -> list:
+        data = await _make_request(recruiter, db, "GET", endpoint, full_url=full_url, params={**params, 'page': page})
+        return (data or {}).get('items') or []
+
+    first_page = await _make_request(recruiter, db, "GET", endpoint, full_url=full_url, params={**params, 'page': 0})
+    if not first_page:
+        return
+    first_items = first_page.get('items') or []
+    pages = int(first_page.get('pages') or 1)
+    if max_pages is not None:
+        pages = min(pages, max_pages)
+    remaining = deque(range(1, pages))
+    if reverse:
+        remaining.reverse()
+    else:
+        for item in first_items:
+            yield item
+        first_items = None
 
-async def get_messages(recruiter: TrackedRecruiter, db: Session, messages_url: str) -> list:
-    """Асинхронно получает ПОЛНУЮ историю сообщений постранично."""
-    logger.info(f"REAL_API: Запрос ВСЕХ сообщений по {messages_url}...")
-    all_messages, page = [], 0
+    in_flight = deque()
+    try:
+        while remaining or in_flight:
+            while remaining and len(in_flight) < PAGE_PREFETCH:
+                in_flight.append(asyncio.ensure_future(fetch(remaining.popleft())))
+            if reverse:
+                items = await in_flight.popleft()
+                for item in reversed(items):
+                    yield item
+            else:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                # Сначала разбираем все завершенные страницы: ошибка одной не должна терять соседние
+                pages_done, error = [], None
+                for task in done:
+                    in_flight.remove(task)
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                    else:
+                        pages_done.append(task.result())
+                for items in pages_done:
+                    for item in items:
+                        yield item
+                if error is not None:
+                    raise error
+    finally:
+        for task in in_flight:
+            if task.done() and not task.cancelled():
+                task.exception()  # Забираем ошибку, чтобы asyncio не писал "exception was never retrieved"
+            else:
+                task.cancel()
 
-    while True:
-        try:
-            params = {"page": page, "per_page": 50}
-            response_data = await _make_request(recruiter, db, "GET", "", full_url=messages_url, params=params)
+    if reverse:
+        for item in reversed(first_items):
+            yield item
 
-            if not response_data or not response_data.get("items"):
-                break
 
-            all_messages.extend(response_data["items"])
+async def iter_responses_from_folders(
+    recruiter: TrackedRecruiter, db: Session, folder_ids: list, vacancy_ids: list, max_pages: int | None = None
+) -> AsyncIterator[NegotiationRecord]:
+    """
+    Асинхронный генератор откликов из папок по СПИСКУ вакансий.
+    Списки по каждой паре (папка, вакансия) перебираются параллельно: целиком или первые max_pages страниц,
+    записи отдаются по мере прихода страниц: каждый элемент сразу превращается в компактный
+    NegotiationRecord, а исходная страница (со вложенными резюме) не хранится.
+    """
+    logger.debug(
+        f"REAL_API: Запрос откликов из папок {folder_ids} для {len(vacancy_ids)} вакансий..."
+    )
+    # Ограниченная очередь: если потребитель медленный, запросы следующих страниц ждут его
+    records = asyncio.Queue(maxsize=PAGE_SIZE)
+    finished = object()
 
-            if page >= response_data.get("pages", 1) - 1:
-                break
-            page += 1
+    async def fetch_for_vacancy(folder_id, vid):
+        try:
+            async for item in iter_pages(
+                recruiter, db, f"negotiations/{folder_id}", params={"vacancy_id": str(vid)}, max_pages=max_pages
+            ):
+                await records.put(NegotiationRecord.from_api(item, str(vid)))
         except Exception as e:
-            logger.error(f"Ошибка при получении страницы {page} сообщений: {e}")
-            break
+            logger.error(f"Ошибка при запросе откликов для вакансии {vid} в папке '{folder_id}': {e}")
+        # При отмене (CancelledError) метку не ставим: читать очередь уже некому
+        await records.put(finished)
+
+    tasks = [
+        asyncio.ensure_future(fetch_for_vacancy(folder_id, vacancy_id))
+        for folder_id in folder_ids for vacancy_id in vacancy_ids if vacancy_id
+    ]
+    found, running = 0, len(tasks)
+    try:
+        while running:
+            record = await records.get()
+            if record is finished:
+                running -= 1
+                continue
+            found += 1
+            yield record
+    finally:
+        # Потребитель мог остановиться раньше (таймаут этапа): незавершенные запросы отменяем
+        for task in tasks:
+            task.cancel()
+    logger.debug(f"Суммарно найдено {found} откликов в папках {folder_ids}.")
+
+
+async def get_messages(
+    recruiter: TrackedRecruiter, db: Session, messages_url: str, stop_at_ids: set = None
+) -> list:
+    """
+    Асинхронно получает историю сообщений отклика (по возрастанию created_at).
+    Без stop_at_ids — полную. С stop_at_ids страницы перебираются с конца, и перебор
+    останавливается на первой реплике кандидата с известным ID: все, что старше, уже обработано.
+    """
+    logger.debug(f"REAL_API: Запрос сообщений по {messages_url}...")
+    all_messages = []
+    try:
+        async for message in iter_pages(recruiter, db, full_url=messages_url, reverse=stop_at_ids is not None):
+            if (
+                stop_at_ids is not None
+                and str(message.get('id')) in stop_at_ids
+                and message.get('author', {}).get('participant_type') == 'applicant'
+            ):
+                break
+            all_messages.append(message)
+    except Exception as e:
+        logger.error(f"Ошибка при получении сообщений по {messages_url}: {e}")
 
     all_messages.sort(key=lambda x: x.get("created_at", ""))
     return all_messages
 
 
+async def get_negotiation(recruiter: TrackedRecruiter, db: Session, negotiation_id: str) -> NegotiationRecord | None:
+    """Один отклик по ID — для событий webhook."""
+    item = await _make_request(recruiter, db, "GET", f"negotiations/{negotiation_id}")
+    return NegotiationRecord.from_api(item) if item else None
+
+
+async def ensure_webhook_subscription(recruiter: TrackedRecruiter, db: Session, url: str, actions: list) -> bool:
+    """
+    Подписывает рекрутера на события hh.ru с доставкой на url, если такой подписки еще нет.
+    Возвращает True, если подписка создана.
+    """
+    existing = await _make_request(recruiter, db, "GET", "webhook/subscriptions")
+    for item in (existing or {}).get('items', []):
+        if item.get('url') == url:
+            return False
+    await _make_request(
+        recruiter, db, "POST", "webhook/subscriptions",
+        json={'url': url, 'actions': [{'type': action} for action in actions]},
+    )
+    logger.info(f"REAL_API: Рекрутер {recruiter.name} подписан на события {', '.join(actions)}.")
+    return True
+
+
 async def send_message(recruiter: TrackedRecruiter, db: Session, negotiation_id: str, message_text: str) -> bool:
     """Асинхронно отправляет сообщение в чат отклика."""
     logger.info(f"REAL_API: Отправка сообщения в диалог {negotiation_id} от {recruiter.name}...")
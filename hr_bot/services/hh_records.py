@@ -0,0 +1,50 @@
+# hr_bot/services/hh_records.py
+
+
+class NegotiationRecord:
+    """
+    Отклик hh.ru в том объеме, который нужен воркеру. Создается сразу при разборе страницы API,
+    исходный словарь (со вложенным резюме, опытом, фото и т.д.) после этого не хранится.
+    """
+    __slots__ = (
+        'id', 'vacancy_id', 'state', 'has_updates', 'messages_url', 'created_at',
+        'resume_id', 'first_name', 'last_name',
+    )
+
+    def __init__(self, id: str, vacancy_id: str, state: str, has_updates: bool, messages_url: str,
+                 created_at: str | None, resume_id: str | None, first_name: str, last_name: str):
+        self.id = id
+        self.vacancy_id = vacancy_id
+        self.state = state
+        self.has_updates = has_updates
+        self.messages_url = messages_url
+        self.created_at = created_at
+        self.resume_id = resume_id
+        self.first_name = first_name
+        self.last_name = last_name
+
+    @classmethod
+    def from_api(cls, item: dict, vacancy_id: str | None = None) -> 'NegotiationRecord':
+        """
+        Элемент списка /negotiations/{folder} или ответ /negotiations/{id}.
+        vacancy_id передается, когда список запрашивался по конкретной вакансии.
+        """
+        resume = item.get('resume') or {}
+        return cls(
+            id=str(item.get('id') or ''),
+            vacancy_id=vacancy_id or str((item.get('vacancy') or {}).get('id') or ''),
+            state=(item.get('state') or {}).get('id') or '',
+            has_updates=bool(item.get('has_updates')),
+            messages_url=item.get('messages_url') or '',
+            created_at=item.get('created_at'),
+            resume_id=resume.get('id'),
+            first_name=resume.get('first_name') or '',
+            last_name=resume.get('last_name') or '',
+        )
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.first_name} {self.last_name}"
+
+    def __repr__(self) -> str:
+        return f"NegotiationRecord(id={self.id!r}, vacancy_id={self.vacancy_id!r}, state={self.state!r})"
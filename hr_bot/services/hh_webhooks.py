@@ -0,0 +1,140 @@
+# hr_bot/services/hh_webhooks.py
+
+import os
+import hmac
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from hr_bot.utils import metrics
+from hr_bot.utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Секрет в query-параметре token адреса подписки: hh.ru не подписывает уведомления,
+# поэтому запросы без правильного токена отклоняются. Пустой токен — прием событий выключен.
+HH_WEBHOOK_TOKEN = os.getenv('HH_WEBHOOK_TOKEN', '')
+HH_WEBHOOK_PATH = os.getenv('HH_WEBHOOK_PATH', '/hh/webhook')
+HH_WEBHOOK_HOST = os.getenv('HH_WEBHOOK_HOST', '127.0.0.1')
+HH_WEBHOOK_PORT = int(os.getenv('HH_WEBHOOK_PORT', '9109'))
+# Публичный адрес (за reverse proxy), который передается hh.ru при подписке; пустой — подписки не трогаем
+HH_WEBHOOK_PUBLIC_URL = os.getenv('HH_WEBHOOK_PUBLIC_URL', '')
+HH_WEBHOOK_ACTIONS = [
+    action.strip() for action in os.getenv(
+        'HH_WEBHOOK_ACTIONS', 'NEW_NEGOTIATION_VACANCY,NEW_RESPONSE_OR_INVITATION_VACANCY,NEGOTIATION_EMPLOYER_STATE_CHANGE'
+    ).split(',') if action.strip()
+]
+# Сколько последних ID событий помнить для отсева повторных доставок
+DEDUP_CACHE_SIZE = 10000
+# Очередь событий к обработке; при переполнении отвечаем 503, hh.ru доставит повторно, а опрос подстрахует
+QUEUE_MAX_SIZE = 1000
+CONSUMER_WORKERS = int(os.getenv('HH_WEBHOOK_WORKERS', '4'))
+
+HH_WEBHOOK_EVENTS = metrics.Counter(
+    'hh_webhook_events_total', 'События webhook hh.ru по результату приема', ('action', 'result'))
+HH_WEBHOOK_LAG_SECONDS = metrics.Histogram(
+    'hh_webhook_event_lag_seconds', 'От приема события webhook до конца его обработки')
+HH_WEBHOOK_QUEUE = metrics.Gauge(
+    'hh_webhook_queue_depth', 'События webhook, ожидающие обработки',
+    collect=lambda: {(): _queue.qsize() if _queue is not None else 0})
+
+_seen_events = OrderedDict()
+_queued_negotiations = set()
+_queue = None
+
+
+def enabled() -> bool:
+    return bool(HH_WEBHOOK_TOKEN)
+
+
+def subscription_url() -> str:
+    return f"{HH_WEBHOOK_PUBLIC_URL.rstrip('/')}{HH_WEBHOOK_PATH}?token={HH_WEBHOOK_TOKEN}"
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=QUEUE_MAX_SIZE)
+    return _queue
+
+
+def _remember(event_id: str) -> bool:
+    """Запоминает ID события; False, если оно уже встречалось (повторная доставка)."""
+    if event_id in _seen_events:
+        _seen_events.move_to_end(event_id)
+        return False
+    _seen_events[event_id] = None
+    if len(_seen_events) > DEDUP_CACHE_SIZE:
+        _seen_events.popitem(last=False)
+    return True
+
+
+def _text(status: int, body: str) -> tuple:
+    return status, 'text/plain; charset=utf-8', body
+
+
+async def webhook_handler(request) -> tuple:
+    """
+    Прием уведомления hh.ru: {"id", "action_type", "user_id", "payload": {"topic_id" | "negotiation_id", ...}}.
+    Отвечаем сразу после постановки в очередь: сама обработка (запросы к hh.ru и БД) идет в consumer.
+    """
+    if not hmac.compare_digest(request.query.get('token', ''), HH_WEBHOOK_TOKEN):
+        HH_WEBHOOK_EVENTS.inc(action='', result='forbidden')
+        return _text(403, 'forbidden')
+    try:
+        event = json_codec.loads(request.body)
+        action = str(event.get('action_type') or '')
+        payload = event.get('payload') or {}
+        negotiation_id = str(payload.get('topic_id') or payload.get('negotiation_id') or '')
+        user_id = str(event.get('user_id') or payload.get('employer_manager_id') or '')
+    except (ValueError, AttributeError):
+        HH_WEBHOOK_EVENTS.inc(action='', result='invalid')
+        return _text(400, 'invalid json')
+    if not negotiation_id or not user_id:
+        # События без отклика (вакансии и т.п.) нам не нужны; 200, чтобы hh.ru не повторял доставку
+        HH_WEBHOOK_EVENTS.inc(action=action, result='ignored')
+        return _text(200, 'ignored')
+
+    event_id = str(event.get('id') or hashlib.sha1(request.body).hexdigest())
+    if not _remember(event_id):
+        HH_WEBHOOK_EVENTS.inc(action=action, result='duplicate')
+        return _text(200, 'duplicate')
+    if negotiation_id in _queued_negotiations:
+        # Отклик уже ждет обработки: она все равно заберет его актуальное состояние
+        HH_WEBHOOK_EVENTS.inc(action=action, result='coalesced')
+        return _text(202, 'queued')
+    try:
+        _get_queue().put_nowait((user_id, negotiation_id, action, time.monotonic()))
+    except asyncio.QueueFull:
+        _seen_events.pop(event_id, None)
+        HH_WEBHOOK_EVENTS.inc(action=action, result='overflow')
+        return _text(503, 'queue full')
+    _queued_negotiations.add(negotiation_id)
+    HH_WEBHOOK_EVENTS.inc(action=action, result='accepted')
+    return _text(202, 'queued')
+
+
+async def run_consumer(handle: Callable[[str, str, str], Awaitable[None]], workers: int = CONSUMER_WORKERS):
+    """Разбирает очередь событий: handle(user_id, negotiation_id, action) для каждого отклика."""
+    queue = _get_queue()
+
+    async def worker():
+        while True:
+            user_id, negotiation_id, action, received_at = await queue.get()
+            # Снимаем отметку до обработки: событие, пришедшее во время нее, снова попадет в очередь
+            _queued_negotiations.discard(negotiation_id)
+            try:
+                await handle(user_id, negotiation_id, action)
+            except Exception as e:
+                logger.error(f"Ошибка обработки события {action} по отклику {negotiation_id}: {e}", exc_info=True)
+            finally:
+                HH_WEBHOOK_LAG_SECONDS.observe(time.monotonic() - received_at)
+                queue.task_done()
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+ROUTES = {('POST', HH_WEBHOOK_PATH): webhook_handler}
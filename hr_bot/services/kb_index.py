@@ -0,0 +1,170 @@
+# hr_bot/services/kb_index.py
+
+import re
+import math
+import hashlib
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# --- КОНФИГУРАЦИЯ ПОИСКА ПО БАЗЕ ЗНАНИЙ ---
+# Сколько наиболее релевантных разделов добавлять к основным правилам
+KB_TOP_K = 4
+# Разделы, заголовок которых содержит одно из этих слов, отправляются в LLM всегда.
+# Основы сравниваются с началом слова, 'роль'/'роли' — целым словом, чтобы не совпадали 'контроль' и 'пароль'
+CORE_SECTION_PATTERN = re.compile(r'\b(?:правил|сценари|инструкц|рол[ьи]\b)')
+# Грубая оценка количества токенов: для русского текста ~3 символа на токен
+CHARS_PER_TOKEN = 3
+# Параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Для стемминга обрезаем слова до этой длины (окончания в русском языке меняются чаще всего)
+STEM_LENGTH = 6
+
+HEADING_PATTERN = re.compile(r'^#{1,6}\s+(.*)$')
+_WORD_PATTERN = re.compile(r'[а-яёa-z0-9]+')
+
+_index = None
+_index_hash = None
+
+_stats = {
+    'requests': 0,
+    'full_tokens': 0,
+    'sent_tokens': 0,
+}
+
+
+def _tokenize(text: str) -> list:
+    """Разбивает текст на слова и обрезает их до основы фиксированной длины."""
+    return [word[:STEM_LENGTH] for word in _WORD_PATTERN.findall(text.lower()) if len(word) > 1]
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def split_into_sections(text: str) -> tuple:
+    """
+    Делит документ на преамбулу и разделы по строкам-заголовкам ('# ...').
+    Возвращает (преамбула, [(заголовок, полный_текст_раздела), ...]).
+    """
+    preamble_lines = []
+    sections = []
+    current_heading, current_lines = None, []
+
+    for line in text.splitlines(keepends=True):
+        match = HEADING_PATTERN.match(line.strip())
+        if match:
+            if current_heading is not None:
+                sections.append((current_heading, ''.join(current_lines)))
+            current_heading, current_lines = match.group(1).strip(), [line]
+        elif current_heading is None:
+            preamble_lines.append(line)
+        else:
+            current_lines.append(line)
+
+    if current_heading is not None:
+        sections.append((current_heading, ''.join(current_lines)))
+
+    return ''.join(preamble_lines), sections
+
+
+class SectionIndex:
+    """Лексический индекс BM25 по разделам базы знаний."""
+
+    def __init__(self, text: str):
+        self.full_text = text
+        self.full_tokens = _estimate_tokens(text)
+        preamble, sections = split_into_sections(text)
+
+        self.core_parts = [preamble] if preamble.strip() else []
+        self.sections = []
+        for heading, body in sections:
+            if CORE_SECTION_PATTERN.search(heading.lower()):
+                self.core_parts.append(body)
+            else:
+                self.sections.append(body)
+
+        # Слова заголовка учитываем дважды: заголовок точнее описывает тему раздела
+        self.term_freqs = []
+        for body in self.sections:
+            heading_line = body.split('\n', 1)[0]
+            self.term_freqs.append(Counter(_tokenize(body) + _tokenize(heading_line)))
+        self.doc_lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+        doc_freqs = Counter()
+        for tf in self.term_freqs:
+            doc_freqs.update(tf.keys())
+        n_docs = len(self.sections)
+        self.idf = {
+            term: math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    def search(self, query: str, top_k: int) -> list:
+        """Возвращает индексы top_k разделов с наибольшим BM25 (только с ненулевой оценкой)."""
+        query_terms = set(_tokenize(query))
+        scores = []
+        for i, tf in enumerate(self.term_freqs):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[i] / (self.avg_doc_length or 1))
+            for term in query_terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(reverse=True)
+        return [i for _, i in scores[:top_k]]
+
+
+def get_index(text: str) -> SectionIndex:
+    """Возвращает индекс для текста, перестраивая его только при изменении документа."""
+    global _index, _index_hash
+
+    text_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    if _index is None or text_hash != _index_hash:
+        _index = SectionIndex(text)
+        _index_hash = text_hash
+        logger.info(
+            f"Индекс базы знаний перестроен: {len(_index.core_parts)} основных частей, "
+            f"{len(_index.sections)} разделов для поиска."
+        )
+    return _index
+
+
+def build_prompt(text: str, query: str, top_k: int = KB_TOP_K) -> str:
+    """
+    Собирает промпт из основных правил и top_k разделов, релевантных запросу.
+    Если в документе нет заголовков, возвращает его целиком.
+    """
+    index = get_index(text)
+    if not index.sections:
+        return text
+
+    selected = sorted(index.search(query, top_k))  # Сохраняем порядок разделов из документа
+    prompt = ''.join(index.core_parts + [index.sections[i] for i in selected])
+
+    sent_tokens = _estimate_tokens(prompt)
+    _stats['requests'] += 1
+    _stats['full_tokens'] += index.full_tokens
+    _stats['sent_tokens'] += sent_tokens
+    logger.debug(
+        f"База знаний: выбрано {len(selected)} из {len(index.sections)} разделов, "
+        f"~{sent_tokens} из ~{index.full_tokens} токенов."
+    )
+    return prompt
+
+
+def get_stats() -> dict:
+    """Возвращает суммарную экономию токенов промпта за время работы процесса."""
+    full, sent = _stats['full_tokens'], _stats['sent_tokens']
+    return {
+        'requests': _stats['requests'],
+        'full_tokens': full,
+        'sent_tokens': sent,
+        'saved_tokens': full - sent,
+        'saved_ratio': ((full - sent) / full) if full else 0.0,
+    }
@@ -1,7 +1,9 @@
+import os
+import json
 import time
+import asyncio
 import logging  # <--- ДОБАВЛЕНО
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from hr_bot.services import kb_index
 
 # --- ДОБАВЛЕНО: Получаем логгер для этого модуля ---
 logger = logging.getLogger(__name__)
@@ -11,61 +13,184 @@ DOCUMENT_ID = '1injke_YH-E2RRHL4PYvXk7kOWPk58-S0cPzLDnzeRnA'
 SCOPES = ['https://www.googleapis.com/auth/documents.readonly']
 SERVICE_ACCOUNT_FILE = 'credentials.json'
 
-# Время жизни кэша в секундах (5 минут)
-CACHE_TTL_SECONDS = 120 
+# Как часто фоновая задача проверяет, не изменился ли документ (в секундах)
+CACHE_TTL_SECONDS = 120
+
+# Файл с последней успешно загруженной версией промпта.
+# Позволяет стартовать мгновенно, даже если Google Docs недоступен.
+SNAPSHOT_FILE = os.getenv('KB_SNAPSHOT_FILE', 'knowledge_base_snapshot.json')
+
+FALLBACK_PROMPT = "Ты - Hr компании ВкусВилл. Проводишь первичный отбор кандидатов на hh"
 
 _cached_prompt = None
 _cache_timestamp = 0
+_cached_revision_id = None
+_docs_service = None
+# Снимок на диске проверяется на горячем пути не больше одного раза
+_snapshot_checked = False
 
-def get_system_prompt():
-    """
-    Читает весь текст из Google Doc и возвращает его как одну строку.
-    Кэширует результат на CACHE_TTL_SECONDS секунд.
-    """
-    global _cached_prompt, _cache_timestamp
+# Уровни заголовков Google Docs, которые размечаются как '#', '##', ... для деления на разделы
+HEADING_LEVELS = {
+    'TITLE': 1,
+    'HEADING_1': 1,
+    'HEADING_2': 2,
+    'HEADING_3': 3,
+    'HEADING_4': 4,
+    'HEADING_5': 5,
+    'HEADING_6': 6,
+}
 
-    is_cache_valid = _cached_prompt and (time.time() - _cache_timestamp < CACHE_TTL_SECONDS)
 
-    if is_cache_valid:
-        return _cached_prompt
+def _get_docs_service():
+    """Создает клиент Google Docs один раз и переиспользует его между обновлениями."""
+    global _docs_service
+    if _docs_service is None:
+        # Клиенты Google тяжелые и нужны только при обновлении базы знаний
+        from google.oauth2.service_account import Credentials
+        from googleapiclient.discovery import build
 
-    logger.debug("Кэш базы знаний устарел, обновляю из Google Docs...")
-    try:
         creds = Credentials.from_service_account_file(
             SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-        
-        service = build('docs', 'v1', credentials=creds)
-
-        document = service.documents().get(documentId=DOCUMENT_ID).execute()
-        content = document.get('body').get('content')
-        
-        text = ''
-        for value in content:
-            if 'paragraph' in value:
-                elements = value.get('paragraph').get('elements')
-                for elem in elements:
-                    text += elem.get('textRun', {}).get('content', '')
-        
-        logger.debug("База знаний из Google Docs успешно загружена.")
-        
+        _docs_service = build('docs', 'v1', credentials=creds, cache_discovery=False)
+    return _docs_service
+
+
+def _document_to_text(document: dict) -> str:
+    """Собирает текст документа, размечая заголовки для деления на разделы."""
+    text = ''
+    for value in document.get('body').get('content'):
+        if 'paragraph' in value:
+            paragraph = value.get('paragraph')
+            style = paragraph.get('paragraphStyle', {}).get('namedStyleType')
+            if style in HEADING_LEVELS:
+                text += '#' * HEADING_LEVELS[style] + ' '
+            for elem in paragraph.get('elements'):
+                text += elem.get('textRun', {}).get('content', '')
+    return text
+
+
+def _load_snapshot() -> bool:
+    """Загружает последнюю сохраненную версию промпта с диска."""
+    global _cached_prompt, _cached_revision_id, _cache_timestamp
+    try:
+        with open(SNAPSHOT_FILE, encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.error(f"Не удалось прочитать снимок базы знаний {SNAPSHOT_FILE}: {e}")
+        return False
+
+    if not snapshot.get('prompt'):
+        return False
+    _cached_prompt = snapshot['prompt']
+    _cached_revision_id = snapshot.get('revision_id')
+    _cache_timestamp = snapshot.get('saved_at', 0)
+    logger.info(f"База знаний загружена из снимка {SNAPSHOT_FILE} (ревизия {_cached_revision_id}).")
+    return True
+
+
+def _save_snapshot(prompt: str, revision_id: str | None):
+    """Атомарно сохраняет промпт на диск: пишем во временный файл и переименовываем."""
+    tmp_path = f"{SNAPSHOT_FILE}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'revision_id': revision_id, 'saved_at': time.time(), 'prompt': prompt}, f, ensure_ascii=False)
+        os.replace(tmp_path, SNAPSHOT_FILE)
+    except Exception as e:
+        logger.error(f"Не удалось сохранить снимок базы знаний: {e}")
+
+
+def refresh() -> bool:
+    """
+    Синхронно обновляет промпт из Google Docs.
+    Сначала запрашивает только revisionId и скачивает документ, лишь если он изменился.
+    Возвращает True, если промпт был обновлен.
+    """
+    global _cached_prompt, _cache_timestamp, _cached_revision_id
+
+    try:
+        documents = _get_docs_service().documents()
+        revision_id = documents.get(documentId=DOCUMENT_ID, fields='revisionId').execute().get('revisionId')
+
+        if _cached_prompt and revision_id and revision_id == _cached_revision_id:
+            _cache_timestamp = time.time()
+            logger.debug(f"База знаний не изменилась (ревизия {revision_id}), загрузка пропущена.")
+            return False
+
+        logger.debug("База знаний изменилась, загружаю документ из Google Docs...")
+        document = documents.get(documentId=DOCUMENT_ID).execute()
+        text = _document_to_text(document)
+        if not text.strip():
+            logger.warning("Google Doc вернул пустой текст, оставляю предыдущую версию промпта.")
+            return False
+
         _cached_prompt = text
+        _cached_revision_id = document.get('revisionId', revision_id)
         _cache_timestamp = time.time()
-        
-        return text
+        _save_snapshot(text, _cached_revision_id)
+        logger.info(f"База знаний из Google Docs обновлена (ревизия {_cached_revision_id}).")
+        return True
 
     except Exception as e:
         # Ошибки всегда должны иметь высокий уровень, чтобы их было видно
         logger.error(f"ОШИБКА при чтении Google Doc: {e}", exc_info=True)
-        
-        if _cached_prompt:
-            # Предупреждение о том, что мы используем старые данные - это важно
-            logger.warning("Возвращаю старую версию промпта из кэша.")
+        return False
+
+
+def get_system_prompt():
+    """
+    Возвращает текущий промпт базы знаний без сетевых запросов: вызывается на event loop в каждом ходе диалога.
+    Если документ еще не загружен, один раз пробует снимок на диске, иначе — резервный промпт.
+    Загрузкой документа занимаются только warm_up() при старте и фоновая refresh_loop.
+    """
+    global _snapshot_checked
+    if _cached_prompt:
+        return _cached_prompt
+
+    if not _snapshot_checked:
+        _snapshot_checked = True
+        if _load_snapshot():
             return _cached_prompt
-        
-        return "Ты - Hr компании ВкусВилл. Проводишь первичный отбор кандидатов на hh"
+
+    logger.warning("База знаний недоступна и снимка нет, использую резервный промпт.")
+    return FALLBACK_PROMPT
+
+
+def warm_up() -> str:
+    """
+    Первая загрузка при старте (синхронная, вызывать через asyncio.to_thread):
+    снимок с диска, а если его нет — документ из Google Docs.
+    """
+    global _snapshot_checked
+    _snapshot_checked = True
+    if not _cached_prompt and not _load_snapshot():
+        refresh()
+    return get_system_prompt()
+
+
+async def refresh_loop(interval_seconds: int = CACHE_TTL_SECONDS):
+    """Фоновая задача: периодически обновляет базу знаний в отдельном потоке, не блокируя event loop."""
+    if not _cached_prompt:
+        _load_snapshot()
+    while True:
+        await asyncio.to_thread(refresh)
+        await asyncio.sleep(interval_seconds)
+
+
+def get_relevant_prompt(system_prompt: str, query: str) -> str:
+    """
+    Возвращает основные правила и только те разделы базы знаний,
+    которые относятся к запросу (вакансия, город, последнее сообщение кандидата).
+    """
+    return kb_index.build_prompt(system_prompt, query)
 
 if __name__ == '__main__':
     # Для блоков ручного тестирования print - это нормально
+    refresh()
     prompt = get_system_prompt()
     print("\n--- Загруженный промпт (первые 300 символов) ---")
-    print(prompt[:300] + "...")
\ No newline at end of file
+    print(prompt[:300] + "...")
+    relevant = get_relevant_prompt(prompt, "Продавец-консультант Москва график работы")
+    print(f"\n--- Промпт для тестового запроса: {len(relevant)} из {len(prompt)} символов ---")
+    print(kb_index.get_stats())
@@ -1,40 +1,51 @@
 # hr_bot/services/llm_handler.py
 
 import os
-import json
+import time
 import logging
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
-import httpx
+from hr_bot.utils import metrics
+from hr_bot.utils import tracing
+from hr_bot.utils import json_codec
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
-# Загружаем настройки прокси из .env
-SQUID_PROXY_HOST = os.getenv("SQUID_PROXY_HOST", "38.180.203.212")
-SQUID_PROXY_PORT = os.getenv("SQUID_PROXY_PORT", "8787")
-SQUID_PROXY_USER = os.getenv("SQUID_PROXY_USER", "zabota")
-SQUID_PROXY_PASSWORD = os.getenv("SQUID_PROXY_PASSWORD", "zabota2000")
+# Клиенты создаются в init_client() при старте приложения, а не при импорте модуля:
+# импорт openai и настройка прокси не замедляют запуск процессов, которым LLM не нужен
+async_http_client = None
+client = None
 
-# Формируем URL прокси с аутентификацией
-proxy_url = (
-    f"http://{SQUID_PROXY_USER}:{SQUID_PROXY_PASSWORD}@"
-    f"{SQUID_PROXY_HOST}:{SQUID_PROXY_PORT}"
-)
 
-# Создаем асинхронный HTTP клиент с настройками прокси
-async_http_client = httpx.AsyncClient(
-    proxy=proxy_url,
-    timeout=30.0
-)
+def init_client():
+    """Создает HTTP-клиент с прокси и асинхронный клиент OpenAI (повторный вызов ничего не делает)."""
+    global async_http_client, client
+    if client is not None:
+        return client
 
-# Создаем АСИНХРОННЫЙ OpenAI клиент и передаем ему наш HTTP клиент
-client = AsyncOpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    http_client=async_http_client
-)
+    import httpx
+    from openai import AsyncOpenAI
 
-logger.info(f"Клиент OpenAI настроен на работу через прокси: {SQUID_PROXY_HOST}:{SQUID_PROXY_PORT}")
+    # Загружаем настройки прокси из .env
+    proxy_host = os.getenv("SQUID_PROXY_HOST", "38.180.203.212")
+    proxy_port = os.getenv("SQUID_PROXY_PORT", "8787")
+    proxy_user = os.getenv("SQUID_PROXY_USER", "zabota")
+    proxy_password = os.getenv("SQUID_PROXY_PASSWORD", "zabota2000")
+
+    # Создаем асинхронный HTTP клиент с настройками прокси
+    async_http_client = httpx.AsyncClient(
+        proxy=f"http://{proxy_user}:{proxy_password}@{proxy_host}:{proxy_port}",
+        timeout=30.0
+    )
+
+    # Создаем АСИНХРОННЫЙ OpenAI клиент и передаем ему наш HTTP клиент
+    client = AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=async_http_client
+    )
+
+    logger.info(f"Клиент OpenAI настроен на работу через прокси: {proxy_host}:{proxy_port}")
+    return client
 
 
 # --- БЛОК ИНСТРУКЦИЙ ДЛЯ OPENAI ---
@@ -90,23 +101,35 @@ async def get_bot_response(system_prompt: str, dialogue_history: list, user_mess
     messages.extend(dialogue_history)
     messages.append({"role": "user", "content": user_message})
 
+    started_at = time.monotonic()
+    response = None
     try:
         logger.info(f"Отправка запроса к LLM через прокси...")
         
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=messages,
-            temperature=0.3,
-            response_format={"type": "json_object"}
-        )
+        with tracing.span('llm.chat_completion', model="gpt-4-turbo", prompt_chars=len(full_system_prompt)) as llm_span:
+            response = await init_client().chat.completions.create(
+                model="gpt-4-turbo",
+                messages=messages,
+                temperature=0.3,
+                response_format={"type": "json_object"}
+            )
+            if llm_span is not None and response.usage:
+                llm_span.attrs['prompt_tokens'] = response.usage.prompt_tokens
+                llm_span.attrs['completion_tokens'] = response.usage.completion_tokens
+        metrics.LLM_REQUEST_SECONDS.observe(time.monotonic() - started_at, outcome='ok')
+        if response.usage:
+            metrics.LLM_TOKENS.inc(response.usage.prompt_tokens, kind='prompt')
+            metrics.LLM_TOKENS.inc(response.usage.completion_tokens, kind='completion')
         
         response_content = response.choices[0].message.content
         logger.info("Успешный ответ от LLM получен.")
         
-        parsed_response = json.loads(response_content)
+        parsed_response = json_codec.loads(response_content)
         return parsed_response
 
     except Exception as e:
+        if response is None:
+            metrics.LLM_REQUEST_SECONDS.observe(time.monotonic() - started_at, outcome='error')
         logger.critical(f"КРИТИЧЕСКАЯ ОШИБКА при запросе к OpenAI через прокси: {e}", exc_info=True)
         return {
             "response_text": "К сожалению, у меня возникла техническая проблема с AI-моделью. Попробуйте написать позже.",
@@ -115,10 +138,19 @@ async def get_bot_response(system_prompt: str, dialogue_history: list, user_mess
         }
 
 
+async def check_reachable():
+    """Проверка готовности: API OpenAI доступен через прокси и ключ действителен (без генерации текста)."""
+    await init_client().models.retrieve("gpt-4-turbo")
+
+
 async def cleanup():
     """
     Закрывает HTTP клиент при завершении работы приложения.
     Вызовите эту функцию в shutdown hook вашего приложения.
     """
+    global async_http_client, client
+    if async_http_client is None:
+        return
     await async_http_client.aclose()
+    async_http_client, client = None, None
     logger.info("🔒 HTTP клиент закрыт")
\ No newline at end of file
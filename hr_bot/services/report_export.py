@@ -0,0 +1,189 @@
+# hr_bot/services/report_export.py
+
+import io
+import os
+import csv
+import logging
+import zipfile
+import tempfile
+import datetime
+from sqlalchemy import select, func
+
+from hr_bot.db.models import SessionLocal, Statistic, Vacancy, Candidate, TrackedRecruiter
+from hr_bot.db.dialogue_archive import dialogues_with_archive
+from hr_bot.utils.formatters import mask_fio
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк за раз забирать из серверного курсора
+EXPORT_YIELD_PER = 2000
+# Ограничение Excel на число строк листа; при превышении данные продолжаются на следующем листе
+XLSX_MAX_ROWS = 1_048_576
+
+SUMMARY_COLUMNS = ['Вакансия', 'Город', 'Количество откликов', 'Начато диалогов', 'Прошли квалификацию']
+FUNNEL_SUMMARY_COLUMNS = ['Вакансия', 'Город', 'Диалогов', 'Новые', 'В процессе', 'Квалифицированы', 'Отказ', 'Нет ответа']
+FUNNEL_COLUMNS = [
+    'ID отклика', 'Вакансия', 'Город вакансии', 'Рекрутер', 'Кандидат', 'Статус', 'Состояние диалога',
+    'Создан', 'Последнее обновление', 'Возраст', 'Гражданство', 'Город кандидата', 'Готов приступить',
+]
+
+
+class _XlsxWriter:
+    """Потоковая запись в write-only книгу openpyxl: строки сразу уходят во временный файл."""
+    extension = 'xlsx'
+
+    def __init__(self, path: str):
+        from openpyxl import Workbook  # тяжелый импорт нужен только при построении отчета
+
+        self._path = path
+        self._workbook = Workbook(write_only=True)
+
+    def write_sheet(self, title: str, header: list, rows):
+        part, sheet, written = 1, None, XLSX_MAX_ROWS
+        for row in rows:
+            if written >= XLSX_MAX_ROWS:
+                sheet = self._workbook.create_sheet(title if part == 1 else f"{title} ({part})")
+                sheet.append(header)
+                part, written = part + 1, 1
+            sheet.append([_excel_value(value) for value in row])
+            written += 1
+        if sheet is None:
+            self._workbook.create_sheet(title).append(header)
+
+    def close(self):
+        self._workbook.save(self._path)
+
+
+class _CsvZipWriter:
+    """CSV-вариант: по файлу на лист внутри zip-архива, строки пишутся в архив по мере чтения."""
+    extension = 'zip'
+
+    def __init__(self, path: str):
+        self._zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def write_sheet(self, title: str, header: list, rows):
+        with self._zip.open(f"{title}.csv", 'w') as raw:
+            # utf-8-sig, чтобы Excel корректно открывал кириллицу
+            with io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as stream:
+                writer = csv.writer(stream, delimiter=';')
+                writer.writerow(header)
+                for row in rows:
+                    writer.writerow(row)
+
+    def close(self):
+        self._zip.close()
+
+
+def _excel_value(value):
+    # Excel не поддерживает даты с часовым поясом: переводим в локальное время без зоны
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def _stream(db, statement):
+    """Строки запроса через серверный курсор, по EXPORT_YIELD_PER за раз."""
+    return db.execute(statement.execution_options(stream_results=True, yield_per=EXPORT_YIELD_PER))
+
+
+def _date_bounds(date_from: datetime.date | None, date_to: datetime.date | None):
+    """Границы периода для timestamp-колонок: [начало date_from, начало дня после date_to)."""
+    start = datetime.datetime.combine(date_from, datetime.time.min).astimezone() if date_from else None
+    end = datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min).astimezone() if date_to else None
+    return start, end
+
+
+def _summary_rows(db, date_from, date_to):
+    statement = select(
+        Vacancy.title, Vacancy.city,
+        func.sum(Statistic.responses_count), func.sum(Statistic.started_dialogs_count), func.sum(Statistic.qualified_count),
+    ).join(Vacancy, Vacancy.id == Statistic.vacancy_id)
+    if date_from:
+        statement = statement.where(Statistic.date >= date_from)
+    if date_to:
+        statement = statement.where(Statistic.date <= date_to)
+    statement = statement.group_by(Vacancy.id, Vacancy.title, Vacancy.city).order_by(Vacancy.title)
+    for row in _stream(db, statement):
+        yield row
+
+
+def _dialogue_period_filters(dialogues, date_from, date_to) -> list:
+    start, end = _date_bounds(date_from, date_to)
+    filters = []
+    if start:
+        filters.append(dialogues.c.created_at >= start)
+    if end:
+        filters.append(dialogues.c.created_at < end)
+    return filters
+
+
+def _funnel_summary_rows(db, date_from, date_to):
+    # Воронка считается по живым и архивным диалогам: архивация не должна менять отчеты за прошлые периоды
+    dialogues = dialogues_with_archive()
+
+    def status_count(status):
+        return func.count(dialogues.c.id).filter(dialogues.c.status == status)
+
+    statement = select(
+        Vacancy.title, Vacancy.city, func.count(dialogues.c.id),
+        status_count('new'), status_count('in_progress'), status_count('qualified'),
+        status_count('rejected'), status_count('timed_out'),
+    ).join(Vacancy, Vacancy.id == dialogues.c.vacancy_id).where(
+        *_dialogue_period_filters(dialogues, date_from, date_to)
+    ).group_by(Vacancy.id, Vacancy.title, Vacancy.city).order_by(Vacancy.title)
+    for row in _stream(db, statement):
+        yield row
+
+
+def _funnel_rows(db, date_from, date_to):
+    dialogues = dialogues_with_archive()
+    statement = select(
+        dialogues.c.hh_response_id, Vacancy.title, Vacancy.city, TrackedRecruiter.name, Candidate.full_name,
+        dialogues.c.status, dialogues.c.dialogue_state, dialogues.c.created_at, dialogues.c.last_updated,
+        Candidate.age, Candidate.citizenship, Candidate.city, Candidate.readiness_to_start,
+    ).outerjoin(Vacancy, Vacancy.id == dialogues.c.vacancy_id).outerjoin(
+        Candidate, Candidate.id == dialogues.c.candidate_id
+    ).outerjoin(
+        TrackedRecruiter, TrackedRecruiter.id == dialogues.c.recruiter_id
+    ).where(*_dialogue_period_filters(dialogues, date_from, date_to)).order_by(dialogues.c.id)
+    for row in _stream(db, statement):
+        row = list(row)
+        row[4] = mask_fio(row[4])
+        yield row
+
+
+def build_report(date_from: datetime.date | None = None, date_to: datetime.date | None = None,
+                 fmt: str = 'xlsx', include_funnel: bool = True) -> str:
+    """
+    Строит отчет во временный файл и возвращает путь к нему (файл удаляет вызывающий код).
+    Синхронная функция: вызывать через asyncio.to_thread, чтобы не блокировать event loop.
+    Память не зависит от объема данных: строки читаются серверным курсором и сразу пишутся в файл.
+    """
+    writer_class = _CsvZipWriter if fmt == 'csv' else _XlsxWriter
+    fd, path = tempfile.mkstemp(prefix='hr_report_', suffix=f'.{writer_class.extension}')
+    os.close(fd)
+
+    db = SessionLocal()
+    writer = writer_class(path)
+    try:
+        writer.write_sheet('Сводка', SUMMARY_COLUMNS, _summary_rows(db, date_from, date_to))
+        if include_funnel:
+            writer.write_sheet('Воронка по вакансиям', FUNNEL_SUMMARY_COLUMNS, _funnel_summary_rows(db, date_from, date_to))
+            writer.write_sheet('Кандидаты', FUNNEL_COLUMNS, _funnel_rows(db, date_from, date_to))
+        writer.close()
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        db.close()
+    logger.info(f"Отчет за период {date_from or '...'} — {date_to or '...'} построен: {path}")
+    return path
+
+
+def report_filename(date_from: datetime.date | None, date_to: datetime.date | None, fmt: str = 'xlsx') -> str:
+    extension = _CsvZipWriter.extension if fmt == 'csv' else _XlsxWriter.extension
+    if not date_from and not date_to:
+        return f"hr_stats_all_time.{extension}"
+    if date_from == date_to:
+        return f"hr_stats_{date_from:%Y-%m-%d}.{extension}"
+    return f"hr_stats_{date_from or 'start'}_{date_to or 'now'}.{extension}"
@@ -0,0 +1,149 @@
+# hr_bot/services/worker_health.py
+
+import os
+import json
+import time
+import asyncio
+import logging
+
+from sqlalchemy import text
+
+from hr_bot.db.models import SessionLocal, TrackedRecruiter, get_engine
+from hr_bot.db.query_stats import pool_snapshot
+from hr_bot.services import hh_api_real as hh_api
+from hr_bot.services import llm_handler
+from hr_bot.utils import introspection
+
+logger = logging.getLogger(__name__)
+
+# Воркер жив, если последний цикл завершился не раньше, чем столько секунд назад
+LIVENESS_MAX_CYCLE_AGE_SECONDS = float(os.getenv('LIVENESS_MAX_CYCLE_AGE_SECONDS', '600'))
+# Результат проверок готовности кэшируется, чтобы частые пробы не нагружали БД, hh.ru и LLM
+READINESS_CACHE_SECONDS = 30
+READINESS_CHECK_TIMEOUT_SECONDS = 10
+# Максимум строк в отчете /debug/tracemalloc
+TRACEMALLOC_MAX_TOP = 500
+
+_started_at = time.monotonic()
+_last_cycle_finished_at = None
+_cycles_finished = 0
+_readiness_cache = None  # (time.monotonic(), ready, checks)
+
+
+def mark_cycle_finished():
+    """Вызывается воркером после каждого завершенного цикла."""
+    global _last_cycle_finished_at, _cycles_finished
+    _last_cycle_finished_at = time.monotonic()
+    _cycles_finished += 1
+
+
+def _json(status: int, payload: dict) -> tuple:
+    return status, 'application/json; charset=utf-8', json.dumps(payload, ensure_ascii=False, indent=2, default=str)
+
+
+async def healthz_handler(request) -> tuple:
+    """Liveness: последний цикл (или запуск, если циклов еще не было) не старше LIVENESS_MAX_CYCLE_AGE_SECONDS."""
+    reference = _last_cycle_finished_at or _started_at
+    age = time.monotonic() - reference
+    alive = age <= LIVENESS_MAX_CYCLE_AGE_SECONDS
+    return _json(200 if alive else 503, {
+        'alive': alive,
+        'cycles_finished': _cycles_finished,
+        'seconds_since_last_cycle': round(age, 1) if _last_cycle_finished_at else None,
+        'uptime_seconds': round(time.monotonic() - _started_at, 1),
+    })
+
+
+def _check_db_and_tokens() -> tuple:
+    """Синхронная часть проверок (в отдельном потоке): SELECT 1 и состояние токенов рекрутеров."""
+    db = SessionLocal()
+    try:
+        db.execute(text('SELECT 1'))
+        problems = []
+        for recruiter in db.query(TrackedRecruiter).all():
+            if not recruiter.refresh_token:
+                problems.append(f"{recruiter.name}: нет refresh_token")
+            elif not recruiter.access_token:
+                # access_token обнуляется, когда hh.ru отклонил обновление токена
+                problems.append(f"{recruiter.name}: access_token сброшен после неудачного обновления")
+        return problems
+    finally:
+        db.close()
+
+
+async def _run_check(coro) -> dict:
+    started_at = time.monotonic()
+    try:
+        detail = await asyncio.wait_for(coro, READINESS_CHECK_TIMEOUT_SECONDS)
+        return {'ok': True, 'detail': detail, 'seconds': round(time.monotonic() - started_at, 3)}
+    except Exception as e:
+        return {'ok': False, 'detail': f"{type(e).__name__}: {e}", 'seconds': round(time.monotonic() - started_at, 3)}
+
+
+async def _check_hh() -> str:
+    status = await hh_api.check_reachable()
+    if status >= 500:
+        raise ConnectionError(f"api.hh.ru ответил {status}")
+    return f"HTTP {status}"
+
+
+async def _check_llm() -> str:
+    await llm_handler.check_reachable()
+    return "ok"
+
+
+async def readyz_handler(request) -> tuple:
+    """Readiness: БД, hh.ru и LLM доступны, у всех рекрутеров рабочие токены."""
+    global _readiness_cache
+    if _readiness_cache and time.monotonic() - _readiness_cache[0] < READINESS_CACHE_SECONDS and 'fresh' not in request.query:
+        _, ready, checks = _readiness_cache
+    else:
+        db_check, hh_check, llm_check = await asyncio.gather(
+            _run_check(asyncio.to_thread(_check_db_and_tokens)), _run_check(_check_hh()), _run_check(_check_llm())
+        )
+        token_problems = db_check['detail'] if db_check['ok'] else None
+        checks = {
+            'db': {**db_check, 'detail': 'ok' if db_check['ok'] else db_check['detail']},
+            'hh_api': hh_check,
+            'llm': llm_check,
+            'tokens': {'ok': db_check['ok'] and not token_problems, 'detail': token_problems or ('ok' if db_check['ok'] else 'нет данных')},
+        }
+        ready = all(check['ok'] for check in checks.values())
+        _readiness_cache = (time.monotonic(), ready, checks)
+        if not ready:
+            logger.warning(f"Воркер не готов: {[name for name, check in checks.items() if not check['ok']]}")
+    return _json(200 if ready else 503, {'ready': ready, 'checks': checks})
+
+
+async def tasks_handler(request) -> tuple:
+    """Дамп задач asyncio со стеками и возрастом."""
+    return 200, 'text/plain; charset=utf-8', introspection.dump_tasks()
+
+
+async def pool_handler(request) -> tuple:
+    """Состояние пула соединений с БД и текущие владельцы соединений."""
+    return _json(200, pool_snapshot(get_engine()))
+
+
+async def tracemalloc_handler(request) -> tuple:
+    """/debug/tracemalloc?action=start|stop, без action — снимок; параметры top и group_by (lineno|filename|traceback)."""
+    group_by = request.query.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return 400, 'text/plain; charset=utf-8', "group_by: lineno, filename или traceback\n"
+    top = request.query.get('top', '20')
+    if not top.isdigit() or not 1 <= int(top) <= TRACEMALLOC_MAX_TOP:
+        return 400, 'text/plain; charset=utf-8', f"top: целое число от 1 до {TRACEMALLOC_MAX_TOP}\n"
+    report = await asyncio.to_thread(
+        introspection.tracemalloc_report,
+        request.query.get('action', 'snapshot'), int(top), group_by,
+    )
+    return 200, 'text/plain; charset=utf-8', report
+
+
+ROUTES = {
+    '/healthz': healthz_handler,
+    '/readyz': readyz_handler,
+    '/debug/tasks': tasks_handler,
+    '/debug/pool': pool_handler,
+    '/debug/tracemalloc': tracemalloc_handler,
+}
@@ -11,6 +11,7 @@ from aiogram.utils.formatting import Text, Bold, Italic, Code
 from hr_bot.db.models import TelegramUser, TrackedRecruiter, AppSettings
 # Убрали импорт TrackedVacancy, так как он больше не используется
 from hr_bot.tg_bot.filters import AdminFilter
+from hr_bot.tg_bot import role_cache
 from hr_bot.tg_bot.keyboards import (
     create_management_keyboard,
     role_choice_keyboard,
@@ -175,6 +176,7 @@ async def process_add_user_role(callback: CallbackQuery, state: FSMContext, db_s
     new_user = TelegramUser(telegram_id=user_data['user_id'], username=user_data['user_name'], role=role)
     db_session.add(new_user)
     db_session.commit()
+    role_cache.invalidate(user_data['user_id'])
     await state.clear()
     logger.info(f"Админ {callback.from_user.id} добавил пользователя {user_data['user_id']} с ролью {role}")
     content = Text("✅ ", Bold("Успех!"), " Пользователь ", Bold(user_data['user_name']), " добавлен с ролью ", Italic(role), ".")
@@ -208,6 +210,7 @@ async def process_del_user_id(message: Message, state: FSMContext, db_session: S
     deleted_id = user_to_delete.telegram_id
     db_session.delete(user_to_delete)
     db_session.commit()
+    role_cache.invalidate(deleted_id)
     await state.clear()
     logger.info(f"Админ {message.from_user.id} удалил пользователя {deleted_id}")
     content = Text("✅ Пользователь ", Bold(deleted_username), " (ID: ", Code(deleted_id), ") был удален.")
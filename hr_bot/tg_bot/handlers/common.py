@@ -1,27 +1,36 @@
 # hr_bot/tg_bot/handlers/common.py
 
+import os
+import asyncio
 import logging
-import io
-import pandas as pd
-from datetime import date
+from datetime import date, datetime, timedelta, timezone
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import CommandObject
 from aiogram.filters import CommandStart, Command
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 # --- ПРАВИЛЬНЫЙ ИМПОРТ: Убираем все лишнее, оставляем только конструктор ---
 from aiogram.utils.formatting import Text, Bold, Italic
-from hr_bot.db.models import TelegramUser, Statistic, Vacancy, AppSettings
+from hr_bot.db.models import Vacancy, AppSettings, ReplyLatency, TrackedRecruiter
+from hr_bot.db.statistics_manager import get_dashboard_stats
+from hr_bot.services import report_export
+from hr_bot.tg_bot import role_cache
 from hr_bot.tg_bot.keyboards import (
     user_keyboard, 
     admin_keyboard, 
     stats_period_keyboard, 
+    latency_period_keyboard,
     create_stats_export_keyboard
 )
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+# Отчеты строятся в отдельном потоке по одному: бот продолжает отвечать, а БД не получает
+# несколько тяжелых выгрузок одновременно
+_export_lock = asyncio.Lock()
+
 def _build_stats_content(stats_query, period_text: str) -> Text:
     """Собирает форматированный отчет с помощью конструктора aiogram."""
     if not stats_query:
@@ -52,15 +61,73 @@ def _build_stats_content(stats_query, period_text: str) -> Text:
     return Text(*content_parts)
 
 
+def _format_ms(value) -> str:
+    """Человекочитаемая длительность из миллисекунд."""
+    seconds = (value or 0) / 1000
+    if seconds < 90:
+        return f"{seconds:.0f} с"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.1f} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+
+def _latency_percentiles(db_session: Session, since: datetime, *group_columns):
+    """
+    p50/p95/p99 полной задержки ответа (от сообщения кандидата до ответа бота).
+    Считается в БД по reply_latencies с фильтром по индексированному replied_at,
+    поэтому запрос читает только строки выбранного периода.
+    """
+    query = db_session.query(
+        *group_columns,
+        func.count(ReplyLatency.id).label('replies'),
+        func.percentile_cont(0.5).within_group(ReplyLatency.total_ms).label('p50'),
+        func.percentile_cont(0.95).within_group(ReplyLatency.total_ms).label('p95'),
+        func.percentile_cont(0.99).within_group(ReplyLatency.total_ms).label('p99'),
+    ).filter(ReplyLatency.replied_at >= since)
+    if group_columns:
+        query = query.group_by(*group_columns).order_by(func.percentile_cont(0.95).within_group(ReplyLatency.total_ms).desc())
+    return query
+
+
+def _build_latency_content(db_session: Session, days: int) -> Text:
+    since = datetime.combine(date.today() - timedelta(days=days - 1), datetime.min.time()).astimezone(timezone.utc)
+    period_text = "за сегодня" if days == 1 else f"за {days} дней"
+
+    total = _latency_percentiles(db_session, since).one()
+    if not total.replies:
+        return Text("⏱ Ответов ", Italic(period_text), " пока нет.")
+
+    by_recruiter = _latency_percentiles(
+        db_session, since, ReplyLatency.recruiter_id, TrackedRecruiter.name
+    ).outerjoin(TrackedRecruiter, TrackedRecruiter.id == ReplyLatency.recruiter_id).all()
+    by_vacancy = _latency_percentiles(
+        db_session, since, ReplyLatency.vacancy_id, Vacancy.title
+    ).outerjoin(Vacancy, Vacancy.id == ReplyLatency.vacancy_id).all()
+
+    def line(row) -> list:
+        return [
+            "  p50 ", Bold(_format_ms(row.p50)), " · p95 ", Bold(_format_ms(row.p95)),
+            " · p99 ", Bold(_format_ms(row.p99)), f" (ответов: {row.replies})\n"
+        ]
+
+    content_parts = [Bold(f"⏱ Задержка ответа кандидату {period_text}"), "\n\n", Bold("Все ответы:"), "\n", *line(total)]
+    content_parts.extend(["\n", Bold("По рекрутерам:"), "\n"])
+    for row in by_recruiter:
+        content_parts.extend([row.name or f"ID {row.recruiter_id}", ":\n", *line(row)])
+    content_parts.extend(["\n", Bold("По вакансиям:"), "\n"])
+    for row in by_vacancy:
+        content_parts.extend([row.title or f"ID {row.vacancy_id}", ":\n", *line(row)])
+    return Text(*content_parts)
+
+
 @router.message(CommandStart())
 async def handle_start(message: Message, db_session: Session):
-    user_id = str(message.from_user.id)
-    user = db_session.query(TelegramUser).filter(TelegramUser.telegram_id == user_id).first()
-    if not user:
+    role = role_cache.get_role(db_session, message.from_user.id)
+    if not role:
         await message.answer("❌ У вас нет доступа к этому боту.")
         return
 
-    if user.role == 'admin':
+    if role == 'admin':
         keyboard = admin_keyboard
         role_name = "Администратор ✨"
     else:
@@ -79,7 +146,7 @@ async def handle_start(message: Message, db_session: Session):
 @router.message(F.text == "📊 Статистика")
 @router.message(Command("stats"))
 async def handle_stats_command(message: Message, db_session: Session):
-    if not db_session.query(TelegramUser).filter(TelegramUser.telegram_id == str(message.from_user.id)).first():
+    if not role_cache.get_role(db_session, message.from_user.id):
         return
     await message.answer("Выберите период для просмотра статистики:", reply_markup=stats_period_keyboard)
 
@@ -87,71 +154,103 @@ async def handle_stats_command(message: Message, db_session: Session):
 @router.callback_query(F.data == "stats_today")
 async def process_stats_today(callback: CallbackQuery, db_session: Session):
     today = date.today()
-    stats_query = db_session.query(
-        Vacancy.title,
-        func.sum(Statistic.responses_count).label('total_responses'),
-        func.sum(Statistic.started_dialogs_count).label('total_dialogs'),
-        func.sum(Statistic.qualified_count).label('total_qualified')
-    ).join(Statistic).filter(Statistic.date == today).group_by(Vacancy.title).all()
+    stats_query = get_dashboard_stats(db_session, 'today')
     content = _build_stats_content(stats_query, f"за {today.strftime('%d.%m.%Y')}")
     await callback.message.edit_text(**content.as_kwargs(), reply_markup=create_stats_export_keyboard(period="today"))
     await callback.answer()
 
 
+@router.callback_query(F.data == "stats_month")
+async def process_stats_month(callback: CallbackQuery, db_session: Session):
+    stats_query = get_dashboard_stats(db_session, 'month')
+    content = _build_stats_content(stats_query, f"за {date.today().strftime('%m.%Y')}")
+    await callback.message.edit_text(**content.as_kwargs(), reply_markup=create_stats_export_keyboard(period="month"))
+    await callback.answer()
+
+
 @router.callback_query(F.data == "stats_all_time")
 async def process_stats_all_time(callback: CallbackQuery, db_session: Session):
-    stats_query = db_session.query(
-        Vacancy.title,
-        func.sum(Statistic.responses_count).label('total_responses'),
-        func.sum(Statistic.started_dialogs_count).label('total_dialogs'),
-        func.sum(Statistic.qualified_count).label('total_qualified')
-    ).join(Statistic).group_by(Vacancy.title).all()
+    stats_query = get_dashboard_stats(db_session, 'all_time')
     content = _build_stats_content(stats_query, "за всё время")
     await callback.message.edit_text(**content.as_kwargs(), reply_markup=create_stats_export_keyboard(period="all_time"))
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("export_stats_"))
-async def export_stats_to_excel(callback: CallbackQuery, db_session: Session):
-    await callback.answer("Готовлю Excel-отчет...", show_alert=False)
-    period = callback.data.split("_")[-1]
+async def _send_report(message: Message, date_from: date | None, date_to: date | None, fmt: str):
+    """Строит отчет в отдельном потоке и отправляет файл; временный файл удаляется после отправки."""
+    if _export_lock.locked():
+        await message.answer("⏳ Предыдущий отчет еще готовится, этот будет построен следом.")
+    async with _export_lock:
+        path = await asyncio.to_thread(report_export.build_report, date_from, date_to, fmt)
+    try:
+        filename = report_export.report_filename(date_from, date_to, fmt)
+        # Конструктор Italic() сам позаботится об экранировании символов '_' в имени файла
+        content = Text("Ваш отчет ", Italic(filename))
+        await message.answer_document(FSInputFile(path, filename=filename), **content.as_kwargs())
+    finally:
+        os.remove(path)
+
+
+@router.callback_query(F.data.startswith("export_stats_") | F.data.startswith("export_csv_"))
+async def export_stats_to_excel(callback: CallbackQuery):
+    fmt = "csv" if callback.data.startswith("export_csv_") else "xlsx"
+    await callback.answer("Готовлю отчет...", show_alert=False)
+    period = callback.data.split("_", 2)[-1]
     today = date.today()
-    query_builder = db_session.query(
-        Vacancy.title.label('Вакансия'),
-        func.sum(Statistic.responses_count).label('Количество откликов'),
-        func.sum(Statistic.started_dialogs_count).label('Начато диалогов'),
-        func.sum(Statistic.qualified_count).label('Прошли квалификацию')
-    ).join(Statistic)
     if period == "today":
-        query_builder = query_builder.filter(Statistic.date == today)
-        filename = f"hr_stats_{today.strftime('%Y-%m-%d')}.xlsx"
+        date_from, date_to = today, today
+    elif period == "month":
+        date_from, date_to = today.replace(day=1), today
     else:
-        filename = "hr_stats_all_time.xlsx"
-    stats_data = query_builder.group_by(Vacancy.title).all()
-    if not stats_data:
-        await callback.message.answer("Нет данных для экспорта.")
+        date_from, date_to = None, None
+    await _send_report(callback.message, date_from, date_to, fmt)
+
+
+@router.message(Command("export"))
+async def handle_export_command(message: Message, command: CommandObject, db_session: Session):
+    """/export 2024-01-01 2024-03-31 [csv] — отчет со сводкой и воронкой кандидатов за произвольный период."""
+    if not role_cache.get_role(db_session, message.from_user.id):
         return
-    df = pd.DataFrame(stats_data)
-    output_buffer = io.BytesIO()
-    df.to_excel(output_buffer, index=False, sheet_name='Статистика')
-    output_buffer.seek(0)
-    file_to_send = BufferedInputFile(output_buffer.read(), filename=filename)
-    
-    # Конструктор Italic() сам позаботится об экранировании символов '_' в имени файла
-    content = Text("Ваш отчет ", Italic(filename))
-    await callback.message.answer_document(file_to_send, **content.as_kwargs())
+    args = (command.args or "").split()
+    fmt = "csv" if args and args[-1].lower() == "csv" else "xlsx"
+    dates = [a for a in args if a.lower() != "csv"]
+    try:
+        date_from = date.fromisoformat(dates[0]) if dates else None
+        date_to = date.fromisoformat(dates[1]) if len(dates) > 1 else (date_from and date.today())
+    except ValueError:
+        await message.answer("Формат: /export ГГГГ-ММ-ДД [ГГГГ-ММ-ДД] [csv]")
+        return
+    await _send_report(message, date_from, date_to, fmt)
+
+
+@router.message(F.text == "⏱ Задержки ответов")
+@router.message(Command("latency"))
+async def handle_latency_command(message: Message, db_session: Session):
+    if not role_cache.get_role(db_session, message.from_user.id):
+        return
+    await message.answer("Выберите период для отчета о задержках ответов:", reply_markup=latency_period_keyboard)
+
+
+@router.callback_query(F.data.startswith("latency_"))
+async def process_latency_report(callback: CallbackQuery, db_session: Session):
+    days = int(callback.data.split("_")[-1])
+    content = _build_latency_content(db_session, days)
+    await callback.message.edit_text(**content.as_kwargs(), reply_markup=latency_period_keyboard)
+    await callback.answer()
 
 
 @router.message(F.text == "❓ Помощь")
 @router.message(Command("help"))
 async def handle_help(message: Message, db_session: Session):
-    user = db_session.query(TelegramUser).filter(TelegramUser.telegram_id == str(message.from_user.id)).first()
-    if not user: return
-    if user.role == 'admin':
+    role = role_cache.get_role(db_session, message.from_user.id)
+    if not role: return
+    if role == 'admin':
         help_text = (
             "*Руководство для Администратора:*\n\n"
             "Кнопки на клавиатуре предоставляют доступ ко всему функционалу:\n"
-            "• *Статистика* - Просмотр статистики.\n"
+            "• *Статистика* - Просмотр статистики и выгрузка в Excel/CSV.\n"
+            "• */export ГГГГ-ММ-ДД ГГГГ-ММ-ДД [csv]* - Отчет с воронкой кандидатов за период.\n"
+            "• *Задержки ответов* - p50/p95/p99 времени ответа кандидатам по рекрутерам и вакансиям.\n"
             "• *Лимиты и Тариф* - Просмотр и управление лимитами.\n"
             "• *Управление пользователями* - Добавление/удаление пользователей бота.\n"
             "• *Управление вакансиями* - Добавление/удаление отслеживаемых вакансий hh.ru.\n"
@@ -161,7 +260,8 @@ async def handle_help(message: Message, db_session: Session):
         help_text = (
             "*Руководство для Пользователя:*\n\n"
             "• *Статистика* - Просмотр статистики за сегодня или за всё время.\n"
-            "• *Лимиты* - Просмотр оставшихся лимитов.\n\n"
+            "• *Лимиты* - Просмотр оставшихся лимитов.\n"
+            "• *Задержки ответов* - Время ответа кандидатам за выбранный период.\n\n"
             "Вам автоматически будут приходить уведомления о новых кандидатах."
         )
     # help_text безопасен, так как не содержит пользовательского ввода
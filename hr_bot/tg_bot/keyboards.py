@@ -14,7 +14,7 @@ from typing import List, Any
 user_keyboard = ReplyKeyboardMarkup(
     keyboard=[
         [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="⚙️ Лимиты")],
-        [KeyboardButton(text="❓ Помощь")]
+        [KeyboardButton(text="⏱ Задержки ответов"), KeyboardButton(text="❓ Помощь")]
     ],
     resize_keyboard=True
 )
@@ -25,7 +25,7 @@ admin_keyboard = ReplyKeyboardMarkup(
         [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="⚙️ Лимиты и Тариф")],
         [KeyboardButton(text="👤 Управление пользователями")],
         [KeyboardButton(text="👨‍💼 Управление рекрутерами")],
-        [KeyboardButton(text="❓ Помощь")]
+        [KeyboardButton(text="⏱ Задержки ответов"), KeyboardButton(text="❓ Помощь")]
     ],
     resize_keyboard=True,
     input_field_placeholder="Выберите действие:"
@@ -39,16 +39,31 @@ stats_period_keyboard = InlineKeyboardMarkup(
     inline_keyboard=[
         [
             InlineKeyboardButton(text="📊 За сегодня", callback_data="stats_today"),
+            InlineKeyboardButton(text="📆 За месяц", callback_data="stats_month"),
             InlineKeyboardButton(text="🗓️ За всё время", callback_data="stats_all_time")
         ]
     ]
 )
 
+# Клавиатура для выбора периода отчета о задержках ответов (callback_data: latency_<дней>)
+latency_period_keyboard = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(text="За сегодня", callback_data="latency_1"),
+            InlineKeyboardButton(text="7 дней", callback_data="latency_7"),
+            InlineKeyboardButton(text="30 дней", callback_data="latency_30")
+        ]
+    ]
+)
+
 def create_stats_export_keyboard(period: str) -> InlineKeyboardMarkup:
     """Создает клавиатуру для отчета со статистикой, включая кнопку для экспорта."""
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="📥 Выгрузить в Excel", callback_data=f"export_stats_{period}")]
+            [
+                InlineKeyboardButton(text="📥 Выгрузить в Excel", callback_data=f"export_stats_{period}"),
+                InlineKeyboardButton(text="📄 CSV", callback_data=f"export_csv_{period}")
+            ]
         ]
     )
 
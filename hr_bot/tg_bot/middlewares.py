@@ -4,6 +4,29 @@ from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 from sqlalchemy.orm import sessionmaker
 
+from hr_bot.db.query_stats import query_scope, current_scope
+
+class LazySession:
+    """
+    Сессия, которая создается при первом обращении. Обновления, обработчики которых
+    не ходят в БД (например, роль уже в кэше), не занимают соединение из пула.
+    """
+
+    def __init__(self, session_pool: sessionmaker):
+        self._session_pool = session_pool
+        self._session = None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._session_pool()
+        return getattr(self._session, name)
+
+    def release(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
 class DbSessionMiddleware(BaseMiddleware):
     def __init__(self, session_pool: sessionmaker):
         super().__init__()
@@ -15,6 +38,42 @@ class DbSessionMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        with self.session_pool() as session:
-            data["db_session"] = session
-            return await handler(event, data)
\ No newline at end of file
+        session = LazySession(self.session_pool)
+        data["db_session"] = session
+        try:
+            return await handler(event, data)
+        finally:
+            session.release()
+
+class QueryStatsMiddleware(BaseMiddleware):
+    """
+    Внешний middleware: считает SQL-запросы каждого обновления и предупреждает о повторяющихся запросах (N+1).
+    Область открывается до фильтров роутеров, поэтому в нее попадают и запросы фильтров (AdminFilter при промахе
+    кэша ролей). Имя обработчика область получает от QueryScopeNameMiddleware, когда он выбран;
+    обновления, которые не принял ни один обработчик, учитываются под типом события.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        with query_scope('tg_handler', type(event).__name__):
+            return await handler(event, data)
+
+
+class QueryScopeNameMiddleware(BaseMiddleware):
+    """Внутренний middleware: когда обработчик выбран, дает области учета запросов его имя."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        scope = current_scope()
+        handler_object = data.get("handler")
+        if scope is not None and scope.kind == 'tg_handler' and handler_object is not None:
+            scope.name = getattr(getattr(handler_object, "callback", None), "__name__", scope.name)
+        return await handler(event, data)
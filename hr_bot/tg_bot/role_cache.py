@@ -0,0 +1,43 @@
+# hr_bot/tg_bot/role_cache.py
+
+import os
+import time
+from collections import OrderedDict
+from sqlalchemy.orm import Session
+
+from hr_bot.db.models import TelegramUser
+
+# Сколько секунд роль пользователя считается актуальной. Изменения через админ-меню
+# сбрасывают кэш сразу, TTL нужен только для правок в БД в обход бота.
+ROLE_CACHE_TTL_SECONDS = float(os.getenv('ROLE_CACHE_TTL_SECONDS', '300'))
+# Сколько пользователей помнить: боту может написать кто угодно, и неизвестные тоже кэшируются
+ROLE_CACHE_MAX_SIZE = 10000
+
+# telegram_id -> (роль или None для неизвестного пользователя, время истечения по time.monotonic()),
+# в порядке последнего обращения: при переполнении вытесняются давно не писавшие
+_roles = OrderedDict()
+
+
+def get_role(db_session: Session, telegram_id) -> str | None:
+    """Роль пользователя ('admin', 'user') или None, если доступа нет. В БД идем только при промахе кэша."""
+    key = str(telegram_id)
+    cached = _roles.get(key)
+    if cached and cached[1] > time.monotonic():
+        _roles.move_to_end(key)
+        return cached[0]
+
+    user = db_session.query(TelegramUser.role).filter(TelegramUser.telegram_id == key).first()
+    role = user.role if user else None
+    _roles[key] = (role, time.monotonic() + ROLE_CACHE_TTL_SECONDS)
+    _roles.move_to_end(key)
+    if len(_roles) > ROLE_CACHE_MAX_SIZE:
+        _roles.popitem(last=False)
+    return role
+
+
+def invalidate(telegram_id=None):
+    """Сбрасывает роль одного пользователя или, без аргумента, весь кэш."""
+    if telegram_id is None:
+        _roles.clear()
+    else:
+        _roles.pop(str(telegram_id), None)
@@ -1,9 +1,23 @@
 # hr_bot/utils/api_logger.py
-import logging
 import os
+import random
+import logging
+from logging.handlers import TimedRotatingFileHandler
+
+from hr_bot.utils.logger_config import JsonFormatter, attach_queue_handler
+
+# Доля успешных запросов, для которых в лог пишутся тела запроса и ответа.
+# Для ответов с ошибкой (4xx/5xx) тела пишутся всегда.
+API_LOG_SAMPLE_RATE = float(os.getenv('API_LOG_SAMPLE_RATE', '0.05'))
+# Максимальная длина тела в логе
+API_LOG_MAX_BODY_CHARS = int(os.getenv('API_LOG_MAX_BODY_CHARS', '2000'))
+
+# Заголовки, значения которых никогда не должны попадать в лог
+REDACTED_HEADERS = {'authorization', 'cookie', 'set-cookie', 'proxy-authorization'}
+
 
 def setup_api_logger():
-    """Настраивает отдельный логгер для записи сырых API-запросов и ответов."""
+    """Настраивает отдельный логгер для записи сырых API-запросов и ответов (JSON, через фоновую очередь)."""
     log_dir = 'logs'
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
@@ -15,11 +29,54 @@ def setup_api_logger():
     if api_logger.hasHandlers():
         api_logger.handlers.clear()
 
-    formatter = logging.Formatter('%(asctime)s\n%(message)s\n' + '='*80)
-    
-    # Будем писать в файл test00.log. `mode='a'` означает 'append' - дописывать в конец.
-    file_handler = logging.FileHandler(os.path.join(log_dir, 'test00.log'), mode='a', encoding='utf-8')
-    file_handler.setFormatter(formatter)
-    
-    api_logger.addHandler(file_handler)
-    return api_logger
\ No newline at end of file
+    # Будем писать в файл test00.log с ежедневной ротацией.
+    file_handler = TimedRotatingFileHandler(
+        os.path.join(log_dir, 'test00.log'),
+        when='midnight',
+        interval=1,
+        backupCount=2,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    attach_queue_handler(api_logger, [file_handler])
+    return api_logger
+
+
+def redact_headers(headers) -> dict:
+    """Возвращает копию заголовков, в которой секреты заменены на '***'."""
+    return {
+        key: ('***' if key.lower() in REDACTED_HEADERS else value)
+        for key, value in dict(headers).items()
+    }
+
+
+def truncate(text: str | None, limit: int = API_LOG_MAX_BODY_CHARS) -> str | None:
+    if text is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [обрезано, всего {len(text)} символов]"
+
+
+def log_api_exchange(api_logger: logging.Logger, method: str, url: str, request_kwargs: dict, response, elapsed_seconds: float):
+    """
+    Пишет в сырой лог одну запись о запросе к API.
+    Тела запроса и ответа добавляются только для выборки запросов и для ошибок,
+    поэтому на горячем пути почти всегда нет декодирования и форматирования больших строк.
+    """
+    if not api_logger.isEnabledFor(logging.DEBUG):
+        return
+
+    entry = {
+        'method': method,
+        'url': url,
+        'params': request_kwargs.get('params'),
+        'status': response.status_code,
+        'elapsed_ms': round(elapsed_seconds * 1000, 1),
+    }
+    if response.status_code >= 400 or random.random() < API_LOG_SAMPLE_RATE:
+        entry['request_headers'] = redact_headers(request_kwargs.get('headers') or {})
+        entry['request_data'] = truncate(str(request_kwargs.get('data') or request_kwargs.get('json') or '')) or None
+        entry['response_headers'] = redact_headers(response.headers)
+        entry['response_body'] = truncate(response.text)
+
+    api_logger.debug("api_exchange", extra={'api': entry})
@@ -0,0 +1,120 @@
+# hr_bot/utils/http_server.py
+
+import asyncio
+import logging
+from urllib.parse import urlsplit, parse_qs
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Ограничения, чтобы локальный служебный сервер нельзя было завалить большим запросом
+MAX_HEADER_LINES = 100
+MAX_BODY_BYTES = 1024 * 1024
+READ_TIMEOUT_SECONDS = 10
+
+_STATUS_TEXT = {
+    200: 'OK', 202: 'Accepted', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class PayloadTooLarge(Exception):
+    """Тело запроса больше MAX_BODY_BYTES."""
+
+
+class Request:
+    """Разобранный HTTP-запрос, который получает обработчик маршрута."""
+    __slots__ = ('method', 'path', 'query', 'headers', 'body')
+
+    def __init__(self, method: str, path: str, query: dict, headers: dict, body: bytes):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+# Обработчик возвращает (код ответа, content-type, тело)
+Handler = Callable[[Request], Awaitable[tuple]]
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Request | None:
+    """Читает один запрос. Некорректный запрос — ValueError, слишком большое тело — PayloadTooLarge."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length') or 0)
+    if length < 0:
+        raise ValueError("negative content-length")
+    if length > MAX_BODY_BYTES:
+        raise PayloadTooLarge()
+    body = await reader.readexactly(length) if length else b''
+
+    parts = urlsplit(target)
+    query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    return Request(method.upper(), parts.path, query, headers, body)
+
+
+def _encode_response(status: int, content_type: str, body) -> bytes:
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, 'OK')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n"
+    )
+    return head.encode('latin-1') + body
+
+
+async def start_http_server(routes: dict, host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Запускает минимальный HTTP/1.1 сервер на event loop (одно соединение — один запрос).
+    routes: {'/path': handler} или {('POST', '/path'): handler}.
+    """
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                request = await asyncio.wait_for(_read_request(reader), READ_TIMEOUT_SECONDS)
+            except PayloadTooLarge:
+                writer.write(_encode_response(413, 'text/plain', 'payload too large'))
+                await writer.drain()
+                return
+            except ValueError:
+                # Битая строка запроса, нечисловой Content-Length, слишком длинная строка заголовка
+                writer.write(_encode_response(400, 'text/plain', 'bad request'))
+                await writer.drain()
+                return
+            if request is None:
+                return
+
+            handler = routes.get((request.method, request.path)) or routes.get(request.path)
+            if handler is None:
+                response = (404, 'text/plain', 'not found')
+            else:
+                try:
+                    response = await handler(request)
+                except Exception as e:
+                    logger.error(f"Ошибка в обработчике {request.path}: {e}", exc_info=True)
+                    response = (500, 'text/plain', 'internal error')
+            writer.write(_encode_response(*response))
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle_connection, host, port)
+    logger.info(f"HTTP-сервер запущен на {host}:{port}, маршруты: {', '.join(str(r) for r in routes)}")
+    return server
@@ -0,0 +1,86 @@
+# hr_bot/utils/introspection.py
+
+import io
+import time
+import asyncio
+import weakref
+import tracemalloc
+
+# Глубина стека задачи в дампе
+TASK_STACK_LIMIT = 20
+# Сколько кадров хранит tracemalloc для каждой аллокации (больше — точнее, но дороже)
+TRACEMALLOC_FRAMES = 10
+
+# Время создания задач asyncio (по time.monotonic()), заполняется фабрикой задач
+_task_created_at = weakref.WeakKeyDictionary()
+_started_at = time.monotonic()
+_last_snapshot = None
+
+
+def install_task_age_tracking(loop: asyncio.AbstractEventLoop):
+    """Ставит фабрику задач, которая запоминает время создания каждой задачи (для возраста в дампе)."""
+    previous_factory = loop.get_task_factory()
+
+    def factory(loop, coro, **kwargs):
+        if previous_factory is not None:
+            task = previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        _task_created_at[task] = time.monotonic()
+        return task
+
+    loop.set_task_factory(factory)
+
+
+def dump_tasks() -> str:
+    """Все незавершенные задачи event loop: имя, корутина, возраст и текущий стек, самые старые — первыми."""
+    now = time.monotonic()
+    tasks = sorted(
+        asyncio.all_tasks(),
+        key=lambda task: _task_created_at.get(task, _started_at),
+    )
+    out = io.StringIO()
+    out.write(f"Задач: {len(tasks)}\n\n")
+    for task in tasks:
+        coro = task.get_coro()
+        age = now - _task_created_at.get(task, _started_at)
+        out.write(f"=== {task.get_name()}  {getattr(coro, '__qualname__', coro)}  возраст {age:.1f} с\n")
+        task.print_stack(limit=TASK_STACK_LIMIT, file=out)
+        out.write('\n')
+    return out.getvalue()
+
+
+def tracemalloc_report(action: str = 'snapshot', top: int = 20, group_by: str = 'lineno') -> str:
+    """
+    action: 'start' — включить трассировку аллокаций, 'stop' — выключить,
+    'snapshot' — топ аллокаций и разница с предыдущим снимком (рост памяти между вызовами).
+    """
+    global _last_snapshot
+    if action == 'start':
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _last_snapshot = None
+        return "tracemalloc включен. Повторите запрос без action, чтобы получить снимок.\n"
+    if action == 'stop':
+        tracemalloc.stop()
+        _last_snapshot = None
+        return "tracemalloc выключен.\n"
+    if not tracemalloc.is_tracing():
+        return "tracemalloc выключен. Включите его запросом с action=start.\n"
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    out = io.StringIO()
+    out.write(f"Отслеживается: {current / 1024 / 1024:.1f} МБ, пик {peak / 1024 / 1024:.1f} МБ\n\n")
+    out.write(f"Топ {top} по {group_by}:\n")
+    for stat in snapshot.statistics(group_by)[:top]:
+        out.write(f"{stat}\n")
+    if _last_snapshot is not None:
+        out.write(f"\nРост с предыдущего снимка, топ {top}:\n")
+        for stat in snapshot.compare_to(_last_snapshot, group_by)[:top]:
+            out.write(f"{stat}\n")
+    _last_snapshot = snapshot
+    return out.getvalue()
@@ -0,0 +1,46 @@
+# hr_bot/utils/json_codec.py
+
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 'orjson' (по умолчанию, если пакет установлен) или 'json' — принудительно стандартная библиотека
+JSON_CODEC = os.getenv('JSON_CODEC', 'orjson').lower()
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if JSON_CODEC == 'orjson' and orjson is not None:
+    BACKEND = 'orjson'
+    # Ключи-числа в словарях допускаются, как в стандартном json
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(data):
+        # orjson.JSONDecodeError наследует json.JSONDecodeError: обработчики ошибок не меняются
+        return orjson.loads(data)
+else:
+    BACKEND = 'json'
+
+    def dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+    def loads(data):
+        return json.loads(data)
+
+
+def response_json(response):
+    """Тело HTTP-ответа httpx как JSON через выбранный кодек (вместо response.json())."""
+    return loads(response.content)
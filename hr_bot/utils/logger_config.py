@@ -1,13 +1,93 @@
 # hr_bot/utils/logger_config.py
 
+import json
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import atexit
+import queue
+import datetime
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 import os
 import sys
 
+# Формат консольного вывода: 'text' (удобно читать в journalctl) или 'json'
+LOG_CONSOLE_FORMAT = os.getenv('LOG_CONSOLE_FORMAT', 'text')
+
+# Стандартные атрибуты LogRecord — все остальное считается полями, переданными через extra=
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Имя логгера -> (обработчик-очередь, слушатель): повторная настройка логгера заменяет прежнюю пару
+_listeners = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON; поля из extra= попадают в объект как есть."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler, который не форматирует запись в вызывающем потоке.
+    Очередь работает внутри процесса, поэтому запись не нужно готовить к pickle:
+    форматирование и запись на диск целиком выполняет фоновый QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def attach_queue_handler(target_logger: logging.Logger, handlers: list) -> QueueListener:
+    """
+    Подключает к логгеру очередь, а реальные обработчики — к фоновому слушателю.
+    Event loop только кладет запись в очередь и никогда не ждет диска.
+    При повторном вызове для того же логгера прежний слушатель останавливается (дописав очередь),
+    а его обработчики закрываются: фоновый поток и открытые файлы не накапливаются.
+    """
+    _detach_queue_handler(target_logger)
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    target_logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners[target_logger.name] = (queue_handler, listener)
+    return listener
+
+
+def _detach_queue_handler(target_logger: logging.Logger):
+    previous = _listeners.pop(target_logger.name, None)
+    if previous is None:
+        return
+    queue_handler, listener = previous
+    target_logger.removeHandler(queue_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+@atexit.register
+def stop_logging():
+    """Дописывает оставшиеся в очередях записи при завершении процесса."""
+    while _listeners:
+        _, (_, listener) = _listeners.popitem()
+        listener.stop()
+
+
 def setup_logging(log_filename: str):
     """
     Настраивает логирование в консоль и в указанный файл с ежедневной ротацией.
+    Обработчики работают в фоновом потоке через очередь; в файл пишется JSON по строке на запись.
 
     :param log_filename: Имя файла для сохранения логов (например, 'telegram_bot.log').
     """
@@ -18,7 +98,8 @@ def setup_logging(log_filename: str):
 
     # Определяем формат сообщений
     log_format = "%(asctime)s - %(name)s - [%(levelname)s] - %(message)s"
-    formatter = logging.Formatter(log_format)
+    text_formatter = logging.Formatter(log_format)
+    json_formatter = JsonFormatter()
 
     # Настраиваем корневой логгер
     root_logger = logging.getLogger()
@@ -30,8 +111,8 @@ def setup_logging(log_filename: str):
 
     # Обработчик для вывода в консоль (stdout)
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    
+    console_handler.setFormatter(json_formatter if LOG_CONSOLE_FORMAT == 'json' else text_formatter)
+
     # Обработчик для записи в файл с ротацией
     file_handler = TimedRotatingFileHandler(
         os.path.join(log_dir, log_filename),
@@ -40,13 +121,12 @@ def setup_logging(log_filename: str):
         backupCount=4,
         encoding='utf-8'
     )
-    file_handler.setFormatter(formatter)
+    file_handler.setFormatter(json_formatter)
 
-    # Добавляем оба обработчика к корневому логгеру
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
+    # Оба обработчика работают в фоновом потоке слушателя очереди
+    attach_queue_handler(root_logger, [console_handler, file_handler])
 
     # Устанавливаем уровень INFO для "шумных" библиотек, чтобы не засорять логи
     logging.getLogger('aiogram').setLevel(logging.INFO)
     logging.getLogger('httpx').setLevel(logging.WARNING) # Логи httpx могут быть слишком подробными
-    logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.WARNING)
\ No newline at end of file
+    logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.WARNING)
@@ -0,0 +1,154 @@
+# hr_bot/utils/metrics.py
+
+import re
+import time
+import bisect
+from contextlib import contextmanager
+from typing import Callable
+
+# Минимальная реализация метрик в текстовом формате Prometheus без внешних зависимостей.
+# Запись метрики — это поиск в словаре и сложение, поэтому ее можно вызывать на горячем пути.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CYCLE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+_registry = []
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Значение либо выставляется через set(), либо вычисляется при каждом запросе /metrics через collect."""
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), collect: Callable[[], dict] | None = None):
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def replace_all(self, values: dict):
+        """Заменяет все серии разом: {(значения_меток,): значение}."""
+        self._values = {tuple(str(v) for v in key): value for key, value in values.items()}
+
+    def render(self) -> list:
+        if self._collect is not None:
+            self.replace_all(self._collect())
+        return super().render()
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            # [счетчики по корзинам..., +Inf], сумма
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started_at, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render_all() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+async def metrics_handler(request) -> tuple:
+    """Обработчик GET /metrics для hr_bot.utils.http_server."""
+    return 200, 'text/plain; version=0.0.4; charset=utf-8', render_all()
+
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def normalize_endpoint(url: str) -> str:
+    """Превращает URL запроса в шаблон без идентификаторов: /negotiations/123/messages -> /negotiations/:id/messages."""
+    path = url.split('://', 1)[-1]
+    path = '/' + path.split('/', 1)[1] if '/' in path else '/'
+    return _ID_SEGMENT.sub('/:id', path.split('?', 1)[0])
+
+
+# --- МЕТРИКИ HH-ВОРКЕРА ---
+CYCLE_SECONDS = Histogram(
+    'hh_worker_cycle_seconds', 'Длительность полного цикла воркера', buckets=CYCLE_BUCKETS)
+STAGE_SECONDS = Histogram(
+    'hh_worker_stage_seconds', 'Длительность этапа цикла по рекрутеру', ('stage', 'recruiter'), buckets=CYCLE_BUCKETS)
+STAGE_OVERRUNS = Counter(
+    'hh_worker_stage_overruns_total', 'Этапы и ходы диалога, прерванные по превышению бюджета времени', ('stage',))
+DIALOGUE_TURN_SECONDS = Histogram(
+    'hh_worker_dialogue_turn_seconds', 'Длительность обработки одного хода диалога', ('recruiter', 'path'))
+HH_REQUEST_SECONDS = Histogram(
+    'hh_api_request_seconds', 'Задержка запросов к api.hh.ru', ('method', 'endpoint', 'status'))
+LLM_REQUEST_SECONDS = Histogram(
+    'llm_request_seconds', 'Задержка запросов к LLM', ('outcome',))
+LLM_TOKENS = Counter(
+    'llm_tokens_total', 'Токены, израсходованные на запросы к LLM', ('kind',))
+DIALOGUES_BY_STATE = Gauge(
+    'hh_worker_dialogues', 'Количество диалогов по статусу и состоянию', ('status', 'state'))
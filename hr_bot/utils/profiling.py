@@ -0,0 +1,163 @@
+# hr_bot/utils/profiling.py
+
+import os
+import sys
+import time
+import asyncio
+import cProfile
+import pstats
+import logging
+import datetime
+import threading
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# --- КОНФИГУРАЦИЯ ПРОФИЛИРОВАНИЯ ---
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+# Период снятия стеков основного потока для flame graph
+STACK_SAMPLE_INTERVAL_SECONDS = 0.005
+# Период проверки задержки event loop: насколько позже запланированного просыпается sleep()
+LOOP_LAG_INTERVAL_SECONDS = 0.1
+# Сколько строк pstats выводить в текстовый отчет
+PSTATS_TOP = 60
+
+
+class _StackSampler(threading.Thread):
+    """Периодически снимает стек основного потока и считает одинаковые стеки (формат collapsed stacks)."""
+
+    def __init__(self, thread_id: int):
+        super().__init__(name='profile-stack-sampler', daemon=True)
+        self._thread_id = thread_id
+        self._stop_event = threading.Event()
+        self.stacks = Counter()
+
+    def run(self):
+        while not self._stop_event.wait(STACK_SAMPLE_INTERVAL_SECONDS):
+            frame = sys._current_frames().get(self._thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1)
+
+
+class CycleProfiler:
+    """
+    Профилирование работающего воркера: cProfile основного потока, выборка стеков для flame graph,
+    задержка event loop и суммарное время жизни задач asyncio по имени корутины.
+    Включается start(), результаты пишутся в отдельный каталог при stop().
+    """
+
+    def __init__(self, out_dir: str = PROFILE_DIR):
+        self.out_dir = out_dir
+        self.active = False
+        self._profile = None
+        self._sampler = None
+        self._lag_task = None
+        self._lag_samples = []    # (время unix, задержка в мс)
+        self._task_times = defaultdict(list)  # имя корутины -> [время жизни задачи, с]
+        self._previous_task_factory = None
+        self._started_at = None
+
+    def start(self):
+        if self.active:
+            return
+        loop = asyncio.get_running_loop()
+        self.active = True
+        self._started_at = time.time()
+        self._lag_samples = []
+        self._task_times = defaultdict(list)
+
+        self._previous_task_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)
+        self._lag_task = loop.create_task(self._measure_loop_lag())
+
+        self._sampler = _StackSampler(threading.get_ident())
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        logger.info("Профилирование включено.")
+
+    def stop(self) -> str | None:
+        """Выключает профилирование и сохраняет результаты. Возвращает каталог с отчетом."""
+        if not self.active:
+            return None
+        self._profile.disable()
+        self._sampler.stop()
+        self._lag_task.cancel()
+        asyncio.get_running_loop().set_task_factory(self._previous_task_factory)
+        self.active = False
+
+        out_dir = self._write_results()
+        logger.info(f"Профилирование выключено, результаты сохранены в {out_dir}")
+        return out_dir
+
+    def toggle(self):
+        """Переключатель для сигнала: включает или выключает профилирование без перезапуска."""
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def _task_factory(self, loop, coro, **kwargs):
+        if self._previous_task_factory is not None:
+            task = self._previous_task_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        name = getattr(coro, '__qualname__', type(coro).__name__)
+        started_at = time.monotonic()
+        task.add_done_callback(lambda _: self._task_times[name].append(time.monotonic() - started_at))
+        return task
+
+    async def _measure_loop_lag(self):
+        while True:
+            expected = time.monotonic() + LOOP_LAG_INTERVAL_SECONDS
+            await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+            self._lag_samples.append((time.time(), max(0.0, (time.monotonic() - expected) * 1000)))
+
+    def _write_results(self) -> str:
+        stamp = datetime.datetime.fromtimestamp(self._started_at).strftime('%Y%m%d_%H%M%S')
+        out_dir = os.path.join(self.out_dir, f"hh_worker_{stamp}")
+        os.makedirs(out_dir, exist_ok=True)
+
+        # cProfile: бинарный дамп для snakeviz/pstats и текстовая сводка
+        self._profile.dump_stats(os.path.join(out_dir, 'cprofile.pstats'))
+        with open(os.path.join(out_dir, 'cprofile.txt'), 'w', encoding='utf-8') as f:
+            stats = pstats.Stats(self._profile, stream=f)
+            stats.sort_stats('cumulative').print_stats(PSTATS_TOP)
+            stats.sort_stats('tottime').print_stats(PSTATS_TOP)
+
+        # Collapsed stacks: flamegraph.pl stacks.collapsed > flame.svg или speedscope
+        with open(os.path.join(out_dir, 'stacks.collapsed'), 'w', encoding='utf-8') as f:
+            for stack, count in self._sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(os.path.join(out_dir, 'loop_lag.csv'), 'w', encoding='utf-8') as f:
+            f.write("timestamp,lag_ms\n")
+            for ts, lag_ms in self._lag_samples:
+                f.write(f"{ts:.3f},{lag_ms:.2f}\n")
+
+        with open(os.path.join(out_dir, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"Окно профилирования: {time.time() - self._started_at:.1f} с\n\n")
+            lags = sorted(lag for _, lag in self._lag_samples)
+            if lags:
+                f.write(
+                    f"Задержка event loop, мс: p50={lags[len(lags) // 2]:.1f} "
+                    f"p99={lags[min(len(lags) - 1, int(len(lags) * 0.99))]:.1f} max={lags[-1]:.1f} "
+                    f"(замеров: {len(lags)})\n\n"
+                )
+            f.write(f"{'Корутина':<60} {'задач':>7} {'всего, с':>10} {'сред., с':>10} {'макс., с':>10}\n")
+            rows = sorted(self._task_times.items(), key=lambda item: sum(item[1]), reverse=True)
+            for name, durations in rows:
+                f.write(
+                    f"{name[:60]:<60} {len(durations):>7} {sum(durations):>10.3f} "
+                    f"{sum(durations) / len(durations):>10.3f} {max(durations):>10.3f}\n"
+                )
+        return out_dir
@@ -1,10 +1,11 @@
 # hr_bot/utils/system_notifier.py
 import os
 import asyncio
-from aiogram import Bot
 from hr_bot.db.models import SessionLocal, TelegramUser
 
 async def send_system_alert(message_text: str):
+    # aiogram импортируется только при отправке: воркеру он нужен лишь для редких системных уведомлений
+    from aiogram import Bot
     bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"))
     db = SessionLocal()
     try:
@@ -0,0 +1,184 @@
+# hr_bot/utils/tracing.py
+
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# --- КОНФИГУРАЦИЯ ТРАССИРОВКИ ---
+# Доля ходов диалога, трассы которых экспортируются (решение принимается для корневого спана)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))
+# Локальный файл с трассами (по строке JSON на спан)
+TRACE_FILE = os.getenv('TRACE_FILE', os.path.join('logs', 'traces.jsonl'))
+# Если задан, трассы отправляются в OTLP/HTTP коллектор (например, http://localhost:4318) вместо файла
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'hh_worker')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attrs', 'start', 'start_mono', 'duration')
+
+    def __init__(self, trace: list, name: str, parent_id: str | None, attrs: dict):
+        self.trace = trace  # Общий список спанов трассы; trace[0] — корневой спан
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.start_mono = time.monotonic()
+        self.duration = None
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace[0].attrs['_trace_id']
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 2),
+            'attrs': {k: v for k, v in self.attrs.items() if not k.startswith('_')},
+        }
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """
+    Открывает корневой спан (например, один ход диалога). Если трасса не попала в выборку,
+    все вложенные span() ничего не делают и почти ничего не стоят.
+    """
+    if random.random() >= TRACE_SAMPLE_RATE:
+        token = _current_span.set(None)
+        try:
+            yield None
+        finally:
+            _current_span.reset(token)
+        return
+
+    trace = []
+    root = Span(trace, name, None, {'_trace_id': os.urandom(16).hex(), **attrs})
+    trace.append(root)
+    token = _current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.duration = time.monotonic() - root.start_mono
+        _current_span.reset(token)
+        _exporter.submit(trace)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Вложенный спан внутри текущей трассы; вне трассы — пустая операция."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(parent.trace, name, parent.span_id, attrs)
+    parent.trace.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.duration = time.monotonic() - child.start_mono
+        _current_span.reset(token)
+
+
+def set_attribute(key: str, value):
+    """Добавляет атрибут к текущему спану, если трасса активна."""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs[key] = value
+
+
+def _to_otlp(trace: list) -> dict:
+    def attr(key, value):
+        if isinstance(value, bool):
+            return {'key': key, 'value': {'boolValue': value}}
+        if isinstance(value, int):
+            return {'key': key, 'value': {'intValue': str(value)}}
+        if isinstance(value, float):
+            return {'key': key, 'value': {'doubleValue': value}}
+        return {'key': key, 'value': {'stringValue': str(value)}}
+
+    spans = []
+    for s in trace:
+        start_ns = int(s.start * 1e9)
+        item = {
+            'traceId': s.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': 1,
+            'startTimeUnixNano': str(start_ns),
+            'endTimeUnixNano': str(start_ns + int((s.duration or 0) * 1e9)),
+            'attributes': [attr(k, v) for k, v in s.attrs.items() if not k.startswith('_')],
+        }
+        if s.parent_id:
+            item['parentSpanId'] = s.parent_id
+        spans.append(item)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [attr('service.name', SERVICE_NAME)]},
+        'scopeSpans': [{'scope': {'name': 'hr_bot'}, 'spans': spans}],
+    }]}
+
+
+class _Exporter:
+    """Фоновый поток, который пишет завершенные трассы в файл или отправляет в OTLP-коллектор."""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, trace: list):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                    self._thread.start()
+        self._queue.put(trace)
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                return
+            try:
+                if OTLP_ENDPOINT:
+                    request = urllib.request.Request(
+                        f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces",
+                        data=json.dumps(_to_otlp(trace)).encode('utf-8'),
+                        headers={'Content-Type': 'application/json'},
+                    )
+                    urllib.request.urlopen(request, timeout=5).close()
+                else:
+                    os.makedirs(os.path.dirname(TRACE_FILE) or '.', exist_ok=True)
+                    with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+                        for s in trace:
+                            f.write(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + '\n')
+            except Exception as e:
+                logger.warning(f"Не удалось экспортировать трассу: {e}")
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+_exporter = _Exporter()
+atexit.register(_exporter.stop)
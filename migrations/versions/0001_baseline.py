@@ -0,0 +1,123 @@
+"""Исходная схема (как ее создавал Base.metadata.create_all до появления миграций)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'vacancies',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('hh_vacancy_id', sa.String(50), unique=True),
+        sa.Column('title', sa.String(255), nullable=False),
+        sa.Column('city', sa.String(100)),
+    )
+    op.create_index('ix_vacancies_id', 'vacancies', ['id'])
+
+    op.create_table(
+        'candidates',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('hh_resume_id', sa.String(50), unique=True),
+        sa.Column('full_name', sa.String(255)),
+        sa.Column('age', sa.Integer()),
+        sa.Column('citizenship', sa.String(100)),
+        sa.Column('phone_number', sa.String(50)),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('city', sa.String(255)),
+        sa.Column('readiness_to_start', sa.String(255)),
+    )
+    op.create_index('ix_candidates_id', 'candidates', ['id'])
+
+    op.create_table(
+        'tracked_recruiters',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('recruiter_id', sa.String(50), unique=True, nullable=False),
+        sa.Column('name', sa.String(100)),
+        sa.Column('refresh_token', sa.Text()),
+        sa.Column('access_token', sa.Text()),
+        sa.Column('token_expires_at', sa.DateTime(timezone=True)),
+    )
+    op.create_index('ix_tracked_recruiters_id', 'tracked_recruiters', ['id'])
+
+    op.create_table(
+        'dialogues',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('hh_response_id', sa.String(50), unique=True, nullable=False),
+        sa.Column('recruiter_id', sa.Integer(), sa.ForeignKey('tracked_recruiters.id')),
+        sa.Column('candidate_id', sa.Integer(), sa.ForeignKey('candidates.id')),
+        sa.Column('vacancy_id', sa.Integer(), sa.ForeignKey('vacancies.id')),
+        sa.Column('dialogue_state', sa.String(100)),
+        sa.Column('status', sa.String(50), nullable=False),
+        sa.Column('reminder_level', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('history', postgresql.JSONB()),
+        sa.Column('pending_messages', postgresql.JSONB()),
+        sa.Column('last_updated', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index('ix_dialogues_id', 'dialogues', ['id'])
+    op.create_index('ix_dialogues_last_updated', 'dialogues', ['last_updated'])
+
+    op.create_table(
+        'statistics',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('responses_count', sa.Integer()),
+        sa.Column('started_dialogs_count', sa.Integer()),
+        sa.Column('qualified_count', sa.Integer()),
+        sa.Column('vacancy_id', sa.Integer(), sa.ForeignKey('vacancies.id')),
+    )
+    op.create_index('ix_statistics_id', 'statistics', ['id'])
+
+    op.create_table(
+        'telegram_users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('telegram_id', sa.String(50), unique=True, nullable=False),
+        sa.Column('username', sa.String(100)),
+        sa.Column('role', sa.String(50), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index('ix_telegram_users_id', 'telegram_users', ['id'])
+
+    op.create_table(
+        'notification_queue',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('candidate_id', sa.Integer(), sa.ForeignKey('candidates.id'), nullable=False),
+        sa.Column('status', sa.String(50), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column('processed_at', sa.DateTime(timezone=True)),
+    )
+    op.create_index('ix_notification_queue_id', 'notification_queue', ['id'])
+
+    op.create_table(
+        'tracked_vacancies',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('vacancy_id', sa.String(50), unique=True, nullable=False),
+        sa.Column('title', sa.String(255)),
+    )
+    op.create_index('ix_tracked_vacancies_id', 'tracked_vacancies', ['id'])
+
+    op.create_table(
+        'app_settings',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('limit_total', sa.Integer(), nullable=False),
+        sa.Column('limit_used', sa.Integer(), nullable=False),
+        sa.Column('cost_per_response', sa.Numeric(10, 2), nullable=False),
+        sa.Column('low_limit_notified', sa.Boolean(), nullable=False),
+    )
+
+
+def downgrade():
+    for table in (
+        'app_settings', 'tracked_vacancies', 'notification_queue', 'telegram_users',
+        'statistics', 'dialogues', 'tracked_recruiters', 'candidates', 'vacancies',
+    ):
+        op.drop_table(table)
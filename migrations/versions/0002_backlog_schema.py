@@ -0,0 +1,97 @@
+"""Версия и дата создания диалога, замеры задержки ответов, свертки статистики
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Оптимистичная блокировка диалогов
+    op.add_column('dialogues', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+    # Дата создания диалога: для существующих строк лучшая оценка — время последнего обновления
+    op.add_column('dialogues', sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()))
+    op.execute("UPDATE dialogues SET created_at = COALESCE(last_updated, created_at)")
+    op.create_index('ix_dialogues_created_at', 'dialogues', ['created_at'])
+
+    op.create_table(
+        'reply_latencies',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('dialogue_id', sa.Integer(), nullable=False),
+        sa.Column('hh_response_id', sa.String(50), nullable=False),
+        sa.Column('recruiter_id', sa.Integer()),
+        sa.Column('vacancy_id', sa.Integer()),
+        sa.Column('path', sa.String(10), nullable=False),
+        sa.Column('message_created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('replied_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('detect_ms', sa.Integer()),
+        sa.Column('debounce_ms', sa.Integer()),
+        sa.Column('queue_ms', sa.Integer()),
+        sa.Column('llm_ms', sa.Integer()),
+        sa.Column('send_ms', sa.Integer()),
+        sa.Column('total_ms', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_reply_latencies_replied_at', 'reply_latencies', ['replied_at'])
+    op.create_index('ix_reply_latencies_recruiter_replied_at', 'reply_latencies', ['recruiter_id', 'replied_at'])
+    op.create_index('ix_reply_latencies_vacancy_replied_at', 'reply_latencies', ['vacancy_id', 'replied_at'])
+
+    op.create_index('ix_statistics_date', 'statistics', ['date'])
+
+    op.create_table(
+        'statistics_monthly',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('vacancy_id', sa.Integer(), sa.ForeignKey('vacancies.id'), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('responses_count', sa.Integer(), nullable=False),
+        sa.Column('started_dialogs_count', sa.Integer(), nullable=False),
+        sa.Column('qualified_count', sa.Integer(), nullable=False),
+        sa.UniqueConstraint('vacancy_id', 'month', name='uq_statistics_monthly_vacancy_month'),
+    )
+    op.create_index('ix_statistics_monthly_month', 'statistics_monthly', ['month'])
+
+    op.create_table(
+        'statistics_totals',
+        sa.Column('vacancy_id', sa.Integer(), sa.ForeignKey('vacancies.id'), primary_key=True),
+        sa.Column('responses_count', sa.Integer(), nullable=False),
+        sa.Column('started_dialogs_count', sa.Integer(), nullable=False),
+        sa.Column('qualified_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index('ix_statistics_totals_updated_at', 'statistics_totals', ['updated_at'])
+
+    # Первичное заполнение сверток из дневной статистики (то же делает statistics_manager.rebuild_rollups)
+    op.execute("""
+        INSERT INTO statistics_monthly (vacancy_id, month, responses_count, started_dialogs_count, qualified_count)
+        SELECT vacancy_id, date_trunc('month', date)::date,
+               COALESCE(SUM(responses_count), 0), COALESCE(SUM(started_dialogs_count), 0), COALESCE(SUM(qualified_count), 0)
+        FROM statistics
+        WHERE vacancy_id IS NOT NULL
+        GROUP BY vacancy_id, date_trunc('month', date)
+    """)
+    op.execute("""
+        INSERT INTO statistics_totals (vacancy_id, responses_count, started_dialogs_count, qualified_count, updated_at)
+        SELECT vacancy_id,
+               COALESCE(SUM(responses_count), 0), COALESCE(SUM(started_dialogs_count), 0), COALESCE(SUM(qualified_count), 0),
+               clock_timestamp()
+        FROM statistics
+        WHERE vacancy_id IS NOT NULL
+        GROUP BY vacancy_id
+    """)
+
+
+def downgrade():
+    op.drop_table('statistics_totals')
+    op.drop_table('statistics_monthly')
+    op.drop_index('ix_statistics_date', table_name='statistics')
+    op.drop_table('reply_latencies')
+    op.drop_index('ix_dialogues_created_at', table_name='dialogues')
+    op.drop_column('dialogues', 'created_at')
+    op.drop_column('dialogues', 'version')
@@ -0,0 +1,45 @@
+"""Индексы под горячие запросы воркера и бота
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+Индексы создаются CONCURRENTLY (вне транзакции), чтобы не блокировать запись в рабочей БД.
+Их назначение описано рядом с определениями в hr_bot/db/models.py; проверка планов — check_query_plans.py.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# (имя, таблица, колонки, условие частичного индекса)
+INDEXES = (
+    ('ix_dialogues_recruiter_status', 'dialogues', ['recruiter_id', 'status'], None),
+    ('ix_dialogues_reminders', 'dialogues', ['recruiter_id', 'reminder_level'], "status = 'in_progress'"),
+    ('ix_dialogues_pending', 'dialogues', ['recruiter_id'],
+     "jsonb_typeof(pending_messages) = 'array' AND pending_messages <> '[]'::jsonb"),
+    ('ix_dialogues_status_state', 'dialogues', ['status', 'dialogue_state'], None),
+    ('ix_dialogues_candidate_id', 'dialogues', ['candidate_id'], None),
+    ('ix_statistics_vacancy_date', 'statistics', ['vacancy_id', 'date'], None),
+    ('ix_notification_queue_pending', 'notification_queue', ['candidate_id'], "status = 'pending'"),
+)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns, if_not_exists=True, postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+            )
+    # Свежая статистика планировщика, чтобы новые индексы сразу использовались
+    op.execute("ANALYZE dialogues, statistics, notification_queue")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,44 @@
+"""Архив завершенных диалогов
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+Таблицу заполняет архиватор воркера (hr_bot/db/dialogue_archive.py), миграция данные не переносит.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'dialogues_archive',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('hh_response_id', sa.String(50), unique=True, nullable=False),
+        sa.Column('recruiter_id', sa.Integer()),
+        sa.Column('candidate_id', sa.Integer()),
+        sa.Column('vacancy_id', sa.Integer()),
+        sa.Column('dialogue_state', sa.String(100)),
+        sa.Column('status', sa.String(50), nullable=False),
+        sa.Column('reminder_level', sa.Integer(), nullable=False),
+        sa.Column('history_z', sa.LargeBinary()),
+        sa.Column('history_messages', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True)),
+        sa.Column('last_updated', sa.DateTime(timezone=True)),
+        sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    # История уже сжата zlib: повторное сжатие TOAST ничего не дает, храним как есть
+    op.execute("ALTER TABLE dialogues_archive ALTER COLUMN history_z SET STORAGE EXTERNAL")
+    op.create_index('ix_dialogues_archive_candidate_id', 'dialogues_archive', ['candidate_id'])
+    op.create_index('ix_dialogues_archive_created_at', 'dialogues_archive', ['created_at'])
+    op.create_index('ix_dialogues_archive_recruiter_status', 'dialogues_archive', ['recruiter_id', 'status'])
+    op.create_index('ix_dialogues_archive_vacancy_created_at', 'dialogues_archive', ['vacancy_id', 'created_at'])
+
+
+def downgrade():
+    op.drop_table('dialogues_archive')
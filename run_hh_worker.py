@@ -1,3 +1,5 @@
+import os
+import argparse
 import asyncio
 import time
 import logging
@@ -5,17 +7,32 @@ import random
 import datetime
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm.exc import StaleDataError
 
 # Импорты
 from hr_bot.utils.logger_config import setup_logging
-from hr_bot.db.models import SessionLocal, Dialogue, Candidate, Vacancy, NotificationQueue, TrackedRecruiter, AppSettings
+from hr_bot.db.models import SessionLocal, init_engine, Dialogue, Candidate, Vacancy, NotificationQueue, TrackedRecruiter, AppSettings, ReplyLatency
 from hr_bot.services import hh_api_real as hh_api
 from hr_bot.services import knowledge_base
+from hr_bot.services import kb_index
 from hr_bot.services import llm_handler
+from hr_bot.services import dialogue_rules
+from hr_bot.services.debounce_scheduler import DebounceScheduler
+from hr_bot.services import dialogue_executor
+from hr_bot.services import worker_health
+from hr_bot.services import hh_webhooks
+from hr_bot.services.hh_records import NegotiationRecord
 from hr_bot.db import statistics_manager
+from hr_bot.db import dialogue_archive
+from hr_bot.db.query_stats import query_scope
 from hr_bot.utils.pii_masker import extract_and_mask_pii
 from hr_bot.utils.system_notifier import send_system_alert
+from hr_bot.utils import metrics
+from hr_bot.utils import tracing
+from hr_bot.utils.http_server import start_http_server
+from hr_bot.utils.profiling import CycleProfiler, PROFILE_DIR
+from hr_bot.utils.introspection import install_task_age_tracking
 import signal
 import sys
 from hr_bot.services.llm_handler import cleanup
@@ -26,10 +43,91 @@ logger = logging.getLogger(__name__)
 DEBOUNCE_DELAY_SECONDS = 10
 CYCLE_PAUSE_SECONDS = 3
 TEST_NEGOTIATION_ID = None # Установите в None для боевого режима
+# Локальный служебный HTTP-эндпоинт: метрики Prometheus, /healthz, /readyz и /debug/* (0 — отключить)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+DIALOGUE_METRICS_INTERVAL_SECONDS = 60
+COMMIT_RETRIES = 3 # Попытки сохранить диалог при конфликте версий
+# Бюджеты времени (секунды) на этапы цикла одного рекрутера. Этап, не уложившийся в бюджет,
+# отменяется (незакоммиченная транзакция откатывается при закрытии сессии) и повторяется в следующем цикле.
+STAGE_TIMEOUTS = {
+    'vacancy_sync': 60,
+    'new_responses': 120,
+    'ongoing': 120,
+    'pending_dialogues': 15,
+    'reminders': 60,
+    'hh_webhook': 60,
+}
+# Бюджет на подготовку ответа в одном ходе диалога (LLM и перемещение отклика).
+# Отправка сообщения и сохранение результата не прерываются, чтобы не продублировать ответ.
+DIALOGUE_TURN_TIMEOUT_SECONDS = float(os.getenv('DIALOGUE_TURN_TIMEOUT_SECONDS', '90'))
+# При включенном приеме событий webhook hh.ru полное сканирование папок (и синхронизация вакансий)
+# остается страховкой и выполняется не чаще раза в столько секунд
+HH_POLL_FALLBACK_SECONDS = float(os.getenv('HH_POLL_FALLBACK_SECONDS', '600'))
+# Повтор прерванного хода: 30 с, 60 с, 120 с ... но не реже, чем раз в 10 минут
+TURN_RETRY_BASE_SECONDS = 30
+TURN_RETRY_MAX_SECONDS = 600
+# Сколько страниц каждой вакансии читают опросы папок ('Неразобранные' и 'Подумать'/'Собеседование').
+# Без приема событий webhook (по умолчанию) опрос идет каждый цикл, с ним — раз в HH_POLL_FALLBACK_SECONDS.
+# Принятые отклики уходят из 'Неразобранных', и следующие страницы доходят до первой в следующих циклах.
+# Обновления откликов в 'Подумать'/'Собеседование' дальше первых страниц опрос не замечает
+# (при включенном webhook их доставляют события hh.ru)
+NEW_RESPONSES_SCAN_PAGES = int(os.getenv('HH_NEW_RESPONSES_SCAN_PAGES', '1'))
+ONGOING_SCAN_PAGES = int(os.getenv('HH_ONGOING_SCAN_PAGES', '1'))
 
 # Флаг для graceful shutdown
 shutdown_requested = False
 
+# Таймеры debounce: диалог уходит в обработку ровно через DEBOUNCE_DELAY_SECONDS
+# после последнего сообщения кандидата. Создается в main().
+debounce_scheduler: DebounceScheduler | None = None
+# Общий лимит одновременных ходов диалогов с честной очередью между рекрутерами. Создается в main().
+dialogue_pool: dialogue_executor.DialogueExecutor | None = None
+
+_dialogue_metrics_refreshed_at = float('-inf')
+
+# dialogue_id -> число подряд прерванных по таймауту ходов (для экспоненциальной задержки повтора)
+_turn_timeouts = {}
+# Отклики, чтение сообщений которых было прервано: перечитываем их в следующем цикле,
+# даже если hh.ru уже не отдает для них has_updates
+_refetch_messages = set()
+# Время последнего полного сканирования папок рекрутера (по time.monotonic())
+_last_folder_scan = {}
+# Рекрутеры, для которых уже записано предупреждение об исчерпанном лимите (пишем один раз, а не каждый цикл)
+_limit_exhausted_logged = set()
+# Отклики архивных диалогов, о новых сообщениях в которых уже предупредили
+_archived_updates_logged = set()
+
+# Метрики, которые вычисляются в момент запроса /metrics
+QUEUE_DEPTH = metrics.Gauge(
+    'hh_worker_queue_depth', 'Диалоги, ожидающие таймера debounce (armed) и обрабатываемые сейчас (in_flight)',
+    ('queue',),
+    collect=lambda: {} if debounce_scheduler is None else {
+        ('armed',): debounce_scheduler.armed_count,
+        ('in_flight',): debounce_scheduler.in_flight_count,
+    },
+)
+DIALOGUE_QUEUE_DEPTH = metrics.Gauge(
+    'hh_worker_dialogue_queue_depth', 'Ходы диалогов, ожидающие свободного слота, по рекрутерам и приоритету',
+    ('recruiter_id', 'priority'),
+    collect=lambda: {} if dialogue_pool is None else dialogue_pool.queue_depths(),
+)
+DIALOGUE_RUNNING = metrics.Gauge(
+    'hh_worker_dialogue_running', 'Ходы диалогов, выполняющиеся сейчас, по рекрутерам',
+    ('recruiter_id',),
+    collect=lambda: {} if dialogue_pool is None else dialogue_pool.running_counts(),
+)
+FAST_PATH = metrics.Gauge(
+    'hh_worker_fast_path', 'Быстрый путь без LLM: попытки, попадания и оценка сэкономленных секунд',
+    ('kind',),
+    collect=lambda: {(key,): value for key, value in dialogue_rules.get_stats().items() if value is not None},
+)
+KB_PROMPT_TOKENS = metrics.Gauge(
+    'hh_worker_kb_prompt_tokens', 'Оценка токенов базы знаний: полный документ и фактически отправленные',
+    ('kind',),
+    collect=lambda: {(key,): value for key, value in kb_index.get_stats().items()},
+)
+
 def signal_handler(sig, frame):
     """Обработчик сигналов для graceful shutdown"""
     global shutdown_requested
@@ -49,21 +147,9 @@ async def get_all_active_vacancies_for_recruiter(recruiter: TrackedRecruiter, db
             return []
         employer_id = me_data['employer']['id']
 
-        all_vacancies_from_api = []
-        page = 0
-        while True:
-            vacancies_page = await hh_api._make_request(
-                recruiter, db, "GET", f"employers/{employer_id}/vacancies/active",
-                params={'page': page, 'per_page': 50}
-            )
-            if not vacancies_page or not vacancies_page.get('items'):
-                break
-            
-            all_vacancies_from_api.extend(vacancies_page['items'])
-            
-            if page >= vacancies_page.get('pages', 1) - 1:
-                break
-            page += 1
+        all_vacancies_from_api = [
+            vacancy async for vacancy in hh_api.iter_pages(recruiter, db, f"employers/{employer_id}/vacancies/active")
+        ]
         
         # --- НАЧАЛО НОВОЙ ЛОГИКИ СИНХРОНИЗАЦИИ ---
         if not all_vacancies_from_api:
@@ -108,6 +194,130 @@ async def get_all_active_vacancies_for_recruiter(recruiter: TrackedRecruiter, db
 
 # Замените вашу старую process_new_responses на эту:
 
+def _utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _parse_timestamp(value) -> datetime.datetime | None:
+    """Разбирает время из hh.ru ('2024-05-01T12:00:00+0300') или из pending_messages (isoformat)."""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    except ValueError:
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+
+
+def _pending_entry(message_id: str, content: str, created_at: str | None) -> dict:
+    """
+    Сообщение кандидата в pending_messages. created_at — время создания сообщения на hh.ru,
+    received_at — когда воркер его обнаружил; по ним считается задержка ответа.
+    """
+    return {
+        'message_id': message_id,
+        'role': 'user',
+        'content': content,
+        'created_at': created_at,
+        'received_at': _utc_now().isoformat(),
+    }
+
+
+async def _move_new_response(recruiter: TrackedRecruiter, db: Session, response_id: str):
+    """Переносит отклик с уже созданным диалогом в 'Подумать'; при ошибке повторим в следующем цикле."""
+    try:
+        await hh_api.move_response_to_folder(recruiter, db, response_id, 'consider')
+    except Exception:
+        logger.warning(f"Отклик {response_id} останется в 'Неразобранных' до следующего цикла.")
+
+
+async def _intake_response(db: Session, recruiter: TrackedRecruiter, recruiter_id: int, resp: NegotiationRecord) -> bool:
+    """
+    Создает диалог по новому отклику из 'Неразобранных' и ставит его в очередь на обработку.
+    Общий путь для периодического сканирования папок и для событий webhook hh.ru.
+    Возвращает True, если диалог создан (и израсходована единица лимита).
+    """
+    response_id = resp.id
+    if not response_id or (TEST_NEGOTIATION_ID and response_id != TEST_NEGOTIATION_ID):
+        return False
+    if db.query(Dialogue.id).filter_by(hh_response_id=response_id).first():
+        # Диалог уже создан, но отклик остался в 'Неразобранных' — прошлое перемещение
+        # было прервано или не удалось. Повторяем его.
+        await _move_new_response(recruiter, db, response_id)
+        return False
+    if dialogue_archive.is_archived(db, response_id):
+        # Диалог давно завершен и перенесен в архив: повторно отклик не обрабатываем
+        logger.debug(f"Отклик {response_id} уже в архиве диалогов. Пропускаем.")
+        return False
+
+    settings = db.query(AppSettings).filter_by(id=1).first()
+    if not settings or settings.limit_used >= settings.limit_total:
+        logger.warning(f"Лимиты исчерпаны. Отклик {response_id} не будет обработан.")
+        return False
+    if not resp.resume_id:
+        # Резюме скрыто или удалено кандидатом: создать кандидата не из чего
+        logger.warning(f"У отклика {response_id} нет доступного резюме. Пропускаем.")
+        return False
+    
+    # --- ИЗМЕНЕНИЕ №2: Полностью новая, надежная логика ---
+    associated_vacancy_id_str = resp.vacancy_id
+    logger.info(f"Найден новый отклик {response_id} от {resp.first_name} на вакансию ID {associated_vacancy_id_str}.")
+    
+    # Мы больше не пытаемся извлечь ID из отклика. Мы его уже знаем.
+    # Просто находим соответствующую вакансию в нашей базе данных.
+    vacancy_in_db = db.query(Vacancy).filter(Vacancy.hh_vacancy_id == associated_vacancy_id_str).first()
+
+    # Защитная проверка на случай, если вакансия не была синхронизирована ранее.
+    if not vacancy_in_db:
+        logger.error(
+            f"КРИТИЧЕСКАЯ ОШИБКА: Вакансия с hh_vacancy_id={associated_vacancy_id_str} не найдена в БД, "
+            f"хотя должна была быть создана ранее. Отклик {response_id} будет пропущен."
+        )
+        return False
+    # --- КОНЕЦ ИЗМЕНЕНИЙ ---
+
+    # Сначала все сетевые чтения: если этап прервут по таймауту здесь, в БД ничего не изменится
+    # и отклик будет взят заново в следующем цикле
+    messages_data = await hh_api.get_messages(recruiter, db, resp.messages_url)
+    messages = [_pending_entry(str(m.get('id')), m['text'], m.get('created_at')) for m in messages_data if m.get('text')]
+    if not messages:
+        messages = [_pending_entry(f'no_msg_{response_id}', "Кандидат откликнулся без сопроводительного письма.", resp.created_at)]
+
+    candidate = db.query(Candidate).filter(Candidate.hh_resume_id == resp.resume_id).first() or Candidate(hh_resume_id=resp.resume_id, full_name=resp.full_name)
+    db.add(candidate)
+    db.flush()
+    
+    dialogue = Dialogue(
+        hh_response_id=response_id, 
+        candidate_id=candidate.id, 
+        vacancy_id=vacancy_in_db.id,
+        recruiter_id=recruiter_id, # Используем ID из аргумента функции для 100% надежности
+        status='new', 
+        dialogue_state='initial_processing',
+        pending_messages=messages
+    )
+    db.add(dialogue)
+    
+    settings.limit_used += 1
+    logger.info(f"Лимит: {settings.limit_used}/{settings.limit_total}")
+    
+    # update_stats сам делает commit: диалог, лимит и статистика сохраняются одной транзакцией
+    statistics_manager.update_stats(db, vacancy_in_db.id, responses=1, started_dialogs=1)
+    db.commit()
+    _arm_debounce(dialogue.id, recruiter_id)
+    logger.info(f"Диалог {response_id} создан и поставлен в очередь на обработку.")
+
+    await _move_new_response(recruiter, db, response_id)
+    return True
+
+
+def _remaining_limit(db: Session) -> int:
+    settings = db.query(AppSettings).filter_by(id=1).first()
+    return max(0, settings.limit_total - settings.limit_used) if settings else 0
+
+
 async def process_new_responses(recruiter_id: int, vacancy_ids: list):
     """Этап 1: Ищет новые отклики по СПИСКУ вакансий."""
     db = SessionLocal()
@@ -121,69 +331,25 @@ async def process_new_responses(recruiter_id: int, vacancy_ids: list):
             logger.error("Этап 1: Нет активных вакансий для проверки 'Неразобранных'.")
             return
             
-        logger.debug(f"Этап 1: Проверка 'Неразобранных' для {len(vacancy_ids)} вакансий...")
-        # Теперь эта функция возвращает список пар: [(отклик_1, id_вакансии_1), (отклик_2, id_вакансии_1), ...]
-        new_responses_with_vacancy_ids = await hh_api.get_responses_from_folder(recruiter, db, 'response', vacancy_ids)
-
-        # --- ИЗМЕНЕНИЕ №1: Меняем цикл, чтобы он распаковывал пару ---
-        for resp, associated_vacancy_id_str in new_responses_with_vacancy_ids:
-            response_id = resp.get('id')
-            if not response_id or (TEST_NEGOTIATION_ID and response_id != TEST_NEGOTIATION_ID):
-                continue
-            if db.query(Dialogue).filter_by(hh_response_id=response_id).first():
-                continue
-
-            settings = db.query(AppSettings).filter_by(id=1).first()
-            if not settings or settings.limit_used >= settings.limit_total:
-                logger.warning(f"Лимиты исчерпаны. Отклик {response_id} не будет обработан.")
-                continue
-            
-            # --- ИЗМЕНЕНИЕ №2: Полностью новая, надежная логика ---
-            logger.info(f"Найден новый отклик {response_id} от {resp['resume']['first_name']} на вакансию ID {associated_vacancy_id_str}.")
-            
-            # Мы больше не пытаемся извлечь ID из отклика. Мы его уже знаем.
-            # Просто находим соответствующую вакансию в нашей базе данных.
-            vacancy_in_db = db.query(Vacancy).filter(Vacancy.hh_vacancy_id == associated_vacancy_id_str).first()
-
-            # Защитная проверка на случай, если вакансия не была синхронизирована ранее.
-            if not vacancy_in_db:
-                logger.error(
-                    f"КРИТИЧЕСКАЯ ОШИБКА: Вакансия с hh_vacancy_id={associated_vacancy_id_str} не найдена в БД, "
-                    f"хотя должна была быть создана ранее. Отклик {response_id} будет пропущен."
-                )
-                continue
-            # --- КОНЕЦ ИЗМЕНЕНИЙ ---
-
-            candidate = db.query(Candidate).filter(Candidate.hh_resume_id == resp['resume']['id']).first() or Candidate(hh_resume_id=resp['resume']['id'], full_name=f"{resp['resume']['first_name']} {resp['resume']['last_name']}")
-            db.add(candidate)
-            db.flush()
-            
-            dialogue = Dialogue(
-                hh_response_id=response_id, 
-                candidate_id=candidate.id, 
-                vacancy_id=vacancy_in_db.id,
-                recruiter_id=recruiter_id, # Используем ID из аргумента функции для 100% надежности
-                status='new', 
-                dialogue_state='initial_processing'
-            )
-            db.add(dialogue)
+        # Лимит проверяется до запросов к hh.ru: при исчерпанном лимите отклики все равно
+        # остались бы в 'Неразобранных', и каждый цикл перечитывал бы их заново
+        remaining = _remaining_limit(db)
+        if not remaining:
+            if recruiter_id not in _limit_exhausted_logged:
+                _limit_exhausted_logged.add(recruiter_id)
+                logger.warning(f"Этап 1: Лимиты исчерпаны, 'Неразобранные' рекрутера ID {recruiter_id} не проверяются.")
+            return
+        _limit_exhausted_logged.discard(recruiter_id)
 
-            await hh_api.move_response_to_folder(recruiter, db, response_id, 'consider')
-            
-            settings.limit_used += 1
-            logger.info(f"Лимит: {settings.limit_used}/{settings.limit_total}")
-            
-            statistics_manager.update_stats(db, vacancy_in_db.id, responses=1, started_dialogs=1)
-            
-            messages_data = await hh_api.get_messages(recruiter, db, resp['messages_url'])
-            messages = [{'message_id': str(m.get('id')), 'role': 'user', 'content': m['text']} for m in messages_data if m.get('text')]
-            if not messages:
-                messages = [{'message_id': f'no_msg_{response_id}', 'role': 'user', 'content': "Кандидат откликнулся без сопроводительного письма."}]
-            
-            dialogue.pending_messages = messages
-            dialogue.last_updated = func.now()
-            db.commit()
-            logger.info(f"Диалог {response_id} создан и поставлен в очередь на обработку.")
+        logger.debug(f"Этап 1: Проверка 'Неразобранных' для {len(vacancy_ids)} вакансий...")
+        # Отклики приходят по мере ответа hh.ru по каждой вакансии, у каждого уже известен ID вакансии.
+        # Перебор останавливается, как только израсходован остаток лимита
+        async for resp in hh_api.iter_responses_from_folders(
+                recruiter, db, ['response'], vacancy_ids, max_pages=NEW_RESPONSES_SCAN_PAGES):
+            if await _intake_response(db, recruiter, recruiter_id, resp):
+                remaining -= 1
+                if not remaining:
+                    break
     except Exception as e:
         logger.error(f"Ошибка в process_new_responses: {e}", exc_info=True)
         db.rollback()
@@ -191,6 +357,87 @@ async def process_new_responses(recruiter_id: int, vacancy_ids: list):
         db.close()
 
         
+def _append_pending_messages(db: Session, dialogue_id: int, all_messages_from_api: list) -> int:
+    """
+    Добавляет новые сообщения кандидата в pending_messages.
+    Строка перечитывается перед записью; при конфликте версий (диалог в этот момент
+    сохраняет обработчик ответа) попытка повторяется. Возвращает число добавленных сообщений.
+    """
+    for attempt in range(1, COMMIT_RETRIES + 1):
+        dialogue = db.get(Dialogue, dialogue_id, populate_existing=True)
+        if not dialogue:
+            return 0
+
+        saved_message_ids = {str(h.get('message_id')) for h in (dialogue.history or [])}
+        pending_message_ids = {str(p.get('message_id')) for p in (dialogue.pending_messages or []) if isinstance(p, dict)}
+        seen_ids = saved_message_ids.union(pending_message_ids)
+        
+        new_messages_for_pending = [
+            _pending_entry(str(msg.get('id')), msg['text'], msg.get('created_at'))
+            for msg in all_messages_from_api
+            if msg.get('text') and str(msg.get('id')) not in seen_ids and msg.get('author', {}).get('participant_type') == 'applicant'
+        ]
+        if not new_messages_for_pending:
+            db.commit()
+            return 0
+
+        if dialogue.reminder_level > 0:
+            dialogue.reminder_level = 0
+        dialogue.pending_messages = (dialogue.pending_messages or []) + new_messages_for_pending
+        dialogue.last_updated = func.now()
+        try:
+            db.commit()
+            return len(new_messages_for_pending)
+        except StaleDataError:
+            db.rollback()
+            logger.warning(f"Конфликт версий при добавлении сообщений в диалог {dialogue_id}, попытка {attempt}/{COMMIT_RETRIES}.")
+    return 0
+
+
+async def _refresh_dialogue_messages(db: Session, recruiter: TrackedRecruiter, recruiter_id: int, resp: NegotiationRecord):
+    """
+    Забирает сообщения отклика с обновлениями и добавляет новые реплики кандидата в диалог.
+    Общий путь для периодического сканирования папок и для событий webhook hh.ru.
+    """
+    response_id = resp.id
+    if not response_id or (TEST_NEGOTIATION_ID and response_id != TEST_NEGOTIATION_ID):
+        return
+
+    dialogue = db.query(Dialogue).filter_by(hh_response_id=response_id).first()
+    if not dialogue:
+        if dialogue_archive.is_archived(db, response_id):
+            # Кандидат пишет в диалог, который уже перенесен в архив (например, после квалификации):
+            # бот ему не ответит, поэтому событие должно быть видно в логах и метриках.
+            # Пока отклик висит с has_updates, опрос будет находить его каждый цикл — пишем один раз
+            dialogue_archive.ARCHIVED_DIALOGUE_UPDATES.inc()
+            if response_id not in _archived_updates_logged:
+                _archived_updates_logged.add(response_id)
+                logger.warning(
+                    f"Новые сообщения в отклике {response_id}, диалог которого уже в архиве. "
+                    f"Бот на них не отвечает, нужна ручная обработка рекрутером."
+                )
+        else:
+            logger.debug(f"Найдено обновление для отклика {response_id}, которого нет в нашей БД. Пропускаем.")
+        return
+
+    dialogue_id = dialogue.id
+    # Реплики кандидата, которые уже есть в диалоге: сообщения читаются с конца до первой из них
+    known_message_ids = {
+        str(m.get('message_id')) for m in (dialogue.history or []) + (dialogue.pending_messages or [])
+        if isinstance(m, dict) and m.get('message_id')
+    }
+    # Закрываем транзакцию на время сетевого запроса, чтобы не держать соединение из пула
+    db.commit()
+    _refetch_messages.add(response_id)
+    all_messages_from_api = await hh_api.get_messages(recruiter, db, resp.messages_url, stop_at_ids=known_message_ids)
+
+    added_count = _append_pending_messages(db, dialogue_id, all_messages_from_api)
+    _refetch_messages.discard(response_id)
+    if added_count:
+        _arm_debounce(dialogue_id, recruiter_id)
+        logger.info(f"Добавлено {added_count} новых сообщений в диалог {response_id}.")
+
+
 async def process_ongoing_responses(recruiter_id: int, vacancy_ids: list):
     """Этап 2: Ищет новые сообщения в папках 'Подумать' и 'Собеседование'."""
     db = SessionLocal()
@@ -199,57 +446,21 @@ async def process_ongoing_responses(recruiter_id: int, vacancy_ids: list):
         if not recruiter:
             logger.warning(f"process_ongoing_responses: Рекрутер с ID {recruiter_id} не найден.")
             return
+        # Отсоединяем рекрутера: после commit его атрибуты не будут перечитываться из БД
+        # (и занимать соединение) во время запросов к hh.ru
+        db.expunge(recruiter)
 
         if not vacancy_ids:
             logger.warning("Этап 2: Нет активных вакансий для проверки обновлений.")
             return
 
-        # --- НАЧАЛО ИЗМЕНЕНИЙ ---
         logger.debug(f"Этап 2: Проверка обновлений в папках 'Подумать' и 'Собеседование' для {len(vacancy_ids)} вакансий...")
-        
-        # Создаем асинхронные задачи для запроса откликов из обеих папок параллельно
-        consider_task = hh_api.get_responses_from_folder(recruiter, db, 'consider', vacancy_ids)
-        interview_task = hh_api.get_responses_from_folder(recruiter, db, 'interview', vacancy_ids)
-        
-        # Ожидаем завершения обеих задач и объединяем их результаты в один общий список
-        all_ongoing_responses = []
-        results = await asyncio.gather(consider_task, interview_task)
-        for result_list in results:
-            all_ongoing_responses.extend(result_list)
-        # --- КОНЕЦ ИЗМЕНЕНИЙ ---
-
-        # Распаковываем кортеж (отклик, id_вакансии) прямо в цикле for.
-        # Нам нужен только сам объект отклика, поэтому ID вакансии игнорируем (переменная `_`).
-        for resp, _ in all_ongoing_responses:
-            response_id = resp.get('id')
-            
-            if not response_id or (TEST_NEGOTIATION_ID and response_id != TEST_NEGOTIATION_ID) or not resp.get('has_updates'):
-                continue
 
-            dialogue = db.query(Dialogue).filter_by(hh_response_id=response_id).first()
-            if not dialogue:
-                logger.debug(f"Найдено обновление для отклика {response_id}, которого нет в нашей БД. Пропускаем.")
-                continue
-
-            all_messages_from_api = await hh_api.get_messages(recruiter, db, resp['messages_url'])
-            
-            saved_message_ids = {str(h.get('message_id')) for h in (dialogue.history or [])}
-            pending_message_ids = {str(p.get('message_id')) for p in (dialogue.pending_messages or []) if isinstance(p, dict)}
-            seen_ids = saved_message_ids.union(pending_message_ids)
-            
-            new_messages_for_pending = [
-                {'message_id': str(msg.get('id')), 'role': 'user', 'content': msg['text']}
-                for msg in all_messages_from_api
-                if msg.get('text') and str(msg.get('id')) not in seen_ids and msg.get('author', {}).get('participant_type') == 'applicant'
-            ]
-            
-            if new_messages_for_pending:
-                if dialogue.reminder_level > 0:
-                    dialogue.reminder_level = 0
-                dialogue.pending_messages = (dialogue.pending_messages or []) + new_messages_for_pending
-                dialogue.last_updated = func.now()
-                db.commit()
-                logger.info(f"Добавлено {len(new_messages_for_pending)} новых сообщений в диалог {response_id}.")
+        # Обе папки запрашиваются параллельно, отклики с обновлениями обрабатываются по мере прихода страниц
+        async for resp in hh_api.iter_responses_from_folders(
+                recruiter, db, ['consider', 'interview'], vacancy_ids, max_pages=ONGOING_SCAN_PAGES):
+            if resp.id and (resp.has_updates or resp.id in _refetch_messages):
+                await _refresh_dialogue_messages(db, recruiter, recruiter_id, resp)
                 
     except Exception as e:
         logger.error(f"Ошибка в process_ongoing_responses: {e}", exc_info=True)
@@ -257,163 +468,474 @@ async def process_ongoing_responses(recruiter_id: int, vacancy_ids: list):
     finally:
         db.close()
 
-async def _process_single_dialogue(dialogue_id: int, recruiter_id: int, system_prompt: str):
-    """Вспомогательная функция для обработки ОДНОГО диалога в своей сессии."""
+
+class DialogueSnapshot:
+    """Снимок диалога, с которым воркер работает без открытой сессии БД."""
+    __slots__ = (
+        'id', 'hh_response_id', 'version', 'status', 'dialogue_state',
+        'history', 'pending_messages', 'vacancy_title', 'vacancy_city', 'last_updated',
+    )
+
+    def __init__(self, dialogue: Dialogue):
+        self.id = dialogue.id
+        self.hh_response_id = dialogue.hh_response_id
+        self.version = dialogue.version
+        self.status = dialogue.status
+        self.dialogue_state = dialogue.dialogue_state
+        self.history = list(dialogue.history or [])
+        self.pending_messages = list(dialogue.pending_messages or [])
+        self.vacancy_title = dialogue.vacancy.title
+        self.vacancy_city = dialogue.vacancy.city
+        self.last_updated = dialogue.last_updated
+
+
+def _pending_key(pm) -> str:
+    """Ключ сообщения из pending_messages для слияния с сообщениями, пришедшими во время обработки."""
+    return str(pm.get('message_id')) if isinstance(pm, dict) else str(pm)
+
+
+def _load_dialogue_snapshot(dialogue_id: int, recruiter_id: int):
+    """
+    Фаза 1: короткая сессия. Читаем диалог и рекрутера и сразу возвращаем соединение в пул.
+    Рекрутер после закрытия сессии остается отсоединенным объектом с загруженными токенами.
+    """
     db = SessionLocal()
     try:
         dialogue = db.get(Dialogue, dialogue_id)
         recruiter = db.get(TrackedRecruiter, recruiter_id)
-
         if not dialogue or not recruiter:
+            return None, None
+        return DialogueSnapshot(dialogue), recruiter
+    finally:
+        db.close()
+
+
+def _commit_dialogue_turn(snapshot: DialogueSnapshot, turn: dict) -> bool:
+    """
+    Фаза 3: короткая сессия. Применяет результат хода к актуальной версии диалога.
+    Сообщения, добавленные в pending_messages во время обработки, сохраняются.
+    При конкурентной записи (StaleDataError) перечитывает строку и повторяет попытку.
+    """
+    for attempt in range(1, COMMIT_RETRIES + 1):
+        db = SessionLocal()
+        try:
+            dialogue = db.get(Dialogue, snapshot.id)
+            if not dialogue:
+                logger.error(f"Диалог {snapshot.hh_response_id} исчез из БД до сохранения результата.")
+                return False
+            if dialogue.version != snapshot.version:
+                logger.info(
+                    f"Диалог {snapshot.hh_response_id} изменился во время обработки "
+                    f"(версия {snapshot.version} -> {dialogue.version}), объединяю изменения."
+                )
+
+            candidate = dialogue.candidate
+            for field, value in turn['candidate_updates'].items():
+                setattr(candidate, field, value)
+
+            if dialogue.status == 'new':
+                dialogue.status = 'in_progress'
+
+            qualified_now = turn['qualified'] and dialogue.status != 'qualified'
+            if qualified_now:
+                dialogue.status = 'qualified'
+                if not db.query(NotificationQueue).filter_by(candidate_id=dialogue.candidate_id, status='pending').first():
+                    db.add(NotificationQueue(candidate_id=dialogue.candidate_id, status='pending'))
+            elif turn['rejected']:
+                dialogue.status = 'rejected'
+
+            # Оставляем в очереди только сообщения, которые пришли, пока мы ждали LLM и hh.ru
+            remaining_pending = [
+                pm for pm in (dialogue.pending_messages or [])
+                if _pending_key(pm) not in turn['processed_keys']
+            ]
+
+            dialogue.dialogue_state = turn['new_state']
+            dialogue.history = (dialogue.history or []) + turn['user_entries'] + [turn['bot_entry']]
+            dialogue.pending_messages = remaining_pending or None
+            dialogue.last_updated = func.now() # Используем func.now() для установки времени на стороне БД
+
+            if turn['latency']:
+                db.add(ReplyLatency(
+                    dialogue_id=dialogue.id,
+                    hh_response_id=dialogue.hh_response_id,
+                    recruiter_id=dialogue.recruiter_id,
+                    vacancy_id=dialogue.vacancy_id,
+                    **turn['latency']
+                ))
+
+            if qualified_now:
+                # update_stats сам делает commit, поэтому вызываем его последним
+                statistics_manager.update_stats(db, dialogue.vacancy_id, qualified=1)
+            db.commit()
+
+            if remaining_pending:
+                logger.info(f"Диалог {snapshot.hh_response_id}: {len(remaining_pending)} новых сообщений оставлены в очереди.")
+            return True
+
+        except StaleDataError:
+            db.rollback()
+            logger.warning(f"Конфликт версий при сохранении диалога {snapshot.hh_response_id}, попытка {attempt}/{COMMIT_RETRIES}.")
+        finally:
+            db.close()
+
+    logger.error(f"Не удалось сохранить результат диалога {snapshot.hh_response_id} после {COMMIT_RETRIES} попыток.")
+    return False
+
+
+def _remaining(deadline: float) -> float:
+    """Сколько секунд осталось до дедлайна по time.monotonic()."""
+    return max(0.0, deadline - time.monotonic())
+
+
+def _build_reply_latency(pending_messages: list, dispatched_at: datetime.datetime, turn_started_at: datetime.datetime,
+                         llm_seconds: float | None, send_seconds: float, replied_at: datetime.datetime, path: str) -> dict | None:
+    """
+    Раскладывает задержку ответа на составляющие. Отсчет ведется от самого раннего сообщения
+    кандидата в пачке: именно оно ждало ответа дольше всех. Для старых записей pending_messages
+    без времени создания замер не сохраняется.
+    """
+    timed = []
+    for pm in pending_messages:
+        if not isinstance(pm, dict):
+            continue
+        received_at = _parse_timestamp(pm.get('received_at'))
+        created_at = _parse_timestamp(pm.get('created_at')) or received_at
+        if created_at:
+            timed.append((created_at, received_at))
+    if not timed:
+        return None
+
+    def ms(delta: datetime.timedelta) -> int:
+        return max(0, round(delta.total_seconds() * 1000))
+
+    first_created_at, first_received_at = min(timed, key=lambda item: item[0])
+    received = [r for _, r in timed if r]
+    last_received_at = max(received) if received else None
+    return {
+        'path': path,
+        'message_created_at': first_created_at,
+        'replied_at': replied_at,
+        'detect_ms': ms(first_received_at - first_created_at) if first_received_at else None,
+        'debounce_ms': ms(dispatched_at - last_received_at) if last_received_at else None,
+        'queue_ms': ms(turn_started_at - dispatched_at),
+        'llm_ms': round(llm_seconds * 1000) if llm_seconds is not None else None,
+        'send_ms': round(send_seconds * 1000),
+        'total_ms': ms(replied_at - first_created_at),
+    }
+
+
+async def _process_single_dialogue(dialogue_id: int, recruiter_id: int, system_prompt: str,
+                                   dispatched_at: datetime.datetime | None = None):
+    """
+    Обрабатывает ОДИН диалог в три фазы, чтобы не держать соединение с БД во время сетевых запросов:
+    1) снимок диалога в короткой сессии; 2) LLM, пауза и отправка в hh.ru без сессии;
+    3) сохранение результата с проверкой версии и слиянием новых pending_messages.
+    """
+    turn_started_at = time.monotonic()
+    turn_deadline = turn_started_at + DIALOGUE_TURN_TIMEOUT_SECONDS
+    turn_started_wall = _utc_now()
+    dispatched_at = dispatched_at or turn_started_wall
+    try:
+        with tracing.span('load_snapshot'):
+            snapshot, recruiter = _load_dialogue_snapshot(dialogue_id, recruiter_id)
+        if not snapshot:
             logger.error(f"Не удалось найти диалог {dialogue_id} или рекрутера {recruiter_id} в БД.")
             return
+        tracing.set_attribute('hh_response_id', snapshot.hh_response_id)
+        tracing.set_attribute('pending_messages', len(snapshot.pending_messages))
+        if snapshot.last_updated:
+            # Сколько прошло от последнего сообщения кандидата до начала обработки (debounce + очередь)
+            waited = datetime.datetime.now(datetime.timezone.utc) - snapshot.last_updated
+            tracing.set_attribute('debounce_wait_ms', round(waited.total_seconds() * 1000))
 
-        logger.info(f"Начинаю обработку сообщений для диалога {dialogue.hh_response_id}...")
+        logger.info(f"Начинаю обработку сообщений для диалога {snapshot.hh_response_id}...")
         
-        pending_messages = dialogue.pending_messages or []
+        pending_messages = snapshot.pending_messages
         if not pending_messages:
-            logger.warning(f"Диалог {dialogue.id}: нет сообщений в pending_messages, обработка отменена.")
+            logger.warning(f"Диалог {snapshot.id}: нет сообщений в pending_messages, обработка отменена.")
             return
 
         # Шаг 1: Подготовка сообщений кандидата и маскирование PII
         user_entries_to_history = []
         all_masked_content = []
-        for pm in pending_messages:
-            original_content = pm.get('content', '') if isinstance(pm, dict) else str(pm)
-            masked_content, extracted_fio, extracted_phone = extract_and_mask_pii(original_content)
+        candidate_updates = {}
+        with tracing.span('pii_mask'):
+            for pm in pending_messages:
+                original_content = pm.get('content', '') if isinstance(pm, dict) else str(pm)
+                masked_content, extracted_fio, extracted_phone = extract_and_mask_pii(original_content)
             
-            # Если маскер извлек ФИО, мы ВСЕГДА его обновляем, так как оно более полное.
-            if extracted_fio:
-                dialogue.candidate.full_name = extracted_fio
+                # Если маскер извлек ФИО, мы ВСЕГДА его обновляем, так как оно более полное.
+                if extracted_fio:
+                    candidate_updates['full_name'] = extracted_fio
     
-            # Телефон обновляем, только если он был пуст (чтобы не затереть случайно).
-            if extracted_phone:
-                dialogue.candidate.phone_number = extracted_phone
+                # Телефон обновляем, только если он был пуст (чтобы не затереть случайно).
+                if extracted_phone:
+                    candidate_updates['phone_number'] = extracted_phone
 
-            message_id = pm.get('message_id') if isinstance(pm, dict) else f'legacy_{int(time.time())}'
-            user_entries_to_history.append({'message_id': message_id, 'role': 'user', 'content': masked_content})
-            all_masked_content.append(masked_content)
+                message_id = pm.get('message_id') if isinstance(pm, dict) else f'legacy_{int(time.time())}'
+                user_entries_to_history.append({'message_id': message_id, 'role': 'user', 'content': masked_content})
+                all_masked_content.append(masked_content)
         
         combined_masked_message = "\n".join(all_masked_content)
         
-        # Шаг 2: Формирование динамического промпта с названием вакансии и городом
-        final_system_prompt = ""
-        extracted_data_bool = True
-        vacancy_title = dialogue.vacancy.title
-        vacancy_city = dialogue.vacancy.city or "город не указан" # Берем город из связанной вакансии
-        if dialogue.status == 'qualified':
-            context_prefix = (
-                f"[ИНСТРУКЦИЯ] Ты общаешься с кандидатом по вакансии '{vacancy_title}' в городе '{vacancy_city}'. "
-                f"Данный кандидат уже прошел квалификацию и ему назначено собеседование."
-                f"[RULE] Заново проводить квалификацию не нужно. Добавлять что либо в extracted_data запрещено. Просто отвечай на вопросы кандидата (в рамках вакансии), если он задает."
-                f"Веди диалог строго в контексте этой вакансии и города.\n\n"
-            )
-            extracted_data_bool = False
-        else:
-            context_prefix = (
-                f"[ИНСТРУКЦИЯ] Ты общаешься с кандидатом по вакансии '{vacancy_title}' в городе '{vacancy_city}'. "
-                f"Веди диалог строго в контексте этой вакансии и города.\n\n"
+        # Шаг 2: Быстрый путь — если состояние и извлеченные данные однозначно
+        # определяют следующий шаг, отвечаем по правилам без обращения к LLM
+        extracted_data_bool = snapshot.status != 'qualified'
+        llm_response = None
+        used_llm = False
+        llm_seconds = None
+        if extracted_data_bool:
+            with tracing.span('fast_path') as fast_path_span:
+                llm_response = dialogue_rules.try_fast_path(
+                    snapshot.dialogue_state, combined_masked_message,
+                    'full_name' in candidate_updates, 'phone_number' in candidate_updates
+                )
+                if fast_path_span is not None:
+                    fast_path_span.attrs['hit'] = llm_response is not None
+
+        if llm_response is None:
+            # Шаг 3: Формирование динамического промпта с названием вакансии и городом
+            vacancy_title = snapshot.vacancy_title
+            vacancy_city = snapshot.vacancy_city or "город не указан" # Берем город из связанной вакансии
+            if snapshot.status == 'qualified':
+                context_prefix = (
+                    f"[ИНСТРУКЦИЯ] Ты общаешься с кандидатом по вакансии '{vacancy_title}' в городе '{vacancy_city}'. "
+                    f"Данный кандидат уже прошел квалификацию и ему назначено собеседование."
+                    f"[RULE] Заново проводить квалификацию не нужно. Добавлять что либо в extracted_data запрещено. Просто отвечай на вопросы кандидата (в рамках вакансии), если он задает."
+                    f"Веди диалог строго в контексте этой вакансии и города.\n\n"
+                )
+            else:
+                context_prefix = (
+                    f"[ИНСТРУКЦИЯ] Ты общаешься с кандидатом по вакансии '{vacancy_title}' в городе '{vacancy_city}'. "
+                    f"Веди диалог строго в контексте этой вакансии и города.\n\n"
+                )
+            # В промпт попадают только основные правила и релевантные разделы базы знаний
+            kb_query = f"{vacancy_title} {vacancy_city} {combined_masked_message}"
+            final_system_prompt = context_prefix + knowledge_base.get_relevant_prompt(system_prompt, kb_query)
+
+            # Шаг 4: Запрос к LLM
+            used_llm = True
+            llm_started_at = time.monotonic()
+            llm_response = await asyncio.wait_for(
+                llm_handler.get_bot_response(
+                    system_prompt=final_system_prompt,
+                    dialogue_history=snapshot.history,
+                    user_message=combined_masked_message
+                ),
+                _remaining(turn_deadline)
             )
-        final_system_prompt = context_prefix + system_prompt
-        
-        # Шаг 3: Запрос к LLM
-        llm_response = await llm_handler.get_bot_response(
-            system_prompt=final_system_prompt,
-            dialogue_history=dialogue.history or [],
-            user_message=combined_masked_message
-        )
+            llm_seconds = time.monotonic() - llm_started_at
+            dialogue_rules.record_llm_latency(llm_seconds)
         
         bot_response_text = llm_response.get("response_text", "Скоро вернусь к вам с ответом.")
         new_state = llm_response.get("new_state", "error_state")
         extracted_data = llm_response.get("extracted_data")
         
-        # Шаг 4: Обновление статусов и данных кандидата
-        if dialogue.status == 'new':
-            dialogue.status = 'in_progress'
-        
+        # Шаг 5: Данные кандидата из ответа LLM (сохраняются в фазе 3)
         if extracted_data and extracted_data_bool:
-            if extracted_data.get("age"): dialogue.candidate.age = extracted_data["age"]
-            if extracted_data.get("citizenship"): dialogue.candidate.citizenship = extracted_data["citizenship"]
-            if extracted_data.get("city"): dialogue.candidate.city = extracted_data["city"]
-            if extracted_data.get("readiness_to_start"): dialogue.candidate.readiness_to_start = extracted_data["readiness_to_start"]
-
-        # Шаг 5: Обработка финальных состояний диалога
-        if new_state in ['forwarded_to_researcher', 'interview_scheduled_spb'] and dialogue.status != 'qualified':
-            dialogue.status = 'qualified'
-            statistics_manager.update_stats(db, dialogue.vacancy_id, qualified=1)
-            if not db.query(NotificationQueue).filter_by(candidate_id=dialogue.candidate_id, status='pending').first():
-                db.add(NotificationQueue(candidate_id=dialogue.candidate_id, status='pending'))
-            
-            logger.info(f"Кандидат {dialogue.hh_response_id} прошел квалификацию. Перемещаю в папку 'interview'.")
-            await hh_api.move_response_to_folder(recruiter, db, dialogue.hh_response_id, 'interview')
+            for field in ("age", "citizenship", "city", "readiness_to_start"):
+                if extracted_data.get(field): candidate_updates[field] = extracted_data[field]
+
+        # Шаг 6: Обработка финальных состояний диалога
+        is_qualified = new_state in ['forwarded_to_researcher', 'interview_scheduled_spb'] and snapshot.status != 'qualified'
+        is_rejected = new_state == 'qualification_failed'
 
-        elif new_state == 'qualification_failed':
-            dialogue.status = 'rejected'
+        # Сессия для сетевой фазы не открывает соединение, пока не понадобится обновить токен рекрутера
+        io_db = SessionLocal()
+        send_started_at = time.monotonic()
+        try:
+            if is_qualified:
+                logger.info(f"Кандидат {snapshot.hh_response_id} прошел квалификацию. Перемещаю в папку 'interview'.")
+                with tracing.span('move_folder', folder='interview'):
+                    await asyncio.wait_for(
+                        hh_api.move_response_to_folder(recruiter, io_db, snapshot.hh_response_id, 'interview'),
+                        _remaining(turn_deadline)
+                    )
+
+            elif is_rejected:
+                logger.info(f"Кандидат {snapshot.hh_response_id} не прошел квалификацию. Перемещаю в папку 'discard_by_employer'.")
+                with tracing.span('move_folder', folder='discard_by_employer'):
+                    await asyncio.wait_for(
+                        hh_api.move_response_to_folder(recruiter, io_db, snapshot.hh_response_id, 'discard_by_employer'),
+                        _remaining(turn_deadline)
+                    )
             
-            logger.info(f"Кандидат {dialogue.hh_response_id} не прошел квалификацию. Перемещаю в папку 'discard_by_employer'.")
-            await hh_api.move_response_to_folder(recruiter, db, dialogue.hh_response_id, 'discard_by_employer')
-        
-        # Шаг 6: Отправка ответа кандидату
-        delay = random.uniform(1, 3)
-        await asyncio.sleep(delay)
-        
-        await hh_api.send_message(recruiter, db, dialogue.hh_response_id, bot_response_text)
-        
-        # Шаг 7: Сохранение результатов в БД
-        bot_message_entry = {'message_id': f'bot_{time.time()}', 'role': 'assistant', 'content': bot_response_text, 'extracted_data': extracted_data}
-        dialogue.dialogue_state = new_state
-        dialogue.history = (dialogue.history or []) + user_entries_to_history + [bot_message_entry]
-        dialogue.pending_messages = None
-        dialogue.last_updated = func.now() # Используем func.now() для установки времени на стороне БД
+            # Шаг 7: Отправка ответа кандидату
+            delay = random.uniform(1, 3)
+            with tracing.span('reply_delay', seconds=round(delay, 2)):
+                await asyncio.sleep(delay)
+            
+            with tracing.span('send_message'):
+                await hh_api.send_message(recruiter, io_db, snapshot.hh_response_id, bot_response_text)
+            replied_at = _utc_now()
+        finally:
+            io_db.close()
+        send_seconds = time.monotonic() - send_started_at
         
-        db.commit()
-        logger.info(f"Диалог {dialogue.hh_response_id} успешно обработан.")
+        # Шаг 8: Сохранение результатов в БД
+        turn = {
+            'candidate_updates': candidate_updates,
+            'qualified': is_qualified,
+            'rejected': is_rejected,
+            'new_state': new_state,
+            'user_entries': user_entries_to_history,
+            'bot_entry': {'message_id': f'bot_{time.time()}', 'role': 'assistant', 'content': bot_response_text, 'extracted_data': extracted_data},
+            'processed_keys': {_pending_key(pm) for pm in pending_messages},
+            'latency': _build_reply_latency(
+                pending_messages, dispatched_at, turn_started_wall, llm_seconds, send_seconds,
+                replied_at, 'llm' if used_llm else 'fast'
+            ),
+        }
+        if turn['latency']:
+            tracing.set_attribute('reply_latency_ms', turn['latency']['total_ms'])
+        with tracing.span('commit'):
+            committed = _commit_dialogue_turn(snapshot, turn)
+        if committed:
+            logger.info(f"Диалог {snapshot.hh_response_id} успешно обработан.")
+        metrics.DIALOGUE_TURN_SECONDS.observe(
+            time.monotonic() - turn_started_at, recruiter=recruiter_id, path='llm' if used_llm else 'fast'
+        )
+        _turn_timeouts.pop(dialogue_id, None)
 
+    except asyncio.TimeoutError:
+        # Ответ кандидату еще не отправлен, pending_messages не тронуты — ход можно просто повторить
+        metrics.STAGE_OVERRUNS.inc(stage='dialogue_turn')
+        attempts = _turn_timeouts[dialogue_id] = _turn_timeouts.get(dialogue_id, 0) + 1
+        retry_in = min(TURN_RETRY_BASE_SECONDS * 2 ** (attempts - 1), TURN_RETRY_MAX_SECONDS)
+        logger.warning(
+            f"Ход диалога {dialogue_id} не уложился в {DIALOGUE_TURN_TIMEOUT_SECONDS:.0f} с "
+            f"(попытка {attempts}), повтор через {retry_in} с."
+        )
+        _arm_debounce(dialogue_id, recruiter_id, retry_in)
     except Exception as e:
         logger.error(f"Критическая ошибка при обработке диалога с ID {dialogue_id}: {e}", exc_info=True)
-        db.rollback()
+
+def _arm_debounce(dialogue_id: int, recruiter_id: int, delay_seconds: float | None = None):
+    """Взводит (или сбрасывает) таймер debounce для диалога с новыми сообщениями."""
+    if debounce_scheduler is not None:
+        debounce_scheduler.arm(dialogue_id, recruiter_id, delay_seconds)
+
+
+def _dialogue_priority(dialogue_id: int) -> int:
+    """Класс приоритета хода по статусу диалога: первый ответ на отклик — раньше всех, после квалификации — последним."""
+    db = SessionLocal()
+    try:
+        status = db.query(Dialogue.status).filter_by(id=dialogue_id).scalar()
     finally:
         db.close()
+    if status == 'new':
+        return dialogue_executor.PRIORITY_FIRST_REPLY
+    if status == 'qualified':
+        return dialogue_executor.PRIORITY_POST_QUALIFICATION
+    return dialogue_executor.PRIORITY_DIALOGUE
 
-async def process_pending_dialogues(recruiter_id: int, system_prompt: str):
-    """Этап 3: Находит диалоги и запускает их параллельную обработку."""
+
+async def _dispatch_dialogue(dialogue_id: int, recruiter_id: int):
+    """
+    Вызывается планировщиком debounce, когда истек таймер диалога. Ход ждет слота в общем пуле;
+    пока он в очереди, диалог для планировщика «в обработке», и новые сообщения отложат повторный таймер.
+    """
+    dispatched_at = _utc_now()
+
+    async def turn():
+        with tracing.start_trace('dialogue_turn', dialogue_id=dialogue_id, recruiter_id=recruiter_id), \
+                query_scope('dialogue_turn', 'dialogue_turn'):
+            tracing.set_attribute('queue_wait_ms', round((_utc_now() - dispatched_at).total_seconds() * 1000))
+            await _process_single_dialogue(dialogue_id, recruiter_id, knowledge_base.get_system_prompt(), dispatched_at)
+
+    await dialogue_pool.run(recruiter_id, _dialogue_priority(dialogue_id), turn)
+
+
+def _pending_dialogues_query(db: Session):
+    """Диалоги с непустым списком pending_messages (JSON null и [] отсекаются на стороне БД)."""
+    return db.query(Dialogue.id, Dialogue.recruiter_id, Dialogue.last_updated).filter(
+        func.jsonb_typeof(Dialogue.pending_messages) == 'array',
+        Dialogue.pending_messages != literal_column("'[]'::jsonb"),
+    )
+
+
+def _sync_debounce_timers(rows) -> int:
+    """Взводит таймеры для диалогов, о которых планировщик еще не знает. Возвращает их число."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    armed = 0
+    for dialogue_id, recruiter_id, last_updated in rows:
+        if debounce_scheduler.is_tracked(dialogue_id):
+            continue
+        elapsed = (now - last_updated).total_seconds() if last_updated else DEBOUNCE_DELAY_SECONDS
+        _arm_debounce(dialogue_id, recruiter_id, DEBOUNCE_DELAY_SECONDS - elapsed)
+        armed += 1
+    return armed
+
+
+def rebuild_debounce_timers():
+    """После перезапуска восстанавливает таймеры для всех диалогов с необработанными сообщениями."""
     db = SessionLocal()
     try:
-        logger.debug(f"Этап 3: Поиск отложенных диалогов для рекрутера ID {recruiter_id}...")
-        debounce_time = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=DEBOUNCE_DELAY_SECONDS)
-        # ОТЛАДКА: Смотрим ВСЕ диалоги с pending_messages
-        all_pending = [
-                d for d in db.query(Dialogue).filter(
-                    Dialogue.recruiter_id == recruiter_id,
-                    Dialogue.last_updated <= debounce_time
-                ).all()
-                if d.pending_messages and len(d.pending_messages) > 0
-            ]
-        
-        logger.debug(f"[DEBUG] Всего диалогов с pending_messages: {len(all_pending)}")
-        for d in all_pending:
-            logger.info(f"[DEBUG] Диалог {d.hh_response_id}: last_updated={d.last_updated}, debounce_time={debounce_time}, готов={(d.last_updated <= debounce_time)}")
-        
-        dialogues_to_process = [
-                d for d in db.query(Dialogue).filter(
-                    Dialogue.recruiter_id == recruiter_id,
-                    Dialogue.last_updated <= debounce_time
-                ).all()
-                if d.pending_messages and len(d.pending_messages) > 0
-            ]
+        armed = _sync_debounce_timers(_pending_dialogues_query(db).all())
+        logger.info(f"Восстановлено {armed} таймеров debounce из БД.")
+    finally:
+        db.close()
 
-        if not dialogues_to_process:
-            logger.debug(f"Нет диалогов, готовых к ответу, для рекрутера ID {recruiter_id}.")
-            return
 
-        logger.info(f"Найдено {len(dialogues_to_process)} диалогов для параллельной обработки.")
-        tasks = [_process_single_dialogue(d.id, recruiter_id, system_prompt) for d in dialogues_to_process]
-        await asyncio.gather(*tasks)
-        logger.info(f"Пакетная обработка {len(tasks)} диалогов завершена.")
+async def process_pending_dialogues(recruiter_id: int):
+    """
+    Этап 3: Страховка для таймеров debounce. Сами ответы отправляет планировщик
+    в момент истечения таймера; здесь мы лишь взводим таймеры для диалогов,
+    которые получили сообщения в обход воркера (например, после ручной правки в БД).
+    """
+    db = SessionLocal()
+    try:
+        logger.debug(f"Этап 3: Сверка таймеров debounce для рекрутера ID {recruiter_id}...")
+        rows = _pending_dialogues_query(db).filter(Dialogue.recruiter_id == recruiter_id).all()
+        armed = _sync_debounce_timers(rows)
+        if armed:
+            logger.info(f"Взведено {armed} пропущенных таймеров debounce для рекрутера ID {recruiter_id}.")
     finally:
         db.close()
 
 
+def _reminder_still_due(dialogue: Dialogue | None, reminder_level: int) -> bool:
+    """Диалог не изменился с момента выборки: все еще ждет напоминания того же уровня и без новых сообщений."""
+    return bool(
+        dialogue and dialogue.status == 'in_progress'
+        and dialogue.reminder_level == reminder_level and not dialogue.pending_messages
+    )
+
+
+def _save_reminder_result(db: Session, dialogue_id: int, reminder_level: int, next_reminder_level: int,
+                          reminder_message: str | None) -> bool:
+    """
+    Сохраняет результат напоминания: уровень и запись в истории (или перевод в timed_out, если reminder_message нет).
+    Строка перечитывается перед записью; при конфликте версий (в диалог в этот момент пишет прием сообщений
+    или ход диалога) попытка повторяется. Уже отправленное напоминание попадает в историю в любом случае,
+    а уровень повышается, только если кандидат за это время не ответил (ответ сбрасывает уровень в 0).
+    """
+    for attempt in range(1, COMMIT_RETRIES + 1):
+        dialogue = db.get(Dialogue, dialogue_id, populate_existing=True)
+        if not dialogue:
+            db.commit()
+            return False
+        if reminder_message is None:
+            if not _reminder_still_due(dialogue, reminder_level):
+                db.commit()
+                return False
+            dialogue.status = 'timed_out'
+            dialogue.reminder_level = 4
+        else:
+            if dialogue.reminder_level == reminder_level:
+                dialogue.reminder_level = next_reminder_level
+            dialogue.history = (dialogue.history or []) + [{'role': 'assistant', 'content': reminder_message}]
+        try:
+            db.commit()
+            return True
+        except StaleDataError:
+            db.rollback()
+            logger.warning(f"Конфликт версий при сохранении напоминания в диалог {dialogue_id}, попытка {attempt}/{COMMIT_RETRIES}.")
+    logger.error(f"Напоминание уровня {next_reminder_level} для диалога {dialogue_id} не сохранено после {COMMIT_RETRIES} попыток.")
+    return False
+
+
 # ИСПРАВЛЕНИЕ: Функция теперь принимает ID и создает свою сессию
 async def process_reminders(recruiter_id: int):
     """Этап 4: Отправляет напоминания. Работает в собственной сессии БД."""
@@ -423,52 +945,169 @@ async def process_reminders(recruiter_id: int):
         if not recruiter: return
         logger.debug(f"Этап 4: Проверка напоминаний для рекрутера {recruiter.name}...")
         now = datetime.datetime.now(datetime.timezone.utc)
-        stale_dialogues = db.query(Dialogue).filter(
+        stale_dialogues = db.query(Dialogue.id, Dialogue.hh_response_id, Dialogue.reminder_level, Dialogue.last_updated).filter(
             Dialogue.recruiter_id == recruiter.id,
             Dialogue.status == 'in_progress',
             Dialogue.reminder_level < 4
         ).all()
+        db.commit()
         if not stale_dialogues: return
         
-        for dialogue in stale_dialogues:
-            time_since_update = now - (dialogue.last_updated or now)
-            reminder_message, next_reminder_level = None, dialogue.reminder_level
-            if dialogue.reminder_level == 0 and time_since_update > datetime.timedelta(minutes=30):
+        for dialogue_id, hh_response_id, reminder_level, last_updated in stale_dialogues:
+            time_since_update = now - (last_updated or now)
+            reminder_message, next_reminder_level = None, reminder_level
+            if reminder_level == 0 and time_since_update > datetime.timedelta(minutes=30):
                 reminder_message, next_reminder_level = "Возвращаюсь к вам по поводу нашего диалога. У вас будет возможность продолжить?", 1
-            elif dialogue.reminder_level == 1 and time_since_update > datetime.timedelta(hours=2):
+            elif reminder_level == 1 and time_since_update > datetime.timedelta(hours=2):
                 reminder_message, next_reminder_level = "Хотела бы уточнить, актуален ли для вас наш диалог?", 2
-            elif dialogue.reminder_level == 2 and time_since_update > datetime.timedelta(hours=24):
+            elif reminder_level == 2 and time_since_update > datetime.timedelta(hours=24):
                 reminder_message, next_reminder_level = "Здравствуйте! Если вам все еще интересно, пожалуйста, дайте знать.", 3
-            elif dialogue.reminder_level == 3 and time_since_update > datetime.timedelta(hours=48):
-                dialogue.status = 'timed_out'; dialogue.reminder_level = 4
-                db.commit(); continue
-            if reminder_message:
-                logger.info(f"Отправка напоминания уровня {next_reminder_level} для диалога {dialogue.hh_response_id}.")
-                await hh_api.send_message(recruiter, db, dialogue.hh_response_id, reminder_message)
-                dialogue.reminder_level = next_reminder_level
-                dialogue.history = (dialogue.history or []) + [{'role': 'assistant', 'content': reminder_message}]
+            elif reminder_level == 3 and time_since_update > datetime.timedelta(hours=48):
+                _save_reminder_result(db, dialogue_id, reminder_level, 4, None)
+                continue
+            if not reminder_message:
+                continue
+            try:
+                # Перед отправкой убеждаемся, что кандидат не ответил, пока шла выборка
+                if not _reminder_still_due(db.get(Dialogue, dialogue_id, populate_existing=True), reminder_level):
+                    db.commit()
+                    continue
+                # Закрываем транзакцию на время сетевого запроса, чтобы не держать соединение из пула
                 db.commit()
+                logger.info(f"Отправка напоминания уровня {next_reminder_level} для диалога {hh_response_id}.")
+                await hh_api.send_message(recruiter, db, hh_response_id, reminder_message)
+                _save_reminder_result(db, dialogue_id, reminder_level, next_reminder_level, reminder_message)
+            except Exception as e:
+                # Ошибка одного диалога не должна останавливать напоминания остальным
+                db.rollback()
+                logger.error(f"Ошибка при отправке напоминания для диалога {hh_response_id}: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+async def _timed_stage(stage: str, recruiter_id: int, coro, default=None):
+    """
+    Выполняет этап цикла в пределах его бюджета STAGE_TIMEOUTS и записывает длительность в метрики.
+    При превышении этап отменяется, превышение считается в метрике, возвращается default.
+    """
+    with metrics.STAGE_SECONDS.time(stage=stage, recruiter=recruiter_id), query_scope('stage', stage):
+        try:
+            return await asyncio.wait_for(coro, STAGE_TIMEOUTS[stage])
+        except asyncio.TimeoutError:
+            metrics.STAGE_OVERRUNS.inc(stage=stage)
+            logger.warning(
+                f"Этап '{stage}' для рекрутера ID {recruiter_id} превысил бюджет {STAGE_TIMEOUTS[stage]} с "
+                f"и был прерван, повтор в следующем цикле."
+            )
+            return default
+
+
+async def _process_hh_event(recruiter_id: int, negotiation_id: str):
+    """Отклик из события webhook: существующий диалог получает новые сообщения, новый отклик — проходит прием."""
+    db = SessionLocal()
+    try:
+        recruiter = db.get(TrackedRecruiter, recruiter_id)
+        resp = await hh_api.get_negotiation(recruiter, db, negotiation_id)
+        if not resp:
+            return
+        if db.query(Dialogue.id).filter_by(hh_response_id=negotiation_id).first():
+            await _refresh_dialogue_messages(db, recruiter, recruiter_id, resp)
+            return
+
+        if resp.state != 'response':
+            logger.debug(f"Событие по отклику {negotiation_id} вне 'Неразобранных' и без диалога. Пропускаем.")
+            return
+        hh_vacancy_id = resp.vacancy_id
+        if not db.query(Vacancy.id).filter_by(hh_vacancy_id=hh_vacancy_id).first():
+            # Вакансия еще не синхронизирована: полное сканирование в следующем цикле заберет и отклик
+            _last_folder_scan.pop(recruiter_id, None)
+            logger.info(f"Вакансия {hh_vacancy_id} отклика {negotiation_id} еще не в БД, отклик заберет сканирование папок.")
+            return
+        await _intake_response(db, recruiter, recruiter_id, resp)
+    except Exception as e:
+        logger.error(f"Ошибка обработки события по отклику {negotiation_id}: {e}", exc_info=True)
+        db.rollback()
+    finally:
+        db.close()
+
+
+async def handle_hh_event(hh_user_id: str, negotiation_id: str, action: str):
+    """Обработчик очереди событий webhook hh.ru: отклик сразу идет в прием или обновление, не дожидаясь опроса."""
+    db = SessionLocal()
+    try:
+        recruiter_id = db.query(TrackedRecruiter.id).filter_by(recruiter_id=hh_user_id).scalar()
+    finally:
+        db.close()
+    if recruiter_id is None:
+        logger.warning(f"Событие {action} по отклику {negotiation_id} для неизвестного рекрутера hh.ru {hh_user_id}.")
+        return
+    await _timed_stage('hh_webhook', recruiter_id, _process_hh_event(recruiter_id, negotiation_id))
+
+
+async def _ensure_hh_subscriptions():
+    """Подписывает всех рекрутеров на события hh.ru (если задан публичный адрес приемника)."""
+    db = SessionLocal()
+    try:
+        for recruiter in db.query(TrackedRecruiter).all():
+            try:
+                await hh_api.ensure_webhook_subscription(
+                    recruiter, db, hh_webhooks.subscription_url(), hh_webhooks.HH_WEBHOOK_ACTIONS
+                )
+            except Exception as e:
+                logger.error(f"Не удалось подписать рекрутера {recruiter.name} на события hh.ru: {e}")
+    finally:
+        db.close()
+
+
+def _folder_scan_due(recruiter_id: int) -> bool:
+    """Без webhook папки сканируются каждый цикл, с ним — раз в HH_POLL_FALLBACK_SECONDS."""
+    if not hh_webhooks.enabled():
+        return True
+    last_scan = _last_folder_scan.get(recruiter_id)
+    return last_scan is None or time.monotonic() - last_scan >= HH_POLL_FALLBACK_SECONDS
+
+
+def _refresh_dialogue_state_metrics():
+    """Пересчитывает количество диалогов по статусу и состоянию не чаще раза в DIALOGUE_METRICS_INTERVAL_SECONDS."""
+    global _dialogue_metrics_refreshed_at
+    if time.monotonic() - _dialogue_metrics_refreshed_at < DIALOGUE_METRICS_INTERVAL_SECONDS:
+        return
+    _dialogue_metrics_refreshed_at = time.monotonic()
+    db = SessionLocal()
+    try:
+        rows = db.query(Dialogue.status, Dialogue.dialogue_state, func.count(Dialogue.id)).group_by(
+            Dialogue.status, Dialogue.dialogue_state
+        ).all()
+        metrics.DIALOGUES_BY_STATE.replace_all({(status, state or ''): count for status, state, count in rows})
     finally:
         db.close()
 
 
 # --- ФИНАЛЬНАЯ, ИСПРАВЛЕННАЯ ВЕРСИЯ ---
-async def handle_single_recruiter(rec: TrackedRecruiter, system_prompt: str):
+async def handle_single_recruiter(rec: TrackedRecruiter):
     """Обрабатывает полный цикл для одного рекрутера."""
     db_session = SessionLocal()
     try:
         logger.debug(f"--- Начинаю работу с рекрутером: {rec.name} (ID: {rec.id}) ---")
         
-        active_vacancies = await get_all_active_vacancies_for_recruiter(rec, db_session)
+        # С webhook hh.ru новые отклики и сообщения приходят событиями, опрос папок — только страховка
+        scan_due = _folder_scan_due(rec.id)
+        if scan_due:
+            active_vacancies = await _timed_stage('vacancy_sync', rec.id, get_all_active_vacancies_for_recruiter(rec, db_session))
         
-        if active_vacancies:
+        if not scan_due:
+            logger.debug(f"Сканирование папок рекрутера {rec.name} пропущено: отклики приходят событиями webhook.")
+        elif active_vacancies is None:
+            logger.warning(f"Синхронизация вакансий рекрутера {rec.name} прервана, сканирование откликов пропущено.")
+        elif active_vacancies:
             vacancy_ids = [v['id'] for v in active_vacancies]
             
             scan_tasks = [
-                process_new_responses(rec.id, vacancy_ids),
-                process_ongoing_responses(rec.id, vacancy_ids)
+                _timed_stage('new_responses', rec.id, process_new_responses(rec.id, vacancy_ids)),
+                _timed_stage('ongoing', rec.id, process_ongoing_responses(rec.id, vacancy_ids))
             ]
             await asyncio.gather(*scan_tasks)
+            _last_folder_scan[rec.id] = time.monotonic()
             
             # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Полностью закрываем и пересоздаём сессию
             db_session.close()
@@ -477,9 +1116,10 @@ async def handle_single_recruiter(rec: TrackedRecruiter, system_prompt: str):
             db_session.expire_all()
         else:
             logger.warning(f"Для рекрутера {rec.name} не найдено активных вакансий.")
+            _last_folder_scan[rec.id] = time.monotonic()
 
-        await process_pending_dialogues(rec.id, system_prompt)
-        await process_reminders(rec.id)
+        await _timed_stage('pending_dialogues', rec.id, process_pending_dialogues(rec.id))
+        await _timed_stage('reminders', rec.id, process_reminders(rec.id))
         
     except Exception as e:
         logger.error(f"Ошибка при обработке рекрутера {rec.name}: {e}", exc_info=True)
@@ -489,9 +1129,9 @@ async def handle_single_recruiter(rec: TrackedRecruiter, system_prompt: str):
 
 async def run_worker_cycle():
     """Главный цикл, который запускает независимые асинхронные задачи."""
+    cycle_started_at = time.monotonic()
     try:
         logger.debug("Начало нового цикла воркера.")
-        system_prompt = knowledge_base.get_system_prompt()
         
         db = SessionLocal()
         try:
@@ -504,9 +1144,18 @@ async def run_worker_cycle():
             return
         
         # Теперь мы создаем список задач, вызывая нашу внешнюю функцию
-        tasks = [handle_single_recruiter(recruiter, system_prompt) for recruiter in all_recruiters]
+        tasks = [handle_single_recruiter(recruiter) for recruiter in all_recruiters]
         
         await asyncio.gather(*tasks)
+        metrics.CYCLE_SECONDS.observe(time.monotonic() - cycle_started_at)
+        _refresh_dialogue_state_metrics()
+
+        kb_stats = kb_index.get_stats()
+        if kb_stats['requests']:
+            logger.debug(
+                f"База знаний: сэкономлено ~{kb_stats['saved_tokens']} токенов промпта "
+                f"({kb_stats['saved_ratio']:.0%}) за {kb_stats['requests']} запросов."
+            )
 
     except Exception as e:
         logger.critical("Критическая ошибка в главном цикле воркера!", exc_info=True)
@@ -515,8 +1164,13 @@ async def run_worker_cycle():
 
 
 
-async def main():
-    """Главная асинхронная функция."""
+async def main(profile_cycles: int = 0, profile_seconds: float = 0, profile_dir: str = PROFILE_DIR):
+    """
+    Главная асинхронная функция.
+    Если задан profile_cycles или profile_seconds, воркер профилирует указанное число циклов
+    (или окно времени), сохраняет отчет и завершается.
+    """
+    global debounce_scheduler, dialogue_pool, shutdown_requested
     from hr_bot.services.llm_handler import cleanup
     
     # Регистрируем обработчики сигналов
@@ -524,12 +1178,68 @@ async def main():
     signal.signal(signal.SIGTERM, signal_handler)
     
     logger.info("HH-Worker запускается...")
+    install_task_age_tracking(asyncio.get_running_loop())
+    # Клиенты создаются явно здесь, а не при импорте модулей
+    init_engine()
+    llm_handler.init_client()
+
+    # База знаний: снимок с диска (или первая загрузка) в отдельном потоке,
+    # дальнейшие обновления — в фоне, не блокируя цикл воркера
+    await asyncio.to_thread(knowledge_base.warm_up)
+    kb_refresh_task = asyncio.create_task(knowledge_base.refresh_loop())
+    # Завершенные диалоги уходят в архив, чтобы рабочая таблица dialogues оставалась маленькой
+    archive_task = asyncio.create_task(dialogue_archive.archive_loop())
+
+    # Ходы диалогов из всех таймеров выполняются в общем ограниченном пуле
+    dialogue_pool = dialogue_executor.DialogueExecutor(
+        dialogue_executor.DIALOGUE_CONCURRENCY,
+        dialogue_executor.parse_weights(dialogue_executor.DIALOGUE_RECRUITER_WEIGHTS),
+    )
+    # Таймеры debounce: восстанавливаем из БД и запускаем планировщик
+    debounce_scheduler = DebounceScheduler(_dispatch_dialogue, DEBOUNCE_DELAY_SECONDS)
+    rebuild_debounce_timers()
+    debounce_task = asyncio.create_task(debounce_scheduler.run())
+
+    webhook_server, webhook_consumer_task, subscriptions_task = None, None, None
+    if hh_webhooks.enabled():
+        webhook_server = await start_http_server(hh_webhooks.ROUTES, hh_webhooks.HH_WEBHOOK_HOST, hh_webhooks.HH_WEBHOOK_PORT)
+        webhook_consumer_task = asyncio.create_task(hh_webhooks.run_consumer(handle_hh_event))
+        if hh_webhooks.HH_WEBHOOK_PUBLIC_URL:
+            subscriptions_task = asyncio.create_task(_ensure_hh_subscriptions())
+        logger.info(f"Прием событий hh.ru включен, полное сканирование папок раз в {HH_POLL_FALLBACK_SECONDS:.0f} с.")
+
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = await start_http_server(
+            {'/metrics': metrics.metrics_handler, **worker_health.ROUTES}, METRICS_HOST, METRICS_PORT
+        )
+
+    # Профилирование: kill -USR1 <pid> включает и выключает его в работающем процессе
+    profiler = CycleProfiler(profile_dir)
+    if hasattr(signal, 'SIGUSR1'):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiler.toggle)
+    profile_mode = bool(profile_cycles or profile_seconds)
+    if profile_mode:
+        logger.info(f"Режим профилирования: циклов {profile_cycles or '-'}, окно {profile_seconds or '-'} с.")
+        profiler.start()
+    profile_started_at = time.monotonic()
+    cycles_done = 0
     
     try:
         while not shutdown_requested:
             try:
                 # ИСПРАВЛЕНИЕ: Убрали asyncio.run(), просто вызываем await
                 await run_worker_cycle()
+                worker_health.mark_cycle_finished()
+                cycles_done += 1
+
+                if profile_mode and (
+                    (profile_cycles and cycles_done >= profile_cycles)
+                    or (profile_seconds and time.monotonic() - profile_started_at >= profile_seconds)
+                ):
+                    profiler.stop()
+                    shutdown_requested = True
+                    break
                 
                 logger.debug(f"Пауза {CYCLE_PAUSE_SECONDS} секунд перед следующим циклом.")
                 
@@ -545,16 +1255,43 @@ async def main():
                     await asyncio.sleep(120)
     finally:
         logger.info("Закрываем соединения...")
+        profiler.stop()
+        kb_refresh_task.cancel()
+        archive_task.cancel()
+        debounce_task.cancel()
+        await debounce_scheduler.shutdown()
+        if metrics_server:
+            metrics_server.close()
+        if webhook_server:
+            webhook_server.close()
+        if webhook_consumer_task:
+            webhook_consumer_task.cancel()
+        if subscriptions_task:
+            subscriptions_task.cancel()
         await cleanup()
         logger.info("HH-Worker полностью остановлен.")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HH-Worker: обработка откликов hh.ru.")
+    parser.add_argument('--profile', action='store_true',
+                        help="Профилировать воркер (cProfile, collapsed stacks, задержка event loop) и завершиться")
+    parser.add_argument('--profile-cycles', type=int, default=5, help="Сколько циклов профилировать (по умолчанию 5)")
+    parser.add_argument('--profile-seconds', type=float, default=0,
+                        help="Профилировать фиксированное окно времени вместо числа циклов")
+    parser.add_argument('--profile-dir', default=PROFILE_DIR, help="Каталог для результатов профилирования")
+    args = parser.parse_args()
+
     setup_logging(log_filename="hh_worker.log")
     load_dotenv()
+
+    profile_cycles, profile_seconds = 0, 0
+    if args.profile:
+        profile_seconds = args.profile_seconds
+        profile_cycles = 0 if profile_seconds else args.profile_cycles
     
     # ИСПРАВЛЕНИЕ: Запускаем main() ОДИН раз через asyncio.run()
     try:
-        asyncio.run(main())
+        asyncio.run(main(profile_cycles, profile_seconds, args.profile_dir))
     except (KeyboardInterrupt, SystemExit):
         logger.info("Приложение принудительно завершено.")
\ No newline at end of file
@@ -8,13 +8,26 @@ from aiogram.client.default import DefaultBotProperties
 from dotenv import load_dotenv
 
 from hr_bot.utils.logger_config import setup_logging
-from hr_bot.db.models import SessionLocal, Candidate, NotificationQueue
-from hr_bot.tg_bot.middlewares import DbSessionMiddleware
+from hr_bot.db.models import SessionLocal, init_engine, Candidate, NotificationQueue
+from hr_bot.tg_bot.middlewares import DbSessionMiddleware, QueryStatsMiddleware, QueryScopeNameMiddleware
 from hr_bot.tg_bot.handlers import main_router
 from hr_bot.utils.formatters import mask_fio
 
+load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Режим получения обновлений: 'polling' (по умолчанию) или 'webhook'
+TG_BOT_MODE = os.getenv('TG_BOT_MODE', 'polling').lower()
+# Публичный HTTPS-адрес, на который Telegram шлет обновления (без пути), например https://bot.example.com
+TG_WEBHOOK_BASE_URL = os.getenv('TG_WEBHOOK_BASE_URL', '')
+TG_WEBHOOK_PATH = os.getenv('TG_WEBHOOK_PATH', '/tg/webhook')
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token: запросы без него отклоняются
+TG_WEBHOOK_SECRET = os.getenv('TG_WEBHOOK_SECRET', '')
+TG_WEBHOOK_HOST = os.getenv('TG_WEBHOOK_HOST', '127.0.0.1')
+TG_WEBHOOK_PORT = int(os.getenv('TG_WEBHOOK_PORT', '8081'))
+# 1 — отвечать Telegram сразу и обрабатывать обновление в фоне; 0 — отвечать после обработки
+TG_WEBHOOK_BACKGROUND = os.getenv('TG_WEBHOOK_BACKGROUND', '1') == '1'
+
 
 def escape_markdown(text: str) -> str:
     """
@@ -114,10 +127,68 @@ async def check_and_send_notifications(bot: Bot):
             db_session.close()
 
 
+async def on_startup(bot: Bot, dispatcher: Dispatcher):
+    """Общий для обоих режимов запуск фоновой рассылки уведомлений."""
+    dispatcher['notification_task'] = asyncio.create_task(check_and_send_notifications(bot), name='notifications')
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    """Останавливает рассылку уведомлений и дожидается ее завершения."""
+    task = dispatcher.workflow_data.pop('notification_task', None)
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    logger.info("Фоновый обработчик уведомлений остановлен.")
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """
+    Webhook-режим: aiohttp-сервер принимает обновления от Telegram.
+    Запросы без правильного секретного токена отклоняются с 401.
+    """
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+    if not TG_WEBHOOK_SECRET:
+        raise RuntimeError("Для webhook-режима задайте TG_WEBHOOK_SECRET")
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=TG_WEBHOOK_SECRET, handle_in_background=TG_WEBHOOK_BACKGROUND,
+    ).register(app, path=TG_WEBHOOK_PATH)
+    # Хуки startup/shutdown диспетчера вызываются вместе с запуском и остановкой приложения
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, TG_WEBHOOK_HOST, TG_WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook-сервер слушает {TG_WEBHOOK_HOST}:{TG_WEBHOOK_PORT}{TG_WEBHOOK_PATH}")
+
+    try:
+        if TG_WEBHOOK_BASE_URL:
+            await bot.set_webhook(
+                f"{TG_WEBHOOK_BASE_URL.rstrip('/')}{TG_WEBHOOK_PATH}",
+                secret_token=TG_WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            logger.info(f"Webhook зарегистрирован в Telegram: {TG_WEBHOOK_BASE_URL.rstrip('/')}{TG_WEBHOOK_PATH}")
+        else:
+            # Локальный запуск (нагрузочные тесты): Telegram о сервере не знает
+            logger.warning("TG_WEBHOOK_BASE_URL не задан: webhook в Telegram не регистрируется")
+        await asyncio.Event().wait()
+    finally:
+        # Webhook в Telegram не снимаем: обновления за время перезапуска дождутся нового процесса
+        await runner.cleanup()
+
+
 async def main():
     """Главная функция запуска бота."""
     setup_logging(log_filename="telegram_bot.log")
-    load_dotenv()
+    init_engine()
     
     bot = Bot(
         token=os.getenv("TELEGRAM_BOT_TOKEN"),
@@ -125,15 +196,22 @@ async def main():
     )
     dp = Dispatcher()
     dp.update.middleware(DbSessionMiddleware(session_pool=SessionLocal))
+    # Учет SQL-запросов: область открывается до фильтров (внешний middleware), а имя обработчика
+    # ей дает внутренний middleware, когда обработчик уже выбран
+    dp.message.outer_middleware(QueryStatsMiddleware())
+    dp.callback_query.outer_middleware(QueryStatsMiddleware())
+    dp.message.middleware(QueryScopeNameMiddleware())
+    dp.callback_query.middleware(QueryScopeNameMiddleware())
     dp.include_router(main_router)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
     
-    logger.info("Управляющий Telegram-бот запускается...")
-    notification_task = asyncio.create_task(check_and_send_notifications(bot))
-    
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
-    
-    notification_task.cancel()
+    logger.info(f"Управляющий Telegram-бот запускается в режиме {TG_BOT_MODE}...")
+    if TG_BOT_MODE == 'webhook':
+        await run_webhook(bot, dp)
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
 
 if __name__ == '__main__':
     try:
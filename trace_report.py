@@ -0,0 +1,80 @@
+"""
+Отчет по трассам ходов диалога: самые медленные ходы и их критический путь.
+
+Пример:
+    python trace_report.py --top 10
+    python trace_report.py --file logs/traces.jsonl --name dialogue_turn --top 5
+"""
+import json
+import argparse
+from collections import defaultdict
+
+from hr_bot.utils.tracing import TRACE_FILE
+
+
+def load_traces(path: str) -> dict:
+    """Читает JSONL со спанами и группирует их по trace_id."""
+    traces = defaultdict(list)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                span = json.loads(line)
+                span['end'] = span['start'] + span['duration_ms'] / 1000
+                traces[span['trace_id']].append(span)
+    return traces
+
+
+def critical_path(span: dict, children: dict) -> list:
+    """
+    Критический путь: идем от конца спана назад и берем цепочку дочерних спанов,
+    каждый из которых закончился не позже начала следующего за ним в цепочке.
+    """
+    path = [span]
+    chain, cursor = [], span['end']
+    for child in sorted(children.get(span['span_id'], []), key=lambda s: s['end'], reverse=True):
+        if child['end'] <= cursor + 1e-6:
+            chain.append(child)
+            cursor = child['start']
+    for child in reversed(chain):
+        path.extend(critical_path(child, children))
+    return path
+
+
+def print_report(traces: dict, root_name: str, top: int):
+    roots = []
+    for spans in traces.values():
+        root = next((s for s in spans if s['parent_id'] is None), None)
+        if root and root['name'] == root_name:
+            roots.append((root, spans))
+    roots.sort(key=lambda item: item[0]['duration_ms'], reverse=True)
+
+    print(f"Всего трасс '{root_name}': {len(roots)}. Самые медленные {min(top, len(roots))}:\n")
+    for root, spans in roots[:top]:
+        children = defaultdict(list)
+        for s in spans:
+            if s['parent_id']:
+                children[s['parent_id']].append(s)
+
+        attrs = root.get('attrs', {})
+        print(f"{root['duration_ms']:>9.1f} ms  hh_response_id={attrs.get('hh_response_id', '?')}  trace={root['trace_id']}")
+        for s in critical_path(root, children)[1:]:
+            depth = 0
+            parent = s['parent_id']
+            by_id = {x['span_id']: x for x in spans}
+            while parent and parent != root['span_id']:
+                depth += 1
+                parent = by_id[parent]['parent_id']
+            extra = ', '.join(f"{k}={v}" for k, v in s.get('attrs', {}).items())
+            print(f"    {'  ' * depth}{s['name']:<24} {s['duration_ms']:>9.1f} ms  {extra}")
+        print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Самые медленные ходы диалога и их критический путь.")
+    parser.add_argument('--file', default=TRACE_FILE, help="JSONL-файл со спанами")
+    parser.add_argument('--name', default='dialogue_turn', help="Имя корневого спана")
+    parser.add_argument('--top', type=int, default=10, help="Сколько самых медленных трасс показать")
+    args = parser.parse_args()
+
+    print_report(load_traces(args.file), args.name, args.top)